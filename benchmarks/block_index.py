@@ -0,0 +1,75 @@
+"""Block lookup benchmark for `Signal.get_data_in_range`.
+
+Extracts the segments of a synthetic recording split into many index blocks
+and times the overlap lookup against a linear scan over all loaded blocks
+(the previous implementation).
+
+Usage:
+    python3 -m benchmarks.block_index
+    python3 -m benchmarks.block_index --blocks 5000 --segments 20000
+"""
+import argparse
+import tempfile
+import time
+
+from lib.loader import SingleFileExtractor
+from benchmarks.synthetic import write_pair
+
+
+WINDOW_SIZE_SEC = 10
+
+
+def linear_scan(signal, segments):
+    """Looks up the data of every segment by scanning all loaded blocks."""
+    blocks = [(signal._start_times[idx], signal._end_times[idx], signal._intervals[idx], block)
+              for idx, block in signal._data.items()]
+    for segment in segments:
+        [block[max(0, int((segment.start_time - start) / interval)):
+               min(block.shape[0], int((segment.end_time - start) / interval))]
+         for start, end, interval, block in blocks
+         if start <= segment.end_time and end >= segment.start_time]
+
+
+def main(args):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # anomalies take a tenth of the windows, normal segments fill the rest
+        duration_s = args.segments * WINDOW_SIZE_SEC
+        began = time.perf_counter()
+        hdf5_path = write_pair(tmp_dir, "TBI_bench", duration_s, n_artefacts=args.segments // 10,
+                               signals=("abp",), frequency=args.frequency, n_blocks=args.blocks, gap_s=1,
+                               compression=None)
+        print(f"Generated {args.blocks} blocks, {duration_s / 3600:.1f} h in {time.perf_counter() - began:.1f} s")
+
+        extractor = SingleFileExtractor(hdf5_path, "abp")
+        began = time.perf_counter()
+        segments = extractor.get_normal() + extractor.get_anomalies()
+        extraction_s = time.perf_counter() - began
+
+        signal = extractor._signal
+        began = time.perf_counter()
+        for segment in segments:
+            signal.get_data_in_range(segment)
+        indexed_s = time.perf_counter() - began
+
+        began = time.perf_counter()
+        linear_scan(signal, segments)
+        linear_s = time.perf_counter() - began
+
+    print(f"Segments: {len(segments)}  loaded blocks: {len(signal._data)}")
+    print(f"Full extraction:              {extraction_s:8.3f} s")
+    print(f"Range lookups, sorted index:  {indexed_s:8.3f} s")
+    print(f"Range lookups, linear scan:   {linear_s:8.3f} s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+            description="""
+            Benchmark of the block lookup used by Signal.get_data_in_range on a synthetic recording.
+            """)
+    parser.add_argument('--blocks', type=int, help='Number of index blocks', default=5000)
+    parser.add_argument('--segments', type=int, help='Approximate number of 10 s segments', default=20000)
+    parser.add_argument('--frequency', type=float, help='Sampling frequency in Hz', default=25.0)
+
+    args = parser.parse_args()
+
+    main(args)
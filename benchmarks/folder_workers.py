@@ -0,0 +1,68 @@
+"""Worker scaling benchmark for `FolderExtractor`.
+
+Extracts a folder of synthetic recordings with an increasing number of worker
+processes and reports the throughput in files per second.
+
+Usage:
+    python3 -m benchmarks.folder_workers
+    python3 -m benchmarks.folder_workers --files 32 --hours 2 -w 1 2 4 8
+    python3 -m benchmarks.folder_workers -f ./data -m icp -w 1 4
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from lib.loader import FolderExtractor
+from benchmarks.synthetic import write_pair
+
+
+def count_files(folder):
+    """Returns the number of HDF5 files in `folder` (and subfolders)."""
+    return sum(1 for _, _, files in os.walk(folder) for f in files if f.endswith(".hdf5"))
+
+
+def run(folder, mode, worker_counts):
+    n_files = count_files(folder)
+    print(f"{'workers':>8} {'time (s)':>9} {'files/s':>8} {'speedup':>8} {'segments':>9}")
+    serial_s = None
+    for workers in worker_counts:
+        began = time.perf_counter()
+        anomalies, normal = FolderExtractor(folder, mode, workers=workers).extract_all()
+        elapsed = time.perf_counter() - began
+        serial_s = serial_s or elapsed
+        print(f"{workers:>8} {elapsed:>9.2f} {n_files / elapsed:>8.2f} {serial_s / elapsed:>8.2f} "
+              f"{len(anomalies) + len(normal):>9}")
+
+
+def main(args):
+    if args.f:
+        run(args.f, args.m, args.w)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        began = time.perf_counter()
+        for i in range(args.files):
+            write_pair(tmp_dir, f"TBI_{i:03d}", args.hours * 3600, n_artefacts=args.artefacts,
+                       signals=(args.m,), seed=i)
+        print(f"Generated {args.files} files of {args.hours} h in {time.perf_counter() - began:.1f} s "
+              f"({os.cpu_count()} CPUs)")
+        run(tmp_dir, args.m, args.w)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+            description="""
+            Benchmark of FolderExtractor.extract_all throughput per number of worker processes.
+            Without -f, a folder of synthetic recordings is generated.
+            """)
+    parser.add_argument('-f', type=str, help='Path to a folder with HDF5 and ARTF files (default: generate synthetic files)')
+    parser.add_argument('-m', type=str, help='Mode, "abp" or "icp"', default='abp')
+    parser.add_argument('-w', type=int, nargs='+', help='Worker counts', default=[1, 2, 4, 8])
+    parser.add_argument('--files', type=int, help='Number of synthetic files', default=16)
+    parser.add_argument('--hours', type=float, help='Duration of each synthetic file', default=1)
+    parser.add_argument('--artefacts', type=int, help='Number of artefacts per synthetic file', default=50)
+
+    args = parser.parse_args()
+
+    main(args)
@@ -0,0 +1,113 @@
+"""Page read benchmark for `SignalClass.get_data_stream`.
+
+Measures read time and peak memory for several page lengths on recordings of
+several durations. With range-limited reads both should grow with the page
+length and stay flat with the file length.
+
+Usage:
+    python3 -m benchmarks.page_reads
+    python3 -m benchmarks.page_reads -f ./data/TBI_003.hdf5 -s icp -p 10 60 600
+"""
+import argparse
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import h5py
+import numpy as np
+
+from lib.hdf5_reader_module import SignalClass, MICROSEC_IN_SEC
+from benchmarks.synthetic import write_recording
+
+
+def peak_rss_mb():
+    """Returns the peak resident set size of the current process in MB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes on Linux
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+
+def measure_pages(hdf5_path, signal, page_len_s, repeats):
+    """Reads `repeats` random pages of `page_len_s` seconds and returns timing and memory figures."""
+    rng = np.random.default_rng(0)
+    baseline_rss = peak_rss_mb()
+    with h5py.File(hdf5_path, "r") as f:
+        wave_data = SignalClass(f, signal)
+        start = wave_data.get_all_data_start_time()
+        end = wave_data.get_all_data_end_time()
+        page_len = page_len_s * MICROSEC_IN_SEC
+        starts = rng.integers(start, max(start + 1, end - page_len), repeats)
+
+        tracemalloc.start()
+        began = time.perf_counter()
+        for page_start in starts:
+            wave_data.get_data_stream(int(page_start), page_len)
+        elapsed = time.perf_counter() - began
+        _, traced_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    return {
+        "page_len_s": page_len_s,
+        "mean_read_ms": elapsed / repeats * 1000,
+        "traced_peak_mb": traced_peak / 1024 / 1024,
+        "peak_rss_growth_mb": peak_rss_mb() - baseline_rss,
+    }
+
+
+def _measure_in_child(queue, *args):
+    queue.put(measure_pages(*args))
+
+
+def measure_isolated(*args):
+    """Runs `measure_pages` in a fresh process so that the peak RSS belongs to that measurement only."""
+    ctx = multiprocessing.get_context("spawn")
+    queue = ctx.Queue()
+    process = ctx.Process(target=_measure_in_child, args=(queue, *args))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def run(files, signal, page_lengths, repeats):
+    print(f"{'file':<24} {'page (s)':>9} {'read (ms)':>10} {'traced (MB)':>12} {'RSS growth (MB)':>16}")
+    for label, path in files:
+        for page_len_s in page_lengths:
+            result = measure_isolated(path, signal, page_len_s, repeats)
+            print(f"{label:<24} {page_len_s:>9} {result['mean_read_ms']:>10.2f} "
+                  f"{result['traced_peak_mb']:>12.2f} {result['peak_rss_growth_mb']:>16.2f}")
+
+
+def main(args):
+    if args.f:
+        run([(os.path.basename(args.f), args.f)], args.s, args.p, args.r)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        files = []
+        for hours in args.hours:
+            path = os.path.join(tmp_dir, f"synthetic_{hours}h.hdf5")
+            write_recording(path, hours * 3600, signals=(args.s,))
+            files.append((f"synthetic {hours} h", path))
+        run(files, args.s, args.p, args.r)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+            description="""
+            Benchmark of SignalClass.get_data_stream page reads.
+            Without -f, synthetic recordings of the given durations are generated.
+            """)
+    parser.add_argument('-f', type=str, help='Path to HDF5 file (default: generate synthetic files)')
+    parser.add_argument('-s', type=str, help='Signal to read', default='icp')
+    parser.add_argument('-p', type=int, nargs='+', help='Page lengths in seconds', default=[10, 60, 600, 3600])
+    parser.add_argument('-r', type=int, help='Number of pages read per page length', default=20)
+    parser.add_argument('--hours', type=int, nargs='+', help='Durations of the synthetic files', default=[6, 24])
+
+    args = parser.parse_args()
+
+    main(args)
@@ -0,0 +1,295 @@
+"""Benchmark suite with machine-readable results.
+
+Generates a folder of synthetic recordings (see `benchmarks.synthetic`) and
+times the main read paths of `lib` and the command line tools on it. Every
+case runs in a fresh process so that its peak memory is its own. The results
+are written as JSON: wall time, throughput and peak resident memory per case.
+
+Usage:
+    python3 -m benchmarks.suite
+    python3 -m benchmarks.suite -o results.json --files 4 --hours 48 --artefacts 5000
+    python3 -m benchmarks.suite --cases get_data_stream artf_reader -r 5
+    python3 -m benchmarks.suite -d ./synthetic   # reuse recordings written by benchmarks.synthetic
+"""
+import argparse
+import datetime
+import glob
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import h5py
+import numpy as np
+
+from lib.exporters import ARTFExporter
+from lib.hdf5_reader_module import CacheSignalClass, SignalClass, MICROSEC_IN_SEC
+from lib.loader import FolderExtractor, SingleFileExtractor
+from lib.readers import ARTFReader
+from benchmarks.page_reads import peak_rss_mb
+from benchmarks.synthetic import write_folder
+
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def bench_get_data_stream(folder, options):
+    """Reads the first recording's ICP in consecutive pages with SignalClass.get_data_stream."""
+    page_len = options["page_s"] * MICROSEC_IN_SEC
+    n_values = 0
+    with h5py.File(first_recording(folder), "r") as f:
+        began = time.perf_counter()
+        wave_data = SignalClass(f, "icp")
+        start, end = wave_data.get_all_data_start_time(), wave_data.get_all_data_end_time()
+        for page_start in np.arange(start, end, page_len):
+            n_values += len(wave_data.get_data_stream(page_start, page_len).values)
+        elapsed = time.perf_counter() - began
+    return elapsed, n_values, "values"
+
+
+def bench_get_data_streams(folder, options):
+    """Reads 10 s windows at random times of the first recording's ICP in one SignalClass.get_data_streams call."""
+    rng = np.random.default_rng(0)
+    with h5py.File(first_recording(folder), "r") as f:
+        began = time.perf_counter()
+        wave_data = SignalClass(f, "icp")
+        start, end = wave_data.get_all_data_start_time(), wave_data.get_all_data_end_time()
+        windows = wave_data.get_data_streams(rng.integers(start, end, options["windows"]), 10 * MICROSEC_IN_SEC)
+        elapsed = time.perf_counter() - began
+    return elapsed, len(windows), "windows"
+
+
+def bench_cache_signal(folder, options):
+    """Reads overlapping 10 s windows (5 s step) of the first recording's ICP through CacheSignalClass."""
+    window_len, step = 10 * MICROSEC_IN_SEC, 5 * MICROSEC_IN_SEC
+    n_windows = 0
+    with h5py.File(first_recording(folder), "r") as f:
+        began = time.perf_counter()
+        cache = CacheSignalClass(f, "icp", cache_duration_in_hours=1, page_duration_sec=options["page_s"])
+        start, end = cache.get_all_data_start_time(), cache.get_all_data_end_time()
+        for window_start in np.arange(start, end - window_len, step):
+            cache.get_data_stream(window_start, window_len)
+            n_windows += 1
+        elapsed = time.perf_counter() - began
+    return elapsed, n_windows, "windows"
+
+
+def bench_single_file_extractor(folder, options):
+    """Extracts all anomalous and normal ABP segments of the first recording."""
+    began = time.perf_counter()
+    extractor = SingleFileExtractor(first_recording(folder), "abp")
+    n_segments = len(extractor.get_anomalies()) + len(extractor.get_normal())
+    return time.perf_counter() - began, n_segments, "segments"
+
+
+def bench_folder_extractor(folder, options):
+    """Extracts all ABP segments of the folder with FolderExtractor.extract_all."""
+    began = time.perf_counter()
+    anomalies, normal = FolderExtractor(folder, "abp", workers=options["workers"]).extract_all()
+    elapsed = time.perf_counter() - began
+    return elapsed, len(recordings(folder)), "files"
+
+
+def bench_artf_reader(folder, options):
+    """Parses the ARTF files of the folder into Artefact lists with ARTFReader.read."""
+    n_artefacts = 0
+    began = time.perf_counter()
+    for hdf5_path in recordings(folder):
+        global_artefacts, icp_artefacts, abp_artefacts, _ = ARTFReader(artf_path(hdf5_path)).read()
+        n_artefacts += len(global_artefacts) + len(icp_artefacts) + len(abp_artefacts)
+    return time.perf_counter() - began, n_artefacts, "artefacts"
+
+
+def bench_artf_exporter(folder, options):
+    """Writes the artefacts of the first recording back to an ARTF file with ARTFExporter.export."""
+    global_artefacts, icp_artefacts, abp_artefacts, metadata = ARTFReader(artf_path(first_recording(folder))).read()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        began = time.perf_counter()
+        ARTFExporter(os.path.join(tmp_dir, "export.artf")).export(global_artefacts, icp_artefacts, abp_artefacts,
+                                                                 metadata=metadata)
+        elapsed = time.perf_counter() - began
+    return elapsed, len(global_artefacts) + len(icp_artefacts) + len(abp_artefacts), "artefacts"
+
+
+def run_tool(*args):
+    """Runs one of the command line tools of the repository and returns its wall time."""
+    began = time.perf_counter()
+    subprocess.run([sys.executable, *args], cwd=REPO_ROOT, check=True, stdout=subprocess.DEVNULL)
+    return time.perf_counter() - began
+
+
+def bench_cli_info(folder, options):
+    return run_tool("info.py", "-f", first_recording(folder)), 1, "files"
+
+
+def bench_cli_anomalies(folder, options):
+    return run_tool("anomalies.py", "-f", first_recording(folder), "-s", "abp"), 1, "files"
+
+
+def bench_cli_extract(folder, options):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        elapsed = run_tool("extract.py", "-f", first_recording(folder), "-s", "abp", "-o", tmp_dir,
+                           "-t", options["extract_format"])
+    return elapsed, 1, "files"
+
+
+CASES = {
+    "get_data_stream": bench_get_data_stream,
+    "get_data_streams": bench_get_data_streams,
+    "cache_signal": bench_cache_signal,
+    "single_file_extractor": bench_single_file_extractor,
+    "folder_extractor": bench_folder_extractor,
+    "artf_reader": bench_artf_reader,
+    "artf_exporter": bench_artf_exporter,
+    "cli_info": bench_cli_info,
+    "cli_anomalies": bench_cli_anomalies,
+    "cli_extract": bench_cli_extract,
+}
+
+
+def recordings(folder):
+    return sorted(glob.glob(os.path.join(folder, "*.hdf5")))
+
+
+def first_recording(folder):
+    return recordings(folder)[0]
+
+
+def artf_path(hdf5_path):
+    return os.path.splitext(hdf5_path)[0] + ".artf"
+
+
+def children_peak_rss_mb():
+    """Returns the peak resident set size of the finished child processes in MB."""
+    peak = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+
+def _run_in_child(queue, name, folder, options):
+    baseline_rss = peak_rss_mb()
+    elapsed, items, unit = CASES[name](folder, options)
+    queue.put({
+        "wall_s": elapsed,
+        "items": items,
+        "unit": unit,
+        "peak_rss_mb": peak_rss_mb(),
+        "peak_rss_growth_mb": peak_rss_mb() - baseline_rss,
+        # the command line tools run in their own process
+        "tool_peak_rss_mb": children_peak_rss_mb() if name.startswith("cli_") else None,
+    })
+
+
+def run_case(name, folder, options):
+    """Runs one case in a fresh process and returns its measurement."""
+    ctx = multiprocessing.get_context("spawn")
+    queue = ctx.Queue()
+    process = ctx.Process(target=_run_in_child, args=(queue, name, folder, options))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def summarize(name, runs, options):
+    """Combines the repeated runs of a case: median wall time, throughput of the median run and the highest peak memory."""
+    wall_s = statistics.median(run["wall_s"] for run in runs)
+    items = runs[0]["items"]
+    unit = runs[0]["unit"]
+    peaks = [run["tool_peak_rss_mb"] if run["tool_peak_rss_mb"] is not None else run["peak_rss_mb"] for run in runs]
+    return {
+        "case": name,
+        "description": (CASES[name].__doc__ or "").strip() or None,
+        "options": options,
+        "runs": len(runs),
+        "wall_s": wall_s,
+        "wall_s_runs": [run["wall_s"] for run in runs],
+        "items": items,
+        "unit": unit,
+        "throughput": items / wall_s if wall_s > 0 else None,
+        "throughput_unit": f"{unit}/s",
+        "peak_rss_mb": max(peaks),
+        "peak_rss_growth_mb": max(run["peak_rss_growth_mb"] for run in runs),
+    }
+
+
+def environment():
+    return {
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "h5py": h5py.__version__,
+        "hdf5": h5py.version.hdf5_version,
+    }
+
+
+def run(folder, args, dataset):
+    options = {"page_s": args.page, "windows": args.windows, "workers": args.workers, "extract_format": args.extract_format}
+    results = []
+    for name in args.cases:
+        runs = [run_case(name, folder, options) for _ in range(args.r)]
+        result = summarize(name, runs, options)
+        results.append(result)
+        print(f"{name:<24} {result['wall_s']:>9.3f} s {result['throughput']:>14.1f} {result['throughput_unit']:<14} "
+              f"{result['peak_rss_mb']:>8.1f} MB", file=sys.stderr)
+    return {"environment": environment(), "dataset": dataset, "results": results}
+
+
+def main(args):
+    if args.d:
+        dataset = {"folder": os.path.abspath(args.d), "files": len(recordings(args.d))}
+        report = run(args.d, args, dataset)
+    else:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            dataset = {"synthetic": True, "files": args.files, "hours": args.hours, "artefacts": args.artefacts,
+                       "blocks": args.blocks, "bad_spans": args.bad, "abp_name": args.abp_name}
+            began = time.perf_counter()
+            write_folder(tmp_dir, args.files, args.hours * 3600, n_artefacts=args.artefacts, abp_name=args.abp_name,
+                         n_blocks=args.blocks, n_bad=args.bad)
+            dataset["generation_s"] = time.perf_counter() - began
+            print(f"Generated {args.files} recordings of {args.hours} h in {dataset['generation_s']:.1f} s",
+                  file=sys.stderr)
+            report = run(tmp_dir, args, dataset)
+
+    output = json.dumps(report, indent=2)
+    if args.o:
+        with open(args.o, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+            description="""
+            Benchmark suite of the HDF5 and ARTF read paths and the command line tools.
+            Prints a JSON report with the wall time, throughput and peak memory of every case
+            (progress goes to stderr). Without -d, a folder of synthetic recordings is generated.
+            """)
+    parser.add_argument('-o', type=str, help='Write the JSON report to this file instead of stdout')
+    parser.add_argument('-d', type=str, help='Folder with HDF5 and ARTF files (default: generate synthetic files)')
+    parser.add_argument('-r', type=int, help='Number of runs per case', default=3)
+    parser.add_argument('--cases', type=str, nargs='+', choices=list(CASES), help='Cases to run (default: all)',
+                        default=list(CASES))
+    parser.add_argument('--page', type=int, help='Page length in seconds of the page read cases', default=60)
+    parser.add_argument('--windows', type=int, help='Number of windows of the get_data_streams case', default=1000)
+    parser.add_argument('--workers', type=int, help='Worker processes of the FolderExtractor case', default=1)
+    parser.add_argument('--extract-format', type=str, choices=['txt', 'npy', 'npz'],
+                        help='Output format of the extract.py case', default='npz')
+    parser.add_argument('--files', type=int, help='Number of synthetic recordings', default=2)
+    parser.add_argument('--hours', type=float, help='Duration of each synthetic recording', default=6)
+    parser.add_argument('--artefacts', type=int, help='Number of artefacts per signal group', default=1000)
+    parser.add_argument('--blocks', type=int, help='Number of index blocks per recording', default=10)
+    parser.add_argument('--bad', type=int, help='Number of bad quality spans per recording', default=20)
+    parser.add_argument('--abp-name', type=str, choices=['abp', 'art'], help='Name of the ABP signal', default='abp')
+
+    args = parser.parse_args()
+
+    main(args)
@@ -0,0 +1,196 @@
+"""Synthetic HDF5 recordings for benchmarking.
+
+Writes files with the same layout as the ICM+ exports read by `lib`:
+`waves/<signal>` holds the samples, `waves/<signal>.index` the continuous
+blocks and `waves/<signal>.quality` the quality table (or both tables as
+attributes of the signal dataset). `write_artf` adds the matching annotation
+file. ABP can be written as `art`, like in some of the real exports.
+
+Usage:
+    python3 -m benchmarks.synthetic -o ./synthetic
+    python3 -m benchmarks.synthetic -o ./synthetic --files 4 --days 3 --artefacts 5000 --blocks 50 --bad 200
+    python3 -m benchmarks.synthetic -o ./synthetic --abp-name art --attrs
+"""
+import argparse
+import datetime
+import os
+import time
+
+import numpy as np
+import h5py
+
+
+MICROSEC_IN_SEC = 1_000_000
+ARTF_DATE_FMT = '%d/%m/%Y %H:%M:%S.%f'
+# 01/01/2021 00:00:00 UTC
+DEFAULT_START_TIME = 1_609_459_200 * MICROSEC_IN_SEC
+
+INDEX_DTYPE = np.dtype([("startidx", "<i8"), ("starttime", "<i8"), ("length", "<i8"), ("frequency", "<f8")])
+QUALITY_DTYPE = np.dtype([("time", "<i8"), ("value", "<i4")])
+
+
+def make_index_table(duration_s, frequency, n_blocks=1, gap_s=5, start_time=DEFAULT_START_TIME):
+    """Splits `duration_s` seconds of samples into `n_blocks` continuous blocks separated by `gap_s` gaps."""
+    total = int(duration_s * frequency)
+    bounds = np.linspace(0, total, n_blocks + 1).astype(np.int64)
+    lengths = np.diff(bounds)
+    interval = MICROSEC_IN_SEC / frequency
+    # every gap shifts the following blocks by gap_s seconds
+    start_times = start_time + np.round(bounds[:-1] * interval).astype(np.int64) + \
+        np.arange(n_blocks, dtype=np.int64) * gap_s * MICROSEC_IN_SEC
+
+    index = np.empty(n_blocks, dtype=INDEX_DTYPE)
+    index["startidx"] = bounds[:-1]
+    index["starttime"] = start_times
+    index["length"] = lengths
+    index["frequency"] = frequency
+    return index
+
+
+def make_quality_table(index, n_bad=0, bad_s=30, seed=0):
+    """Marks `n_bad` randomly placed spans of `bad_s` seconds as bad quality."""
+    rng = np.random.default_rng(seed)
+    start = int(index["starttime"][0])
+    last = index[-1]
+    end = int(last["starttime"] + last["length"] / last["frequency"] * MICROSEC_IN_SEC)
+
+    bad_starts = np.sort(rng.integers(start, end, n_bad)) // MICROSEC_IN_SEC * MICROSEC_IN_SEC
+    times = [start]
+    values = [0]
+    for bad_start in bad_starts:
+        if bad_start <= times[-1]:
+            continue
+        times.extend([bad_start, bad_start + bad_s * MICROSEC_IN_SEC])
+        values.extend([1, 0])
+
+    quality = np.empty(len(times), dtype=QUALITY_DTYPE)
+    quality["time"] = times
+    quality["value"] = values
+    return quality
+
+
+def write_recording(path, duration_s, frequency=125.0, signals=("icp", "abp"), n_blocks=1, gap_s=5,
+                    n_bad=0, bad_s=30, compression="gzip", chunked=True, chunk_size=65536, tables="datasets", seed=0):
+    """Writes a synthetic recording with one dataset per signal and returns its index table.
+
+    `tables` is "datasets" for `waves/<signal>.index`/`.quality` datasets or "attrs" for
+    `index`/`quality` attributes of `waves/<signal>`.
+    """
+    if tables not in ("datasets", "attrs"):
+        raise ValueError("tables must be either 'datasets' or 'attrs'")
+    rng = np.random.default_rng(seed)
+    index = make_index_table(duration_s, frequency, n_blocks, gap_s)
+    quality = make_quality_table(index, n_bad, bad_s, seed)
+    total = int(index["length"].sum())
+
+    # attributes above 64 kB need the newer file format
+    with h5py.File(path, "w", libver="latest" if tables == "attrs" else "earliest") as hdf:
+        waves = hdf.create_group("waves")
+        for signal in signals:
+            dataset = waves.create_dataset(
+                signal, shape=(total,), dtype="<f8",
+                chunks=(min(chunk_size, total),) if chunked or compression else None,
+                compression=compression)
+            # write in pieces to keep the generator itself out of the memory profile
+            phase = np.linspace(0, 2 * np.pi, int(frequency), endpoint=False)
+            for start in range(0, total, chunk_size):
+                stop = min(start + chunk_size, total)
+                t = np.arange(start, stop)
+                dataset[start:stop] = 20 + 5 * np.sin(phase[t % len(phase)]) + rng.normal(0, 0.5, stop - start)
+            if tables == "attrs":
+                dataset.attrs["index"] = index
+                dataset.attrs["quality"] = quality
+            else:
+                waves.create_dataset(f"{signal}.index", data=index)
+                waves.create_dataset(f"{signal}.quality", data=quality)
+
+    return index
+
+
+def format_artf_time(time_microsec):
+    """Formats a Unix timestamp in microseconds the way ARTF files store it (millisecond precision)."""
+    dt = datetime.datetime.fromtimestamp(time_microsec / MICROSEC_IN_SEC, tz=datetime.timezone.utc)
+    return dt.strftime(ARTF_DATE_FMT)[:-3]
+
+
+def write_artf(path, index, n_artefacts, signal_groups=("icp", "abp"), n_global=0, window_s=10, seed=0):
+    """Writes an ARTF file with `n_artefacts` artefacts per signal group, aligned to a `window_s` grid."""
+    rng = np.random.default_rng(seed)
+    start = int(index["starttime"][0])
+    last = index[-1]
+    end = int(last["starttime"] + last["length"] / last["frequency"] * MICROSEC_IN_SEC)
+    n_windows = (end - start) // (window_s * MICROSEC_IN_SEC)
+    modified = format_artf_time(end)
+
+    def artefacts(count):
+        windows = np.sort(rng.choice(n_windows, min(count, n_windows), replace=False))
+        for window in windows:
+            artefact_start = start + int(window) * window_s * MICROSEC_IN_SEC
+            yield (f'\t\t<Artefact ModifiedBy="synthetic" ModifiedDate="{modified}" '
+                   f'StartTime="{format_artf_time(artefact_start)}" '
+                   f'EndTime="{format_artf_time(artefact_start + window_s * MICROSEC_IN_SEC)}"/>')
+
+    lines = ['<?xml version="1.0" ?>', '<ICMArtefacts>']
+    if n_global:
+        lines += ['\t<Global>', *artefacts(n_global), '\t</Global>']
+    for group in signal_groups:
+        lines += [f'\t<SignalGroup Name="{group}">', *artefacts(n_artefacts), '\t</SignalGroup>']
+    lines += [f'\t<Info HDF5Filename="{os.path.basename(os.path.splitext(path)[0])}.hdf5" UserID="synthetic"/>',
+              '</ICMArtefacts>', '']
+
+    with open(path, "w") as f:
+        f.write("\n".join(lines))
+
+
+def write_pair(folder, name, duration_s, n_artefacts=100, n_global=0, signals=("icp", "abp"), seed=0, **kwargs):
+    """Writes `<name>.hdf5` and the matching `<name>.artf` into `folder` and returns the HDF5 path."""
+    os.makedirs(folder, exist_ok=True)
+    hdf5_path = os.path.join(folder, f"{name}.hdf5")
+    index = write_recording(hdf5_path, duration_s, signals=signals, seed=seed, **kwargs)
+    write_artf(os.path.join(folder, f"{name}.artf"), index, n_artefacts, signal_groups=signals,
+               n_global=n_global, seed=seed)
+    return hdf5_path
+
+
+def write_folder(folder, n_files, duration_s, n_artefacts=100, abp_name="abp", **kwargs):
+    """Writes `n_files` recordings `TBI_000.hdf5`, `TBI_001.hdf5`, ... with their ARTF files and returns the HDF5 paths.
+
+    `abp_name` is the name of the ABP dataset and signal group, "abp" or "art".
+    """
+    return [write_pair(folder, f"TBI_{i:03d}", duration_s, n_artefacts=n_artefacts, signals=("icp", abp_name),
+                       seed=i, **kwargs)
+            for i in range(n_files)]
+
+
+def main(args):
+    began = time.perf_counter()
+    paths = write_folder(args.o, args.files, args.days * 24 * 3600, n_artefacts=args.artefacts, abp_name=args.abp_name,
+                         n_global=args.global_artefacts, frequency=args.frequency, n_blocks=args.blocks, gap_s=args.gap,
+                         n_bad=args.bad, compression=None if args.contiguous else "gzip", chunked=not args.contiguous,
+                         tables="attrs" if args.attrs else "datasets")
+    size_mb = sum(os.path.getsize(path) for path in paths) / 1024 / 1024
+    print(f"Wrote {len(paths)} recordings ({size_mb:.1f} MB) to {args.o} in {time.perf_counter() - began:.1f} s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+            description="""
+            Synthetic TBI recording generator.
+            Writes TBI_<n>.hdf5 recordings with icp and abp (or art) signals and the matching .artf files.
+            """)
+    parser.add_argument('-o', type=str, help='Output directory', required=True)
+    parser.add_argument('--files', type=int, help='Number of recordings', default=1)
+    parser.add_argument('--days', type=float, help='Duration of each recording in days', default=1)
+    parser.add_argument('--frequency', type=float, help='Sampling frequency in Hz', default=125.0)
+    parser.add_argument('--blocks', type=int, help='Number of continuous index blocks (separated by gaps)', default=10)
+    parser.add_argument('--gap', type=float, help='Length of the gaps between blocks in seconds', default=5)
+    parser.add_argument('--bad', type=int, help='Number of 30 s bad quality spans', default=20)
+    parser.add_argument('--artefacts', type=int, help='Number of artefacts per signal group', default=1000)
+    parser.add_argument('--global-artefacts', type=int, help='Number of global artefacts', default=0)
+    parser.add_argument('--abp-name', type=str, choices=['abp', 'art'], help='Name of the ABP signal', default='abp')
+    parser.add_argument('--attrs', action='store_true', help='Store the index and quality tables as dataset attributes')
+    parser.add_argument('--contiguous', action='store_true', help='Store the signals contiguous and uncompressed')
+
+    args = parser.parse_args()
+
+    main(args)
@@ -1,10 +1,58 @@
+from lib.hdf5_reader_module import INVALID_VALUE
 from lib.loader import SingleFileExtractor
 
 import numpy as np
 import argparse
 import os
+from pathlib import Path
 
 WINDOW_SIZE_SEC = 10
+# normal windows the extractor selects per anomaly with -sn, before the empty ones are dropped
+MATCHING_MULTIPLIER = 2
+
+
+def select_matching_rows(labels):
+    """Returns the rows of all anomalies and of as many normal segments as anomalies (the first ones),
+    the segments the text export writes with -sn."""
+    anomaly_rows = np.flatnonzero(labels == 1)
+    normal_rows = np.flatnonzero(labels == 0)[:anomaly_rows.size]
+    return np.sort(np.concatenate([anomaly_rows, normal_rows]))
+
+
+def export_binary(hdf5_filepath, output_dir, mode, matching, export_format):
+    """Saves all segments of the file as one matrix with label and start time vectors.
+
+    npz: {name}_{signal}.npz with the arrays data, lengths, labels, start_times and names.
+    npy: {name}_{signal}.npy with the matrix only (loadable with mmap_mode='r'),
+         the other arrays go to {name}_{signal}_meta.npz.
+    Every row holds the values of one segment, data[i, :lengths[i]], and is padded to the longest
+    segment with -99999, the missing value of the HDF5 files.
+    names keep the {signal}_{start_ts_micro}_{is_anomalous} names of the text export.
+    """
+    extractor = SingleFileExtractor(hdf5_filepath,
+                                    mode=mode,
+                                    matching=matching,
+                                    matching_multiplier=MATCHING_MULTIPLIER)
+    segments = extractor.get_segments_array(pad_value=INVALID_VALUE)
+    rows = select_matching_rows(segments.labels) if matching else np.arange(len(segments.labels))
+
+    labels = segments.labels[rows]
+    start_times = segments.start_times[rows]
+    names = np.array([f"{mode}_{start}_{label}" for start, label in zip(start_times, labels)], dtype=str)
+    meta = {
+        "lengths": segments.lengths[rows],
+        "labels": labels,
+        "start_times": start_times,
+        "names": names,
+        "frequency": np.float64(segments.frequency),
+    }
+
+    output_path = os.path.join(output_dir, f"{Path(hdf5_filepath).stem}_{mode}")
+    if export_format == "npz":
+        np.savez(f"{output_path}.npz", data=segments.data[rows], **meta)
+    else:
+        np.save(f"{output_path}.npy", segments.data[rows])
+        np.savez(f"{output_path}_meta.npz", **meta)
 
 
 def main(args):
@@ -16,12 +64,15 @@ def main(args):
     if not os.path.exists(output_dir):
         os.makedirs(output_dir, exist_ok=True)
 
-    
+    if args.t != "txt":
+        export_binary(hdf5_filepath, output_dir, mode, matching, args.t)
+        return
+
     if matching:
         extractor = SingleFileExtractor(hdf5_filepath,
                                         mode=mode,
                                         matching=True,
-                                        matching_multiplier=2)
+                                        matching_multiplier=MATCHING_MULTIPLIER)
         anomaly_segments = extractor.get_anomalies()
         normal_segments = extractor.get_normal()[:len(anomaly_segments)]
     else:
@@ -49,11 +100,14 @@ if __name__ == "__main__":
             Use this tool to extract signal segments from HDF5 file and their annotations from ARTF file.
             Outputs signal segments as numpy text files in the output directory.
             Files are named as {signal}_{start_ts_micro}_{is_anomalous}.txt where 0 is not an anomaly and 1 is an anomaly.
+            With -t npy or -t npz, all segments are saved as one matrix per file and signal (rows padded with -99999)
+            together with length, label and start time vectors.
             """)
     parser.add_argument('-f', type=str, help='Path to HDF5 file (with corresponding .artf file)', required=True)
     parser.add_argument('-s', type=str, help='Signal to export, abp or icp', required=True)
     parser.add_argument('-o', type=str, help='Output directory', required=True)
     parser.add_argument('-sn', action='store_true', help='Export same number of normal and anomalous segments')
+    parser.add_argument('-t', type=str, choices=['txt', 'npy', 'npz'], help='Output format (default: txt)', default='txt')
 
     args = parser.parse_args()
 
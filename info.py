@@ -7,27 +7,21 @@ import argparse
 def main(args):
     hdf5_filepath = args.f
 
-    abp_extractor = SingleFileExtractor(hdf5_filepath,
-                                    mode='abp',
-                                    matching=False)
-    icp_extractor = SingleFileExtractor(hdf5_filepath,
-                                    mode='icp',
-                                    matching=False)
-
-    abp_normal = abp_extractor.get_normal()
-    abp_anomaly = abp_extractor.get_anomalies()
-    abp_array = abp_extractor.return_hdf5_as_array()
-    icp_normal = icp_extractor.get_normal()
-    icp_anomaly = icp_extractor.get_anomalies()
-    icp_array = icp_extractor.return_hdf5_as_array()
+    # index, quality and ARTF only, no sample data is read
+    abp_info = SingleFileExtractor(hdf5_filepath,
+                                   mode='abp',
+                                   matching=False,
+                                   index_sidecar=args.i).get_metadata()
+    icp_info = SingleFileExtractor(hdf5_filepath,
+                                   mode='icp',
+                                   matching=False,
+                                   index_sidecar=args.i).get_metadata()
 
     # get number of segments
-    icp_n_segments = len(icp_anomaly) + len(icp_normal)
-    abp_n_segments = len(abp_anomaly) + len(abp_normal)
-    #icp_length_h = icp_n_segments / 6 / 60
-    icp_length_h = len(icp_array) / icp_extractor.get_frequency() / 3600
-    #abp_length_h = abp_n_segments / 6 / 60
-    abp_length_h = len(abp_array) / abp_extractor.get_frequency() / 3600
+    icp_n_segments = icp_info.n_anomalies + icp_info.n_normal
+    abp_n_segments = abp_info.n_anomalies + abp_info.n_normal
+    icp_length_h = icp_info.n_samples / icp_info.frequency / 3600
+    abp_length_h = abp_info.n_samples / abp_info.frequency / 3600
 
     signals = get_hdf5_signal_names(hdf5_filepath)
 
@@ -38,16 +32,21 @@ def main(args):
     print(f"ABP segments (10 s): {abp_n_segments}")
 
     # get sample rates
-    icp_sr = icp_extractor.get_frequency()
-    abp_sr = abp_extractor.get_frequency()
+    icp_sr = icp_info.frequency
+    abp_sr = abp_info.frequency
     assert icp_sr == abp_sr
 
     print(f"ICP sample rate: {icp_sr:.2f} Hz")
     print(f"ABP sample rate: {abp_sr:.2f} Hz")
 
-    print("ICP anomalous segments: ", len(icp_anomaly))
-    print("ABP anomalous segments: ", len(abp_anomaly))#chtelo by zmenu artefakty -> anomalie
-    total_anomalies = len(icp_anomaly) + len(abp_anomaly)
+    print(f"ICP index blocks: {icp_info.n_blocks}")
+    print(f"ABP index blocks: {abp_info.n_blocks}")
+    print(f"ICP good quality: {icp_info.good_quality_fraction * 100:.1f} %")
+    print(f"ABP good quality: {abp_info.good_quality_fraction * 100:.1f} %")
+
+    print("ICP anomalous segments: ", icp_info.n_anomalies)
+    print("ABP anomalous segments: ", abp_info.n_anomalies)#chtelo by zmenu artefakty -> anomalie
+    total_anomalies = icp_info.n_anomalies + abp_info.n_anomalies
     print("Total anomalies: ", total_anomalies)
 
 
@@ -58,6 +57,7 @@ if __name__ == "__main__":
             Use this tool to get information about the HDF5 file and the anomalies associated with it.
             """)
     parser.add_argument('-f', type=str, help='Path to HDF5 file (with corresponding .artf file)', required=True)
+    parser.add_argument('-i', action='store_true', help='Keep the index tables in a .index.npz sidecar next to the HDF5 file for faster repeated runs')
 
     args = parser.parse_args()
 
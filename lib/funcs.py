@@ -1,5 +1,5 @@
-from .readers import ARTFReader
-from .hdf5_reader_module import SignalClass
+from .readers import ARTFReader, HDFReader
+from .hdf5_reader_module import SignalClass, get_abp_signal_name
 
 import h5py
 import numpy as np
@@ -18,10 +18,8 @@ def read_artf(filename):
         metadata: metadata object
     """
     reader = ARTFReader(filename)
-    try:
-        global_artefacts, icp_artefacts, abp_artefacts, metadata = reader.read(abp_name="abp")
-    except Exception:
-        global_artefacts, icp_artefacts, abp_artefacts, metadata = reader.read(abp_name="art")
+    # the ABP group ("abp" or "art") is detected in the same pass
+    global_artefacts, icp_artefacts, abp_artefacts, metadata = reader.read()
 
     return {
         "global_artefacts": global_artefacts,
@@ -30,9 +28,10 @@ def read_artf(filename):
         "metadata": metadata
     }
 
-def read_hdf5_signal(hdf5_file, signal="icp"):
+def read_hdf5_signal(hdf5_file, signal="icp", index_sidecar=False):
     """
-    Read HDF5 file
+    Read HDF5 file, with index_sidecar the index and quality tables are read
+    from the index sidecar next to it (see lib.index_sidecar)
 
     Returns:
         data: numpy array of data
@@ -40,7 +39,7 @@ def read_hdf5_signal(hdf5_file, signal="icp"):
         start_time_s: start time of data in seconds
         end_time_s: end time of data in seconds
     """
-    wave_data = SignalClass(hdf5_file, signal)
+    wave_data = SignalClass(hdf5_file, signal, index_sidecar=index_sidecar)
 
     start_time = wave_data.get_all_data_start_time()
     start_time_s = start_time / 1e6
@@ -60,17 +59,35 @@ def read_hdf5_signal(hdf5_file, signal="icp"):
         "end_time_s": end_time_s
     }
 
-def read_hdf5(filename):
+def read_hdf5(filename, index_sidecar=False):
     with h5py.File(filename, 'r') as f:
-        icp_signal = read_hdf5_signal(f, signal="icp")
-        try:
-            abp_signal = read_hdf5_signal(f, signal="abp")
-        except KeyError:
-            abp_signal = read_hdf5_signal(f, signal="art")
+        icp_signal = read_hdf5_signal(f, signal="icp", index_sidecar=index_sidecar)
+        abp_signal = read_hdf5_signal(f, signal=get_abp_signal_name(f), index_sidecar=index_sidecar)
 
         return icp_signal, abp_signal
 
-def read_hdf5_with_signals(filename):
+def read_hdf5_channels(filename, index_sidecar=False):
+    """
+    Read ICP and ABP (or ART) of HDF5 file together, aligned on one time axis
+
+    Returns:
+        signals: numpy array of shape (2, n), ICP then ABP
+        signal_names: names of the two signals
+        sample_rate: sample rate of data
+        start_time_s: start time of data in seconds
+        end_time_s: end time of data in seconds
+    """
+    channels = HDFReader(filename, index_sidecar).read_channels()
+
+    return {
+        "signals": channels["signals"],
+        "signal_names": channels["signal_names"],
+        "sample_rate": channels["sample_rate"],
+        "start_time_s": channels["start_time"] / 1e6,
+        "end_time_s": channels["end_time"] / 1e6
+    }
+
+def read_hdf5_with_signals(filename, index_sidecar=False):
     with h5py.File(filename, 'r') as f:
 
         signals = []
@@ -83,11 +100,8 @@ def read_hdf5_with_signals(filename):
                 signals.append(signal)
 
 
-        icp_signal = read_hdf5_signal(f, signal="icp")
-        try:
-            abp_signal = read_hdf5_signal(f, signal="abp")
-        except KeyError:
-            abp_signal = read_hdf5_signal(f, signal="art")
+        icp_signal = read_hdf5_signal(f, signal="icp", index_sidecar=index_sidecar)
+        abp_signal = read_hdf5_signal(f, signal=get_abp_signal_name(f), index_sidecar=index_sidecar)
 
         return icp_signal, abp_signal, signals
 
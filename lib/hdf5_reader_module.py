@@ -14,6 +14,11 @@ Created on Thu Nov  4 09:17:28 2021
 
 import numpy as np
 import math
+import queue
+import threading
+from collections import OrderedDict
+
+from . import instrumentation
 
 ## assign fixed variables
 INVALID_VALUE = -99999
@@ -33,82 +38,23 @@ class Iterator:
         if not isinstance(reader, MyHdF5signalReaderClass):
             raise TypeError
         self._reader = reader
-        self._value_index = reader.get_loaded_data_start_index()
-        #self._sect_count = 0 # used for debugging only
+        # all sections of the loaded data are planned up front
+        self._sections = reader.plan_sections()
+        self._section_index = 0
 
     def __next__(self):
+        start_indices, lengths, start_times, frequencies = self._sections
+        if self._section_index >= len(start_indices):
+            raise StopIteration
 
-        # this function will return the start index and
-        # the length of the next continuous data stream
-        while not self._is_end_of_data():
-
-
-            cont_section_start_index = self._find_cont_section_start_index()
-            #print('iterator.cont_section_start_index = ' +  str(cont_section_start_index))
-
-            self._value_index = cont_section_start_index
-
-            # if section found
-            #if (self._sect_count < 10) and (cont_section_start_index >= 0):
-
-            end_index_plus1 = self._reader.get_loaded_data_start_index() + self._reader.get_loaded_data_length()
-            if cont_section_start_index >= 0 and cont_section_start_index < end_index_plus1:
-
-                cont_sect_end_index = self._find_cont_section_end_index()
-
-                #print('iterator.cont_sect_end_index = ' +  str(cont_sect_end_index))
-                #self._sect_count += 1
-
-                if cont_sect_end_index >= 0:
-                    if cont_sect_end_index > self._reader.get_loaded_data_end_index():
-                        cont_sect_end_index = self._reader.get_loaded_data_end_index()
-
-                    cont_sect_length = cont_sect_end_index - cont_section_start_index + 1
-                    next_section = self._create_data_stream_obj(cont_section_start_index, cont_sect_length)
-
-                    # move the current index past the end of the currently return section
-                    self._value_index = cont_sect_end_index + 1
-
-                    return next_section
-
-                self._value_index = self._reader.find_next_normal_quality_section_index(self._value_index)
-
-        raise StopIteration
+        i = self._section_index
+        self._section_index += 1
 
-    def _is_end_of_data(self):
-        return self._value_index > self._reader.get_loaded_data_end_index()
-
-    def _find_cont_section_start_index(self):
-        # Check if the curent stream pointer index is within the normal data section
-        is_normal = self._reader.is_normal_quality_point(self._value_index)
-
-        # Find the end of the continuous valid section (taking into account quality table)
-        if is_normal:
-            return self._value_index
-        return self._reader.find_next_normal_quality_section_index(self._value_index)
-
-    def _find_cont_section_end_index(self):
-        is_normal = self._reader.is_normal_quality_point(self._value_index)
-
-        #print('_find_cont_section_end_index_is_normal = ' + str(self._reader.is_normal_quality_point(self._value_index)))
-        if is_normal:
-            cont_sect_end_index = self._reader.find_cont_section_end_index(self._value_index)
-            normal_qual_end_index = self._reader.find_end_index_of_current_quality_section(self._value_index)
-            #print( 'cont_idx=' + str(cont_sect_end_index) + ' normal_idx=' + str(normal_qual_end_index))
-            if normal_qual_end_index < cont_sect_end_index:
-                return normal_qual_end_index
-            return cont_sect_end_index
-        return -1
-
-    def _create_data_stream_obj(self, cont_section_start_index, cont_sect_length):
         next_section = DataStreamClass()
-
         # Extract data values and store them in DataStream
-        next_section.values = self._reader.get_section_values(cont_section_start_index, cont_sect_length)
-        next_section.sampling_frq = self._reader.get_sampling_frq(cont_section_start_index)
-        next_section.start_time_microsec = self._reader.index_to_time(cont_section_start_index)
-        #print('Iterator._create_data_stream_obj.next_start_time =' + str(next_section.start_time_microsec) )
-
+        next_section.values = self._reader.get_section_values(start_indices[i], lengths[i])
+        next_section.sampling_frq = frequencies[i]
+        next_section.start_time_microsec = start_times[i]
         return next_section
 
 
@@ -124,6 +70,10 @@ class MyHdF5signalReaderClass:
  #       self._loaded_data_end_time = 0 # nothing is loaded
         self._sampling_freq = 0 # nothing is loaded
         self._waves = None
+        self._memmap = None
+        self._preloaded_start_index = 0
+        self._preloaded_data = None
+        self._lookup = None
         self._loaded_data_start_index = 0
         self._loaded_data_length = 0
         self.is_mock = False
@@ -160,25 +110,46 @@ class MyHdF5signalReaderClass:
 
 
     # initialize data stream
-    def init_wave_data(self, signal_name):
+    def init_wave_data(self, signal_name, index=None, memmap=False):
+        '''index: optional tables of the index sidecar (see index_sidecar.get_sidecar), read instead of the file tables
+        memmap: read the values through a memory map of the file when the dataset layout allows it (see memmap_dataset)'''
+        with instrumentation.timed('index_load'):
+            self._init_wave_data(signal_name, index, memmap)
+
+    def _init_wave_data(self, signal_name, index, memmap):
         self._sig_name = signal_name
         self._waves = self._hdf5_data['waves']
+        self._memmap = memmap_dataset(self._waves[self._sig_name]) if memmap else None
 
         ## read index table
-        try:
-            self._index_tbl = np.array(self._waves[self._sig_name + '.index'])
-        except KeyError:
-            self._index_tbl = np.array(self._waves[self._sig_name].attrs['index'])
+        if index is not None:
+            self._index_tbl = index['index']
+        else:
+            try:
+                self._index_tbl = np.array(self._waves[self._sig_name + '.index'])
+            except KeyError:
+                self._index_tbl = np.array(self._waves[self._sig_name].attrs['index'])
 
         ## extract data stream sampling frequency ( assumes that all index table entries have the same sampling frequency as it comes from ICM+ packadging!!!)
         self._sampling_freq = self._index_tbl[0][INDEX_TABLE_FRQ]
 
         ## read quality table
-        try:
-            self._qual_tbl = np.array(self._waves[self._sig_name + '.quality'])
-        except KeyError:
-            self._qual_tbl = np.array(self._waves[self._sig_name].attrs['quality'])
+        if index is not None:
+            self._qual_tbl = index['quality']
+        else:
+            try:
+                self._qual_tbl = np.array(self._waves[self._sig_name + '.quality'])
+            except KeyError:
+                self._qual_tbl = np.array(self._waves[self._sig_name].attrs['quality'])
+
+        ## precompute the table boundaries used by the index and quality lookups
+        self._lookup = TableLookupClass(self._index_tbl, self._qual_tbl)
 
+    def get_lookup(self):
+        '''returns the binary search lookup over the index and quality tables'''
+        if self._lookup is None:
+            self._lookup = TableLookupClass(self._index_tbl, self._qual_tbl)
+        return self._lookup
 
 
 
@@ -190,14 +161,58 @@ class MyHdF5signalReaderClass:
     def _load_data_portion(self):
         #return np.array(self._waves[self._sig_name])[self._loaded_data_start_index : self._loaded_data_end_index + 1]
         end_index = self._loaded_data_start_index + self._loaded_data_length
-        return np.array(self._waves[self._sig_name])[self._loaded_data_start_index : end_index ]
-
-    # original raw data loader
-    def load_raw_data_set(self,page_start_time, page_len_microsec):
-        self._loaded_data_length = 0
+        return self._read_values(self._loaded_data_start_index, end_index)
+
+    def _read_values(self, start_index, end_index):
+        '''reads the values start_index .. end_index - 1 of the signal'''
+        if self._memmap is not None:
+            # read-only view of the mapped file, copied only if invalid values have to be replaced
+            values = self._memmap[start_index : end_index]
+            instrumentation.count_read(values, 'memmap')
+            with instrumentation.timed('nan_replace'):
+                return np.where(values == INVALID_VALUE, np.NaN, values) if (values == INVALID_VALUE).any() else values
+        # slicing the dataset itself makes h5py read (and decompress) only the requested hyperslab
+        with instrumentation.timed('hdf5_read'):
+            values = self._waves[self._sig_name][start_index : end_index]
+        instrumentation.count_read(values)
+        return values
+
+    def read_values(self, start_index, length):
+        '''reads the values start_index .. start_index + length - 1, with -99999 ( = INVALID_VALUE) replaced by NAN'''
+        values = self._read_values(start_index, start_index + length)
+        if values.flags.writeable:
+            with instrumentation.timed('nan_replace'):
+                values[values==INVALID_VALUE] = np.NaN
+        return values
+
+    def preload_data(self, start_index, length):
+        '''reads the values start_index .. start_index + length - 1 at once, the sections of the pages planned
+        within them are then copied by load_preloaded_data (see SignalClass.get_data_streams)'''
+        self._preloaded_data = None
+        self._preloaded_data = self.read_values(start_index, length)
+        self._preloaded_start_index = start_index
+
+    def load_preloaded_data(self):
+        '''makes the preloaded values the loaded data, as load_raw_data_set does for a single page'''
+        self._loaded_data_start_index = self._preloaded_start_index
+        self._loaded_data_length = len(self._preloaded_data)
+        self._sig_stream = self._preloaded_data
+
+    def release_preloaded_data(self):
+        self._preloaded_data = None
+
+    def get_chunk_length(self):
+        '''returns the number of values h5py decompresses at once (0 for contiguous or memory mapped data)'''
+        if self.is_mock or self._memmap is not None:
+            return 0
+        chunks = self._waves[self._sig_name].chunks
+        return chunks[0] if chunks else 0
 
+    def get_raw_data_range(self, page_start_time, page_len_microsec):
+        '''returns the first value index and the number of values load_raw_data_set loads for the page,
+        or None if the page holds no values'''
         if page_len_microsec == 0:
-            return
+            return None
 
         ## calculate start index and end index
         start_val_index, start_delta_t = self.time_to_sample_index(page_start_time)
@@ -217,23 +232,37 @@ class MyHdF5signalReaderClass:
 
             if end_val_index == -1:
                 # page ends before data start
-                return
+                return None
 
             if (start_val_index == self.get_last_value_index()) and  (end_delta_t > 0):
                 # page starts after the data ends
-                return
+                return None
 
             if (start_val_index == end_val_index) and (start_delta_t > 0):
                 # page entirely in a gap
-                return
+                return None
 
 
         if start_delta_t == 0:
-            self._loaded_data_start_index = start_val_index
+            first_val_index = start_val_index
         else:
-            self._loaded_data_start_index = start_val_index + 1
+            first_val_index = start_val_index + 1
 
-        self._loaded_data_length = end_val_index - self._loaded_data_start_index + 1
+        return first_val_index, end_val_index - first_val_index + 1
+
+    # original raw data loader
+    def load_raw_data_set(self,page_start_time, page_len_microsec, load_values=True):
+        '''load_values: if false, only the range of the page's values is set (see CacheSignalClass), nothing is read'''
+        self._loaded_data_length = 0
+
+        raw_data_range = self.get_raw_data_range(page_start_time, page_len_microsec)
+        if raw_data_range is None:
+            return
+
+        self._loaded_data_start_index, self._loaded_data_length = raw_data_range
+        if not load_values:
+            self._sig_stream = np.empty(0)
+            return
 
         #print( 'reader load_raw_data_set.self._loaded_data_start_index ' + str(self._loaded_data_start_index))
         #print( 'reader load_raw_data_set.self._loaded_data_length ' + str(self._loaded_data_length ))
@@ -245,7 +274,9 @@ class MyHdF5signalReaderClass:
             self._sig_stream = self._load_data_portion()
 
         ## replace -99999 ( = INVALID_VALUE) in stream with NAN
-        self._sig_stream[self._sig_stream==INVALID_VALUE] = np.NaN
+        if self._sig_stream.flags.writeable:
+            with instrumentation.timed('nan_replace'):
+                self._sig_stream[self._sig_stream==INVALID_VALUE] = np.NaN
 
     def is_empty(self):
         return self._loaded_data_length == 0
@@ -266,59 +297,31 @@ class MyHdF5signalReaderClass:
     def __iter__(self):
         return Iterator(self)
 
+    def plan_sections(self):
+        '''returns the start index, length, start time and sampling frequency of every
+        continuous good quality section of the loaded data as arrays'''
+        if self.is_empty():
+            return self.get_lookup().plan_sections(0, -1)
+        return self.get_lookup().plan_sections(self._loaded_data_start_index, self.get_loaded_data_end_index())
+
     def time_to_sample_index( self,time_stamp_microsec ):
         '''returns index of the data point corresponding to the time stamp.
         If the time stamp falls in the data gap it will use use_previous_if_in_gap
         to return the first sample index before the time stamp, or the first after'''
-
-        ## takes care of time stamp falling before the first data value
-        if time_stamp_microsec < self._index_tbl[0][INDEX_TABLE_TIME]:
-            return -1, time_stamp_microsec - self._index_tbl[0][INDEX_TABLE_TIME]
-
-        prev_value_idx = self.get_last_value_index()
-        for i in range (0,len(self._index_tbl)):
-            start_time_microsec = self._index_tbl[i][INDEX_TABLE_TIME]
-            start_index = self._index_tbl[i][INDEX_TABLE_INDEX]
-            sampling_frq = self._index_tbl[i][INDEX_TABLE_FRQ]
-            length = self._index_tbl[i][INDEX_TABLE_LENGTH]
-            end_time_microsec =  start_time_microsec + length / sampling_frq * MICROSEC_IN_SEC
-
-            if time_stamp_microsec < start_time_microsec:
-                prev_entry_start_idx = self._index_tbl[i-1][INDEX_TABLE_INDEX]
-                prev_entry_len = self._index_tbl[i-1][INDEX_TABLE_LENGTH]
-                prev_value_idx = prev_entry_start_idx + prev_entry_len  - 1
-                break
-                #return prev_value_idx, time_stamp_microsec - self.index_to_time(prev_value_idx)
-
-            #if (start_time_microsec <= time_stamp_microsec) and (time_stamp_microsec <= end_time_microsec):
-            if start_time_microsec <= time_stamp_microsec < end_time_microsec:
-                index_float = start_index + (time_stamp_microsec - start_time_microsec) / MICROSEC_IN_SEC * sampling_frq
-                #if use_previous_if_in_gap:
-                #    return math.trunc( index_float )
-                prev_value_idx = math.floor( index_float )
-                break
-                #return prev_value_idx, (index_float - prev_value_idx) / sampling_frq * MICROSEC_IN_SEC
-
-#            if (i == len(self._index_tbl) - 1) and (time_stamp_microsec >= end_time_microsec):
-         # prev_value_idx = self.get_last_value_index()
-        return prev_value_idx, time_stamp_microsec - self.index_to_time(prev_value_idx)
+        prev_value_idx, delta_t = self.get_lookup().time_to_sample_index(time_stamp_microsec)
+        return int(prev_value_idx), float(delta_t)
 
 
     def get_last_value_index(self): ## is inclusive
         last_idx_entry_idx = len(self._index_tbl) - 1
         last_idx_entry = self._index_tbl[last_idx_entry_idx]
         last_val_index = last_idx_entry[INDEX_TABLE_INDEX] + last_idx_entry[INDEX_TABLE_LENGTH] - 1
-        return last_val_index
+        return int(last_val_index)
 
     def index_to_time( self, value_index ):
         '''returns the time stamp of the data point corresponding to the index.'''
         #First calculates the time stamp of the start of the section, then adds the relative delta time
-
-        index_table_entry_index = self.get_index_tbl_entry_index( value_index )
-        index_tbl_idx = self._index_tbl[index_table_entry_index][INDEX_TABLE_INDEX]
-        index_tbl_start_time_microsec = self._index_tbl[index_table_entry_index][INDEX_TABLE_TIME]
-        sampling_frq = self._index_tbl[index_table_entry_index][INDEX_TABLE_FRQ]
-        return index_tbl_start_time_microsec + (value_index - index_tbl_idx )/sampling_frq * MICROSEC_IN_SEC
+        return float(self.get_lookup().index_to_time(value_index))
 
     def get_section_values(self, start_value_index,length):
         '''returns signal values given the starting index and the length of the section'''
@@ -328,81 +331,151 @@ class MyHdF5signalReaderClass:
     def get_sampling_frq(self, value_index):
         '''returns the sampling frequency of the data point corresponding to the index'''
         index_table_entry_index = self.get_index_tbl_entry_index( value_index )
-        return self._index_tbl[index_table_entry_index][INDEX_TABLE_FRQ]
+        return float(self._index_tbl[index_table_entry_index][INDEX_TABLE_FRQ])
 
     def is_normal_quality_point( self, value_index ):
         '''checks if the data point corresponding to the index is in a good quality section.
         If so, the condition is True.'''
-        qual_index = self.get_quality_entry_index( value_index )
-        if qual_index >= 0:
-            return self._qual_tbl[qual_index][QUALITY_TABLE_VALUE] == 0
-
-        return False
+        return bool(self.get_lookup().is_normal_quality_point(value_index))
 
     def get_quality_entry_index( self, value_index ):
         '''returns the quality table index related to the data point corresponding to the value index.'''
-        #First calculates the time stamp of the value index, then iterates through 'Time' in quality table.
-        #When it finds Time > time stamp, then assigns the index of the previous entry.
-
-        time_stamp_microsec = self.index_to_time( value_index)
-        if time_stamp_microsec < self._qual_tbl[0][QUALITY_TABLE_TIME]:
-            return -1
-
-        for i in range (1,len(self._qual_tbl)):
-            if self._qual_tbl[i][QUALITY_TABLE_TIME] > time_stamp_microsec:
-                return i-1
-        return len(self._qual_tbl) - 1
+        #First calculates the time stamp of the value index, then finds the last entry with 'Time' <= time stamp.
+        return int(self.get_lookup().quality_entry_index(value_index))
 
     def get_quality_section_start_time(self, value_index):
         return self._qual_tbl[value_index][QUALITY_TABLE_TIME]
 
+    def get_quality_section_start_times(self, qual_entry_indices):
+        '''returns the start times of the quality table entries (an array of entry indices)'''
+        return get_table_column(self._qual_tbl, QUALITY_TABLE_TIME)[qual_entry_indices]
+
 
     def get_index_tbl_entry_index( self, value_index ):
         '''returns the index of the index table related to the data point that corresponds to the value index'''
-
-        for i in range (1,len(self._index_tbl)):
-            if self._index_tbl[i][INDEX_TABLE_INDEX] > (value_index):
-                return i-1
-        return len(self._index_tbl) - 1
+        return int(self.get_lookup().index_tbl_entry_index(value_index))
 
 
     def find_cont_section_end_index( self, value_index ):
         '''calculates the index corresponding to the end of the continuous stream section of the data point corresponding to the value index '''
-        current_index_entry_index = self.get_index_tbl_entry_index(value_index)
-        return self._index_tbl[current_index_entry_index][INDEX_TABLE_INDEX] + self._index_tbl[current_index_entry_index][INDEX_TABLE_LENGTH] - 1
+        return int(self.get_lookup().cont_section_end_index(value_index))
 
 
     def find_end_index_of_current_quality_section(self, value_index):
         '''calculates the data index corresponding to the end of the quality section of the data point corresponding to the current index'''
-        qual_entry_index = self.get_quality_entry_index( value_index )
-
-        if qual_entry_index == len(self._qual_tbl) - 1:
-            return self.get_last_value_index()  # len(self._sig_stream) - 1
-
-        next_qual_entry_time_stamp_microsec = self._qual_tbl[ qual_entry_index + 1][QUALITY_TABLE_TIME]
-
-        sample_index, delta_t = self.time_to_sample_index( next_qual_entry_time_stamp_microsec)
-        if delta_t == 0:
-            sample_index -= 1
-        return sample_index
+        return int(self.get_lookup().quality_section_end_index(value_index))
 
 
     def find_next_normal_quality_section_index(self, value_index):
         '''returns the index of the data point in the next normal quality section.
         If the value index falls in a gap, it returns the index of the next continuous section '''
-        cur_qual_index = self.get_quality_entry_index( value_index )
-
-        if (cur_qual_index == -1) or ( self._qual_tbl[cur_qual_index][QUALITY_TABLE_VALUE] == 0 ):
-            cur_qual_index += 1
-
-        for i in range (cur_qual_index,len(self._qual_tbl)):
-            if self._qual_tbl[i][QUALITY_TABLE_VALUE] == 0:
-                normal_quality_start_idx, delta_t = self.time_to_sample_index( self._qual_tbl[i][QUALITY_TABLE_TIME])
-                if delta_t > 0:
-                    normal_quality_start_idx += 1
-                return normal_quality_start_idx
-
-        return self.get_last_value_index() + 1 #  get_data_length()
+        return int(self.get_lookup().next_normal_quality_section_index(value_index))
+
+
+class TableLookupClass:
+    '''answers the index and quality table queries of the reader by binary search.
+    The table boundaries are precomputed once, every query accepts a single value or an array.'''
+    def __init__(self, index_tbl, qual_tbl):
+        ## index table blocks: cumulative sample offsets and start/end times in microseconds
+        self._block_start_index = get_table_column(index_tbl, INDEX_TABLE_INDEX).astype(np.int64)
+        self._block_start_time = get_table_column(index_tbl, INDEX_TABLE_TIME).astype(np.int64)
+        self._block_length = get_table_column(index_tbl, INDEX_TABLE_LENGTH).astype(np.int64)
+        self._block_frq = get_table_column(index_tbl, INDEX_TABLE_FRQ).astype(np.float64)
+        self._block_end_index = self._block_start_index + self._block_length - 1 # inclusive
+        self._block_end_time = self._block_start_time + self._block_length / self._block_frq * MICROSEC_IN_SEC # exclusive
+        self._last_value_index = self._block_end_index[-1]
+
+        ## quality table entries
+        self._qual_time = get_table_column(qual_tbl, QUALITY_TABLE_TIME).astype(np.int64)
+        self._qual_is_normal = get_table_column(qual_tbl, QUALITY_TABLE_VALUE) == 0
+        n_qual = len(self._qual_time)
+
+        # first value index of every quality section, and the last value index before it
+        qual_value_index, qual_delta_t = self.time_to_sample_index(self._qual_time)
+        self._qual_first_index = np.where(qual_delta_t > 0, qual_value_index + 1, qual_value_index)
+        # shifted by one so that entry -1 (before the table) ends before entry 0 and the last entry at the end of data
+        self._qual_last_index = np.append(np.where(qual_delta_t == 0, qual_value_index - 1, qual_value_index), self._last_value_index)
+
+        # position of the first normal quality entry at or after each entry (n_qual if there is none)
+        positions = np.where(self._qual_is_normal, np.arange(n_qual), n_qual)
+        self._next_normal_qual = np.append(np.minimum.accumulate(positions[::-1])[::-1], n_qual)
+
+    def get_last_value_index(self):
+        return self._last_value_index
+
+    def index_tbl_entry_index(self, value_index):
+        '''returns the index table entries holding the value indices'''
+        entry = np.searchsorted(self._block_start_index, value_index, side='right') - 1
+        return np.maximum(entry, 0)
+
+    def index_to_time(self, value_index):
+        '''returns the time stamps of the value indices'''
+        entry = self.index_tbl_entry_index(value_index)
+        return self._block_start_time[entry] + (value_index - self._block_start_index[entry]) / self._block_frq[entry] * MICROSEC_IN_SEC
+
+    def time_to_sample_index(self, time_stamp_microsec):
+        '''returns the index of the last value at or before each time stamp and the time elapsed since it.
+        Time stamps before the first value return -1 and the (negative) time to the first value.'''
+        time_stamp_microsec = np.asarray(time_stamp_microsec)
+        entry = np.searchsorted(self._block_start_time, time_stamp_microsec, side='right') - 1
+        before_data = entry < 0
+        entry = np.maximum(entry, 0)
+
+        in_block = time_stamp_microsec < self._block_end_time[entry]
+        index_float = self._block_start_index[entry] + (time_stamp_microsec - self._block_start_time[entry]) / MICROSEC_IN_SEC * self._block_frq[entry]
+        # a time stamp in the gap after a block maps to the last value of that block
+        value_index = np.where(in_block, np.floor(index_float), self._block_end_index[entry]).astype(np.int64)
+        value_index = np.where(before_data, -1, value_index)
+
+        delta_t = np.where(before_data,
+                           time_stamp_microsec - self._block_start_time[0],
+                           time_stamp_microsec - self.index_to_time(value_index))
+        return value_index, delta_t
+
+    def quality_entry_index(self, value_index):
+        '''returns the quality table entries of the value indices, -1 before the first entry'''
+        return np.searchsorted(self._qual_time, self.index_to_time(value_index), side='right') - 1
+
+    def is_normal_quality_point(self, value_index):
+        '''checks if the value indices are in good quality sections'''
+        qual_index = self.quality_entry_index(value_index)
+        return (qual_index >= 0) & self._qual_is_normal[np.maximum(qual_index, 0)]
+
+    def cont_section_end_index(self, value_index):
+        '''returns the last index of the continuous blocks holding the value indices'''
+        return self._block_end_index[self.index_tbl_entry_index(value_index)]
+
+    def quality_section_end_index(self, value_index):
+        '''returns the last index of the quality sections holding the value indices'''
+        return self._qual_last_index[self.quality_entry_index(value_index) + 1]
+
+    def plan_sections(self, first_index, last_index):
+        '''returns the continuous good quality sections between two value indices (inclusive)
+        as arrays of start indices, lengths, start times and sampling frequencies.
+        Sections end where an index table block or a quality section ends.'''
+        # split the range at every block and quality section boundary inside it
+        boundaries = np.concatenate(([first_index], self._block_start_index, self._block_end_index + 1,
+                                     self._qual_first_index, self._qual_last_index + 1))
+        starts = np.unique(boundaries[(boundaries >= first_index) & (boundaries <= last_index)])
+        ends = np.append(starts[1:], last_index + 1) - 1
+
+        # keep the pieces inside a block and of normal quality
+        entry = self.index_tbl_entry_index(starts)
+        keep = (starts >= self._block_start_index[entry]) & (starts <= self._block_end_index[entry]) & self.is_normal_quality_point(starts)
+        starts, ends, entry = starts[keep], ends[keep], entry[keep]
+
+        return starts, ends - starts + 1, self.index_to_time(starts), self._block_frq[entry]
+
+    def next_normal_quality_section_index(self, value_index):
+        '''returns the first index of the next normal quality section after the value indices'''
+        qual_index = self.quality_entry_index(value_index)
+        # the search starts at the current entry only if it is abnormal
+        skip_current = (qual_index == -1) | self._qual_is_normal[np.maximum(qual_index, 0)]
+        next_entry = self._next_normal_qual[qual_index + skip_current]
+        has_next = next_entry < len(self._qual_time)
+        return np.where(has_next,
+                        self._qual_first_index[np.minimum(next_entry, len(self._qual_time) - 1)],
+                        self._last_value_index + 1)
 
 
 class DataStreamClass:
@@ -411,8 +484,20 @@ class DataStreamClass:
         self.values = np.empty( shape=(0))
         self.sampling_frq = 0
         self.start_time_microsec = -1
+        self._buffer = None
 
 
+    def allocate(self, size, out=None):
+        '''allocates the output buffer once so that the sections are written in place.
+        If out is given, the values are written into it instead (it must hold at least size values).'''
+        if out is None:
+            self._buffer = np.empty(size)
+        elif len(out) < size:
+            raise ValueError(f"Output buffer of length {len(out)} cannot hold the {size} values of the stream")
+        else:
+            self._buffer = out[:size]
+        self.values = self._buffer[:0]
+
     def get_end_time_microsec(self):
         '''returns the the stamp of the end of the values array'''
         return self.start_time_microsec  + len(self.values) / self.sampling_frq * MICROSEC_IN_SEC
@@ -426,34 +511,97 @@ class DataStreamClass:
         If there was a gap after the previous data section, it will fill it in with NAN values.'''
 
         # data_sec represents a continuous good quality data section
+        self.append_section(data_sec.values, data_sec.start_time_microsec, data_sec.sampling_frq)
+
+    def append_section(self, values, start_time_microsec, sampling_frq):
+        '''appends the values of a continuous good quality section starting at the given time.
+        If there was a gap after the previous data section, it will fill it in with NAN values.'''
         if self.sampling_frq == 0:
-            self.sampling_frq = data_sec.sampling_frq
+            self.sampling_frq = sampling_frq
 
         if self.start_time_microsec < 0:
-            self.start_time_microsec = data_sec.start_time_microsec - len(self.values) / self.sampling_frq * MICROSEC_IN_SEC
+            self.start_time_microsec = start_time_microsec - len(self.values) / self.sampling_frq * MICROSEC_IN_SEC
 
         if not self.is_empty():
             current_end_time = self.get_end_time_microsec()
-            #print('DataStreamClass.append_new_data_section.current_end_time = '+ str(current_end_time))
-            #print('DataStreamClass.append_new_data_section.start_time_microsec  = '+ str(data_sec.start_time_microsec))
-
-            gap_data = get_gap_filler(data_sec.start_time_microsec - current_end_time, self.sampling_frq)
-            self.values = np.append(self.values , gap_data)
+            self.append_NAN_section(get_gap_length(start_time_microsec - current_end_time, self.sampling_frq))
 
-        self.values = np.append(self.values , data_sec.values)
+        self._append_values(values)
 
     def append_NAN_section(self,size):
         if size <= 0:
             return
-        NAN_section = np.empty(size)
-        NAN_section[:] = np.NaN
-        self.values = np.append(self.values , NAN_section)
+        end = len(self.values) + size
+        if self._fits_in_buffer(end):
+            self._buffer[len(self.values):end] = np.NaN
+            self.values = self._buffer[:end]
+        else:
+            NAN_section = np.empty(size)
+            NAN_section[:] = np.NaN
+            self.values = np.append(self.values , NAN_section)
+
+    def _append_values(self, values):
+        end = len(self.values) + len(values)
+        if self._fits_in_buffer(end):
+            self._buffer[len(self.values):end] = values
+            self.values = self._buffer[:end]
+        else:
+            self.values = np.append(self.values , values)
+
+    def _fits_in_buffer(self, end):
+        # without an allocated buffer (or once it is full) the values grow by copying as before
+        return self._buffer is not None and end <= len(self._buffer)
 
 
 # Utility functions
+def memmap_dataset(dataset):
+    '''returns a read-only memory map of the values of a contiguous, uncompressed float dataset stored in a plain file,
+    or None if the dataset has to be read through h5py (chunked, compressed, external or not yet allocated storage).
+    Slices of the map are views of the OS page cache, shared by all processes reading the same file.'''
+    if dataset.chunks is not None or dataset.compression is not None or dataset.external:
+        return None
+    if dataset.file.driver != 'sec2' or dataset.dtype.kind != 'f' or dataset.size == 0:
+        return None
+    offset = dataset.id.get_offset() # includes the user block, None if the storage is not allocated
+    if offset is None:
+        return None
+    try:
+        # asarray drops the np.memmap subclass, the mapping stays alive as the base of the array
+        return np.asarray(np.memmap(dataset.file.filename, dtype=dataset.dtype, mode='r', offset=offset, shape=dataset.shape))
+    except (OSError, ValueError):
+        return None
+
+def get_table_column(table, column):
+    '''returns a column of the index or quality table, stored either as a compound or as a 2D array'''
+    if table.dtype.names:
+        return table[table.dtype.names[column]]
+    return table[:, column]
+
+def get_gap_length(duration_in_microsec,sampling_frq):
+    '''returns the number of empty values filling a gap'''
+    return max(round(duration_in_microsec / MICROSEC_IN_SEC * sampling_frq ), 0)
+
+def calc_stream_length(initial_gap_size, start_times, lengths, frequencies, end_gap_size):
+    '''returns the number of values DataStreamClass ends up with after appending
+    the initial gap, the continuous data sections and the end gap'''
+    length = max(initial_gap_size, 0)
+    sampling_frq = 0
+    start_time_microsec = -1
+    for section_start_time, section_length, section_frq in zip(start_times, lengths, frequencies):
+        # same arithmetic as DataStreamClass.append_section
+        if sampling_frq == 0:
+            sampling_frq = section_frq
+        if start_time_microsec < 0:
+            start_time_microsec = section_start_time - length / sampling_frq * MICROSEC_IN_SEC
+        if length > 0:
+            current_end_time = start_time_microsec + length / sampling_frq * MICROSEC_IN_SEC
+            length += get_gap_length(section_start_time - current_end_time, sampling_frq)
+        length += section_length
+    return length + max(end_gap_size, 0)
+
 def get_gap_filler(duration_in_microsec,sampling_frq):
     '''creates an array of empty values'''
-    length = round(duration_in_microsec / MICROSEC_IN_SEC * sampling_frq )
+    length = get_gap_length(duration_in_microsec, sampling_frq)
 
     if length > 0:
         gap_data = np.empty(length)
@@ -468,12 +616,26 @@ def get_gap_filler(duration_in_microsec,sampling_frq):
 
 
 
+def load_sidecar_tables(hdf5_data, signal_name):
+    '''returns the index and quality tables of a signal of the open file from the index sidecar next to it,
+    which is written first if it is missing or stale (see index_sidecar.get_sidecar).
+    None if there is no usable sidecar, the tables are then read from the file.'''
+    # imported here because index_sidecar builds on this module
+    from .index_sidecar import get_sidecar
+    sidecar = get_sidecar(hdf5_data.filename, [signal_name], ('index', 'quality'))
+    return None if sidecar is None else sidecar.get(signal_name)
+
+
+
 class SignalClass:
-    '''manages the signal data'''
-    def __init__(self, hdf5_data, signal_name):
+    '''manages the signal data
+    memmap: read the values through a memory map of the file when the dataset layout allows it (see memmap_dataset)
+    index_sidecar: read the index and quality tables from the index sidecar next to the file (see load_sidecar_tables)'''
+    def __init__(self, hdf5_data, signal_name, memmap=False, index_sidecar=False):
         self._hdf5_data = hdf5_data
         self._data_reader = MyHdF5signalReaderClass(self._hdf5_data)
-        self._data_reader.init_wave_data(signal_name)
+        index = load_sidecar_tables(hdf5_data, signal_name) if index_sidecar else None
+        self._data_reader.init_wave_data(signal_name, index, memmap)
         self._signal_name = signal_name
         self._page_start_time = 0
         self._page_len_microsec = 0
@@ -500,37 +662,213 @@ class SignalClass:
         return self._data_reader.get_all_data_end_time()
 
 
-    def get_data_stream(self, page_start_time, page_len_microsec):
-        '''obtains the full data stream of continuous values, counting only for good quality data'''
+    def get_data_stream(self, page_start_time, page_len_microsec, out=None):
+        '''obtains the full data stream of continuous values, counting only for good quality data.
+        The output length is worked out first and the values are written into a single buffer,
+        which is the caller's array out when given (e.g. to reuse one allocation across pages).'''
+        return self.fill_data_stream(self.plan_data_stream(page_start_time, page_len_microsec), out)
+
+    def get_data_streams(self, page_start_times, page_lens_microsec, stack=None, max_read_len=16 * 1024 * 1024):
+        '''obtains the data streams of many pages (windows) at once, each the same as get_data_stream would return.
+        The pages are planned together by plan_data_streams, so the index and quality tables are searched once
+        for all pages. The raw values are then read in one pass in value order: pages overlapping or closer than
+        a chunk share a single read, so every chunk is decompressed once (a read holds at most max_read_len values,
+        unless a page alone is longer). Pages holding no good quality values are not read at all.
+        page_lens_microsec may be a single duration for all pages.
+        Returns the values of every page in the order of page_start_times, as a list of arrays or, when stack is true
+        (by default when all pages have the same duration), as one matrix with a row per page, padded with NaN
+        if the rounding of the gaps makes some streams a value shorter than others.'''
+        page_start_times, page_lens_microsec = np.broadcast_arrays(np.asarray(page_start_times), np.asarray(page_lens_microsec))
+        page_start_times = page_start_times.ravel()
+        page_lens_microsec = page_lens_microsec.ravel()
+        if stack is None:
+            stack = len(np.unique(page_lens_microsec)) <= 1
+        plans, raw_ranges = self.plan_data_streams(page_start_times, page_lens_microsec)
+
+        # raw values of the pages, grouped into runs read at once
+        merge_gap = self._data_reader.get_chunk_length()
+        runs = [] # [first value index, end value index, pages]
+        for page in sorted((page for page in range(len(plans)) if raw_ranges[page] is not None), key=lambda page: raw_ranges[page]):
+            first_index, length = raw_ranges[page]
+            end_index = first_index + length
+            if runs and first_index <= runs[-1][1] + merge_gap and max(end_index, runs[-1][1]) - runs[-1][0] <= max_read_len:
+                runs[-1][1] = max(end_index, runs[-1][1])
+                runs[-1][2].append(page)
+            else:
+                runs.append([first_index, end_index, [page]])
+
+        streams = [None] * len(plans)
+        try:
+            for first_index, end_index, pages in runs:
+                self._data_reader.preload_data(first_index, end_index - first_index)
+                self._data_reader.load_preloaded_data()
+                for page in pages:
+                    streams[page] = self.fill_data_stream(plans[page]).values
+        finally:
+            self._data_reader.release_preloaded_data()
+        for page, plan in enumerate(plans):
+            if streams[page] is None:
+                # gaps only, or one of the rare pages plan_data_streams leaves to plan_data_stream
+                streams[page] = self.fill_data_stream(plan).values if plan is not None else \
+                    self.get_data_stream(page_start_times[page].item(), page_lens_microsec[page].item()).values
+
+        if not stack:
+            return streams
+        matrix = np.full((len(streams), max((len(values) for values in streams), default=0)), np.NaN)
+        for row, values in zip(matrix, streams):
+            row[:len(values)] = values
+        return matrix
+
+    def plan_data_streams(self, page_start_times, page_lens_microsec):
+        '''plans the data streams of many pages as plan_data_stream does page by page, with the index and quality
+        lookups of all pages made in one vectorized pass and without loading any values.
+        The good quality sections of the whole signal are planned once and clipped to every page.
+        Returns the plan of every page and the (first value index, number of values) range its sections are copied
+        from, None for pages holding no good quality values. A page whose raw range is inconsistent gets the plan
+        None and has to be planned by plan_data_stream.'''
+        lookup = self._data_reader.get_lookup()
+        sampling_freq = self._data_reader.get_sampling_freq()
+        last_value_index = lookup.get_last_value_index()
+        page_end_times = page_start_times + page_lens_microsec
+        plans = [None] * len(page_start_times)
+        raw_ranges = [None] * len(page_start_times)
+
+        ## raw value range of every page, as get_raw_data_range
+        start_val_index, start_delta_t = lookup.time_to_sample_index(page_start_times)
+        end_val_index, end_delta_t = lookup.time_to_sample_index(page_end_times)
+        at_last_value = (start_val_index == last_value_index) & (end_val_index == last_value_index)
+        end_val_index = np.where(~at_last_value & (end_delta_t == 0), end_val_index - 1, end_val_index)
+        no_values = (page_lens_microsec == 0) | (~at_last_value & ((end_val_index == -1)
+                                                 | ((start_val_index == last_value_index) & (end_delta_t > 0))
+                                                 | ((start_val_index == end_val_index) & (start_delta_t > 0))))
+        first_index = np.where(start_delta_t == 0, start_val_index, start_val_index + 1)
+        last_index = end_val_index
+        has_values = ~no_values & (last_index >= first_index)
+
+        ## first normal quality value of every page with values, as is_empty_or_abnormal and _calc_initial_gap_size
+        first_normal_index = np.where(lookup.is_normal_quality_point(first_index), first_index,
+                                      lookup.next_normal_quality_section_index(first_index))
+        normal = has_values & (first_normal_index <= last_index)
+        gap_only = no_values | (has_values & ~normal)
+
+        ## pages with good quality values
+        pages = np.flatnonzero(normal)
+        page_start, page_end = page_start_times[pages], page_end_times[pages]
+        first, last = first_index[pages], last_index[pages]
+
+        first_normal_time = lookup.index_to_time(first_normal_index[pages])
+        initial_gap_sizes = np.where(page_start < first_normal_time,
+                                     np.floor((first_normal_time - page_start) / MICROSEC_IN_SEC * sampling_freq), 0).astype(np.int64)
+
+        # as _calc_end_gap_size
+        end_is_normal = lookup.is_normal_quality_point(last)
+        qual_entry = lookup.quality_entry_index(last)
+        qual_index, qual_delta_t = lookup.time_to_sample_index(self._data_reader.get_quality_section_start_times(np.maximum(qual_entry, 0)))
+        rel_delta_t = qual_delta_t / MICROSEC_IN_SEC * sampling_freq
+        qual_index = np.where(rel_delta_t - np.floor(rel_delta_t) > 0, qual_index + 1, qual_index)
+        delta_t = np.where(end_is_normal, page_end - lookup.index_to_time(last),
+                           np.where(qual_entry >= 0, page_end - lookup.index_to_time(qual_index), page_end - page_start))
+        float_lengths = np.where(end_is_normal, 0, 1) + delta_t / MICROSEC_IN_SEC * sampling_freq
+        end_gap_sizes = np.floor(float_lengths)
+        end_gap_sizes = np.where(float_lengths - end_gap_sizes == 0, end_gap_sizes - 1, end_gap_sizes).astype(np.int64)
+
+        # sections of the whole signal overlapping each page, clipped to the page
+        section_starts, section_lengths, _, section_frqs = lookup.plan_sections(0, last_value_index)
+        section_ends = section_starts + section_lengths - 1
+        first_section = np.searchsorted(section_ends, first, side='left')
+        counts = np.maximum(np.searchsorted(section_starts, last, side='right') - first_section, 0)
+        page_of_section = np.repeat(np.arange(len(pages)), counts)
+        sections = np.repeat(first_section - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+        starts = np.maximum(section_starts[sections], first[page_of_section])
+        ends = np.minimum(section_ends[sections], last[page_of_section])
+        split = np.cumsum(counts)[:-1]
+        for page, initial_gap_size, end_gap_size, start_indices, lengths, start_times, frequencies in zip(
+                pages.tolist(), initial_gap_sizes.tolist(), end_gap_sizes.tolist(), np.split(starts, split),
+                np.split(ends - starts + 1, split), np.split(lookup.index_to_time(starts), split),
+                np.split(section_frqs[sections], split)):
+            size = calc_stream_length(initial_gap_size, start_times, lengths, frequencies, end_gap_size)
+            plans[page] = size, initial_gap_size, (start_indices, lengths, start_times, frequencies), end_gap_size
+            raw_ranges[page] = int(first_index[page]), int(last_index[page] - first_index[page] + 1)
+
+        ## pages within a gap or of bad quality only, as _calc_page_gap_size
+        pages = np.flatnonzero(gap_only)
+        page_start, page_end = page_start_times[pages], page_end_times[pages]
+        prev_index, _ = lookup.time_to_sample_index(page_start)
+        prev_qual_entry = lookup.quality_entry_index(prev_index)
+        # the quality entry before is looked up the same way as _calc_page_gap_size does
+        last_normal_index = np.where((prev_index >= 0) & lookup.is_normal_quality_point(prev_index), prev_index,
+                                     np.where(prev_qual_entry > 0, lookup.quality_section_end_index(lookup.quality_entry_index(prev_qual_entry - 1)), -1))
+
+        last_normal_time = lookup.index_to_time(np.maximum(last_normal_index, 0))
+        start_offsets = (page_start - last_normal_time) / MICROSEC_IN_SEC * sampling_freq
+        end_offsets = (page_end - last_normal_time) / MICROSEC_IN_SEC * sampling_freq
+        gaps_after_value = (np.floor(end_offsets) - np.floor(start_offsets) + (start_offsets == np.floor(start_offsets))
+                            - (end_offsets == np.floor(end_offsets)))
+
+        first_normal = 0 if lookup.is_normal_quality_point(0) else int(lookup.next_normal_quality_section_index(0))
+        first_normal_time = lookup.index_to_time(first_normal)
+        gaps_before_data = (np.floor((first_normal_time - page_start) / MICROSEC_IN_SEC * sampling_freq)
+                            - np.floor((first_normal_time - page_end) / MICROSEC_IN_SEC * sampling_freq))
+
+        gap_sizes = np.where(last_normal_index >= 0, gaps_after_value, gaps_before_data).astype(np.int64)
+        for page, gap_size in zip(pages.tolist(), gap_sizes.tolist()):
+            plans[page] = max(gap_size, 0), gap_size, None, 0
+
+        return plans, raw_ranges
+
+    def iter_pages(self, page_len_microsec, start_time=None, end_time=None, depth=2):
+        '''returns an iterator over the consecutive pages of the signal, read ahead on a background thread (see ReadAheadPageIterator)'''
+        return ReadAheadPageIterator(self, page_len_microsec, start_time, end_time, depth)
+
+    def plan_data_stream(self, page_start_time, page_len_microsec, load_values=True):
+        '''loads the raw data of the page and returns the plan of its data stream:
+        (number of values, initial gap size, continuous sections, end gap size).
+        The sections are None when the page is empty or all non good quality.
+        The plan is valid until the next page of this signal is loaded.
+        load_values: if false, the values are not read and have to be passed to fill_data_stream by the caller.'''
         self._page_start_time = page_start_time
         self._page_len_microsec = page_len_microsec
         self._page_end_time = page_start_time + page_len_microsec
 
         #print('get_data_stream: ._page_start_time=' + str(self._page_start_time) + ', _page_end_time='+ str(self._page_end_time )) # for debugging
 
-        self._data_reader.load_raw_data_set(page_start_time, page_len_microsec)
-
-        # Create empty output array
-        complete_data = DataStreamClass()
-
+        self._data_reader.load_raw_data_set(page_start_time, page_len_microsec, load_values)
 
         #if self._data_reader.is_empty():
         if self._data_reader.is_empty_or_abnormal():
             size = self._calc_page_gap_size()
-            complete_data.append_NAN_section(size)
+            return max(size, 0), size, None, 0
 
-        else:
-            # period starts before data : take care of by fillining in with NANs
-            size = self._calc_initial_gap_size()
-            complete_data.append_NAN_section(size)
+        # period starts before data : take care of by fillining in with NANs
+        initial_gap_size = self._calc_initial_gap_size()
+        sections = self._data_reader.plan_sections()
+        # period ends after data: take care of by filling in with NANs
+        end_gap_size = self._calc_end_gap_size()
+
+        start_indices, lengths, start_times, frequencies = sections
+        size = calc_stream_length(initial_gap_size, start_times, lengths, frequencies, end_gap_size)
+        return size, initial_gap_size, sections, end_gap_size
+
+    def fill_data_stream(self, plan, out=None, section_values=None):
+        '''writes the data stream planned by plan_data_stream into a single buffer (out when given).
+        section_values(start_index, length) returns the values of a section, by default from the loaded data.'''
+        with instrumentation.timed('stream_fill'):
+            return self._fill_data_stream(plan, out, section_values or self._data_reader.get_section_values)
+
+    def _fill_data_stream(self, plan, out, section_values):
+        size, initial_gap_size, sections, end_gap_size = plan
+
+        # Create empty output array
+        complete_data = DataStreamClass()
+        complete_data.allocate(size, out)
+        complete_data.append_NAN_section(initial_gap_size)
 
-            # Process each continuous section, one at a time
-            for data_sec in self._data_reader:
-                complete_data.append_new_data_section(data_sec)
+        if sections is not None:
+            # Copy each continuous section straight from the loaded data
+            for start_index, length, start_time, sampling_frq in zip(*sections):
+                complete_data.append_section(section_values(start_index, length), start_time, sampling_frq)
 
-            # period ends after data: take care of by filling in with NANs
-            size = self._calc_end_gap_size()
-            complete_data.append_NAN_section(size)
+            complete_data.append_NAN_section(end_gap_size)
 
         return complete_data
 
@@ -636,46 +974,256 @@ class SignalClass:
         return 0
 
 
-class CacheSignalClass:
-    '''Manages tha caching process'''
-    def __init__(self, hdf5_data, signal_name, cache_duration_in_hours):
-        self._cache_duration_microsec = cache_duration_in_hours * 3600 * 1000 * 1000
-        self._signal = SignalClass(hdf5_data, signal_name)
-        self._data_cache = None
-        self._cache_start_time = 0
-        self._sampling_freq  = 0
+def get_abp_signal_name(hdf5_data):
+    '''returns the name of the ABP dataset, "abp" or "art" (None if the file has neither)'''
+    waves = hdf5_data['waves']
+    for name in ('abp', 'art'):
+        if name in waves:
+            return name
+    return None
+
+
+class DualSignalClass:
+    '''reads two signals of a file (by default ICP and ABP, stored as abp or art) together.
+    The streams of a page share one time axis and are written into a single (2, n) array.'''
+    def __init__(self, hdf5_data, signal_names=None, index_sidecar=False):
+        if signal_names is None:
+            abp_name = get_abp_signal_name(hdf5_data)
+            if abp_name is None:
+                raise KeyError("The file has neither an abp nor an art signal")
+            signal_names = ('icp', abp_name)
+        self._signal_names = tuple(signal_names)
+        self._signals = [SignalClass(hdf5_data, name, index_sidecar=index_sidecar) for name in self._signal_names]
+
+        # compared rounded up like the separate reads did, so that rates differing by float noise are accepted
+        frequencies = [signal.get_sampling_freq() for signal in self._signals]
+        if math.ceil(frequencies[0]) != math.ceil(frequencies[1]):
+            raise ValueError(f"Signals {self._signal_names} have different sampling frequencies {frequencies}")
+
+    def get_signal_names(self):
+        return self._signal_names
 
-    def _update_cache(self, start_time):
-        self._data_cache = self._signal.get_data_stream(start_time, self._cache_duration_microsec )
-        self._cache_start_time = self._signal.get_data_start()
-        self._sampling_freq = self._signal.get_sampling_freq()
+    def get_signals(self):
+        return self._signals
+
+    def get_sampling_freq(self):
+        return self._signals[0].get_sampling_freq()
 
     def get_all_data_start_time(self):
-        return self._signal.get_all_data_start_time()
+        return min(signal.get_all_data_start_time() for signal in self._signals)
 
     def get_all_data_end_time(self):
-        return self._signal.get_all_data_end_time()
+        return max(signal.get_all_data_end_time() for signal in self._signals)
+
+    def get_dual_data_stream(self, page_start_time, page_len_microsec, out=None):
+        '''returns the data streams of both signals over the page as one (2, n) array, padded with NANs
+        where a stream is shorter, and the sampling frequency. Both rows start at page_start_time.
+        out: optional (2, m) array with m >= n that the values are written into'''
+        plans = [signal.plan_data_stream(page_start_time, page_len_microsec) for signal in self._signals]
+        size = max(plan[0] for plan in plans)
+
+        if out is None:
+            values = np.empty((2, size))
+        elif out.shape[0] != 2 or out.shape[1] < size:
+            raise ValueError(f"Output buffer of shape {out.shape} cannot hold the (2, {size}) values of the streams")
+        else:
+            values = out[:, :size]
 
-    def get_data_stream(self, page_start_time, page_len_microsec):
+        for row, signal, plan in zip(values, self._signals, plans):
+            stream = signal.fill_data_stream(plan, row)
+            row[len(stream.values):] = np.NaN
+
+        return values, self.get_sampling_freq()
 
-        if (self._data_cache is None)  or (self._cache_start_time > page_start_time) or  (page_start_time + page_len_microsec > self._cache_start_time + self._cache_duration_microsec):
-           self._update_cache(page_start_time)
 
-        first_data_index = round((page_start_time - self._cache_start_time) / MICROSEC_IN_SEC * self._sampling_freq)
-        length = round(page_len_microsec / MICROSEC_IN_SEC * self._sampling_freq)
+class CacheSignalClass:
+    '''Manages tha caching process.
+    The values of every index table block are cached in pages of page_duration_sec from the first value of the block,
+    so that the pages hold whole samples whatever the gaps between the blocks. Requests are planned as
+    SignalClass.get_data_stream plans them and their sections are copied from the pages they span, so the streams
+    are the same. The least recently used pages are evicted before a new page would take the cache over max_cache_bytes
+    (by default cache_duration_in_hours of values), and pages larger than that are not cached at all.'''
+    def __init__(self, hdf5_data, signal_name, cache_duration_in_hours, page_duration_sec=60, max_cache_bytes=None, memmap=False, index_sidecar=False):
+        self._cache_duration_microsec = cache_duration_in_hours * 3600 * 1000 * 1000
+        self._signal = SignalClass(hdf5_data, signal_name, memmap, index_sidecar)
+        self._data_reader = self._signal._data_reader
+        self._sampling_freq  = self._signal.get_sampling_freq()
+        lookup = self._data_reader.get_lookup()
+        self._block_start_index = lookup._block_start_index
+        self._block_end_index = lookup._block_end_index
+        # pages are defined in values so that they stay aligned whatever the sampling frequency
+        self._page_length = max(round(page_duration_sec * self._sampling_freq), 1)
+        if max_cache_bytes is None:
+            max_cache_bytes = round(self._cache_duration_microsec / MICROSEC_IN_SEC * self._sampling_freq) * np.dtype(np.float64).itemsize
+        self._max_cache_bytes = max_cache_bytes
+        self._pages = OrderedDict() # (index table entry, page number in the block) -> values, least recently used first
+        self._cached_bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def _get_page(self, entry, page_number):
+        key = (entry, page_number)
+        values = self._pages.get(key)
+        if values is not None:
+            self._hits += 1
+            instrumentation.count('page_cache_hits')
+            self._pages.move_to_end(key)
+            return values
+
+        self._misses += 1
+        instrumentation.count('page_cache_misses')
+        # the last page of a block ends with the block
+        first_index = self._block_start_index[entry] + page_number * self._page_length
+        length = min(self._page_length, self._block_end_index[entry] + 1 - first_index)
+        values = self._data_reader.read_values(int(first_index), int(length))
+
+        # room is made before the page is added, so the cache never holds more than max_cache_bytes
+        if values.nbytes <= self._max_cache_bytes:
+            self._evict(values.nbytes)
+            self._pages[key] = values
+            self._cached_bytes += values.nbytes
+        return values
+
+    def _get_section_values(self, start_index, length):
+        '''returns the values of a continuous section (within one index table block) from the pages it spans'''
+        entry = int(self._data_reader.get_lookup().index_tbl_entry_index(start_index))
+        offset = start_index - self._block_start_index[entry]
+        first_page = offset // self._page_length
+        last_page = (offset + length - 1) // self._page_length
+        page_offset = offset - first_page * self._page_length
+        if first_page == last_page:
+            return self._get_page(entry, first_page)[page_offset:page_offset+length]
+        parts = [self._get_page(entry, page_number) for page_number in range(first_page, last_page + 1)]
+        parts[0] = parts[0][page_offset:]
+        return np.concatenate(parts)[:length]
+
+    def _evict(self, incoming_bytes):
+        while self._cached_bytes + incoming_bytes > self._max_cache_bytes and self._pages:
+            _, values = self._pages.popitem(last=False)
+            self._cached_bytes -= values.nbytes
+            self._evictions += 1
+
+    def get_cache_stats(self):
+        '''returns the hit, miss and eviction counters and the current size of the cache'''
+        return {
+            "hits": self._hits,
+            "misses": self._misses,
+            "evictions": self._evictions,
+            "pages": len(self._pages),
+            "cached_bytes": self._cached_bytes,
+        }
 
-        if length > len(self._data_cache.values):
-            length = len(self._data_cache.values)
+    def get_all_data_start_time(self):
+        return self._signal.get_all_data_start_time()
+
+    def get_all_data_end_time(self):
+        return self._signal.get_all_data_end_time()
 
-        requested_data = DataStreamClass()
-        requested_data.values = self._data_cache.values[first_data_index:first_data_index+length]
-        requested_data.sampling_frq = self._sampling_freq
-        requested_data.start_time_microsec = page_start_time
+    def get_data_stream(self, page_start_time, page_len_microsec):
+        # planned without reading any values, the sections are then copied from the pages into a new buffer
+        plan = self._signal.plan_data_stream(page_start_time, page_len_microsec, load_values=False)
+        return self._signal.fill_data_stream(plan, section_values=self._get_section_values)
 
-        return requested_data
+    def iter_pages(self, page_len_microsec, start_time=None, end_time=None, depth=2):
+        '''returns an iterator over the consecutive pages of the signal, read ahead on a background thread (see ReadAheadPageIterator)'''
+        return ReadAheadPageIterator(self, page_len_microsec, start_time, end_time, depth)
 
 
+class _ReadAheadError:
+    '''carries an exception of the read-ahead thread to the consumer'''
+    def __init__(self, error):
+        self.error = error
 
+_READ_AHEAD_END = object()
 
+def _put_unless_cancelled(page_queue, item, cancelled):
+    '''waits for room in the queue, returns False if the iteration was cancelled meanwhile'''
+    while not cancelled.is_set():
+        try:
+            page_queue.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+def _read_ahead(signal, page_len_microsec, page_start_times, page_queue, cancelled):
+    '''reads the pages into the queue on the background thread of ReadAheadPageIterator.
+    It does not reference the iterator, so that an abandoned iterator is collected and cancels the thread.'''
+    try:
+        for page_start_time in page_start_times:
+            page = page_start_time, signal.get_data_stream(page_start_time, page_len_microsec).values
+            if not _put_unless_cancelled(page_queue, page, cancelled):
+                return
+    except Exception as error:
+        _put_unless_cancelled(page_queue, _ReadAheadError(error), cancelled)
+        return
+    _put_unless_cancelled(page_queue, _READ_AHEAD_END, cancelled)
+
+class ReadAheadPageIterator:
+    '''iterates over the consecutive pages of a signal while the next pages are read on a background thread.
+    signal is a SignalClass or CacheSignalClass, which must not be used elsewhere until the iteration ends.
+    Every item is (page start time, values of get_data_stream). Up to depth pages wait in a bounded queue,
+    so that reading (and decompressing) the next pages overlaps the processing of the current one.
+    depth=0 reads every page when it is requested, without a thread.
+    An error of the reader thread is raised by the next() call that would have returned the failing page.
+    close(), or leaving a with block, cancels the read-ahead.'''
+    def __init__(self, signal, page_len_microsec, start_time=None, end_time=None, depth=2):
+        self._cancelled = threading.Event()
+        self._finished = False
+        self._queue = None
+        self._thread = None
+        if page_len_microsec <= 0:
+            raise ValueError('page_len_microsec must be positive')
+        if depth < 0:
+            raise ValueError('depth must not be negative')
+        self._signal = signal
+        self._page_len_microsec = page_len_microsec
+        start_time = signal.get_all_data_start_time() if start_time is None else start_time
+        end_time = signal.get_all_data_end_time() if end_time is None else end_time
+        self._page_start_times = iter(np.arange(start_time, end_time, page_len_microsec).tolist())
+        if depth > 0:
+            self._queue = queue.Queue(maxsize=depth)
+            self._thread = threading.Thread(target=_read_ahead, name='ReadAheadPageIterator', daemon=True,
+                                            args=(signal, page_len_microsec, self._page_start_times, self._queue, self._cancelled))
+            self._thread.start()
 
+    def __iter__(self):
+        return self
 
+    def __next__(self):
+        if self._finished:
+            raise StopIteration
+        if self._thread is None:
+            try:
+                page_start_time = next(self._page_start_times)
+            except StopIteration:
+                self._finished = True
+                raise
+            return page_start_time, self._signal.get_data_stream(page_start_time, self._page_len_microsec).values
+
+        item = self._queue.get()
+        if item is _READ_AHEAD_END:
+            self._finished = True
+            raise StopIteration
+        if isinstance(item, _ReadAheadError):
+            self.close()
+            raise item.error
+        return item
+
+    def close(self):
+        '''cancels the read-ahead and waits for the reader thread to stop'''
+        self._finished = True
+        self._cancelled.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __del__(self):
+        self._cancelled.set()
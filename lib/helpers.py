@@ -1,5 +1,7 @@
 import datetime
 
+import numpy as np
+
 
 def format_timedelta(td):
     # Calculate the total number of seconds in the timedelta object
@@ -32,3 +34,76 @@ def str_time_fill_ms(strtime: str):
         ms = splitted[1]
         strtime = f"{splitted[0]}.{ms:0<6}"
     return strtime
+
+ARTF_DATE_FMT = '%d/%m/%Y %H:%M:%S.%f'
+# Widest timestamp in the fixed layout: "dd/mm/YYYY HH:MM:SS.ffffff"
+ARTF_TIME_WIDTH = 26
+ARTF_DIGIT_POSITIONS = [0, 1, 3, 4, 6, 7, 8, 9, 11, 12, 14, 15, 17, 18]
+ARTF_SEPARATORS = {2: "/", 5: "/", 10: " ", 13: ":", 16: ":"}
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def days_from_civil(year, month, day):
+    # Days since 1970-01-01 of a proleptic Gregorian date, works on numpy arrays
+    year = year - (month <= 2)
+    era = year // 400
+    year_of_era = year - era * 400
+    day_of_year = (153 * ((month + 9) % 12) + 2) // 5 + day - 1
+    day_of_era = year_of_era * 365 + year_of_era // 4 - year_of_era // 100 + day_of_year
+    return era * 146097 + day_of_era - 719468
+
+def parse_artf_time(strtime: str) -> int:
+    # Single timestamp through strptime, used for strings outside the fixed layout
+    dt = datetime.datetime.strptime(str_time_fill_ms(strtime), ARTF_DATE_FMT).replace(tzinfo=datetime.timezone.utc)
+    return (dt - EPOCH) // datetime.timedelta(microseconds=1)
+
+def parse_artf_times(strtimes) -> np.ndarray:
+    """Converts ARTF timestamps (%d/%m/%Y %H:%M:%S.%f in UTC, 0-6 fraction digits)
+    to Unix timestamps in microseconds, all at once.
+
+    The digits are read straight from the characters of the strings, strings
+    that do not follow the fixed layout go through strptime (and raise its ValueError)."""
+    text = np.asarray(strtimes, dtype=str).ravel()
+    if text.size == 0:
+        return np.empty(0, dtype=np.int64)
+
+    lengths = np.char.str_len(text)
+    try:
+        raw = text.astype(f"S{ARTF_TIME_WIDTH}")
+    except UnicodeEncodeError:
+        return np.array([parse_artf_time(t) for t in text], dtype=np.int64)
+    chars = raw.view(np.uint8).reshape(text.size, ARTF_TIME_WIDTH).astype(np.int64)
+    digits = chars - ord("0")
+    is_digit = (digits >= 0) & (digits <= 9)
+
+    valid = (lengths >= 19) & (lengths <= ARTF_TIME_WIDTH) & is_digit[:, ARTF_DIGIT_POSITIONS].all(axis=1)
+    for position, separator in ARTF_SEPARATORS.items():
+        valid &= chars[:, position] == ord(separator)
+    valid &= (lengths == 19) | (chars[:, 19] == ord("."))
+    # Fraction digits, the padding after the end of the string counts as 0
+    past_end = np.arange(20, ARTF_TIME_WIDTH) >= lengths[:, None]
+    valid &= (is_digit[:, 20:] | past_end).all(axis=1)
+
+    day = digits[:, 0] * 10 + digits[:, 1]
+    month = digits[:, 3] * 10 + digits[:, 4]
+    year = digits[:, 6] * 1000 + digits[:, 7] * 100 + digits[:, 8] * 10 + digits[:, 9]
+    hour = digits[:, 11] * 10 + digits[:, 12]
+    minute = digits[:, 14] * 10 + digits[:, 15]
+    second = digits[:, 17] * 10 + digits[:, 18]
+    fraction = (np.where(past_end, 0, digits[:, 20:]) * 10 ** np.arange(5, -1, -1)).sum(axis=1)
+
+    # Out of range fields are left to strptime, which rejects them
+    days = days_from_civil(year, month, day)
+    days_in_month = days_from_civil(year + (month == 12), month % 12 + 1, 1) - days_from_civil(year, month, 1)
+    valid &= (month >= 1) & (month <= 12) & (day >= 1) & (day <= days_in_month) & (year >= 1)
+    valid &= (hour <= 23) & (minute <= 59) & (second <= 59)
+
+    result = (((days * 24 + hour) * 60 + minute) * 60 + second) * 1_000_000 + fraction
+    for i in np.flatnonzero(~valid):
+        result[i] = parse_artf_time(text[i])
+    return result
+
+def artf_times_to_datetimes(timestamps) -> list:
+    """Converts Unix timestamps in microseconds to timezone aware (UTC) datetimes."""
+    return [dt.replace(tzinfo=datetime.timezone.utc)
+            for dt in np.asarray(timestamps, dtype=np.int64).astype("datetime64[us]").tolist()]
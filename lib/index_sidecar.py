@@ -0,0 +1,165 @@
+"""
+Per-recording index sidecar.
+
+The index and quality tables of every signal of an HDF5 recording, and the
+arrays derived from them, stored as flat NumPy arrays in one small `.npz`
+file next to the recording. The sidecar is valid as long as the HDF5 file
+keeps its size and modification time, so a cold start costs one `np.load`
+instead of reading and converting the tables of every signal.
+
+"""
+
+
+import os
+import zipfile
+from typing import Dict, Iterable, Optional
+
+import h5py
+import numpy as np
+
+from . import instrumentation
+from .hdf5_reader_module import (INDEX_TABLE_FRQ, INDEX_TABLE_INDEX, INDEX_TABLE_LENGTH, INDEX_TABLE_TIME,
+                                 TableLookupClass, get_table_column)
+
+
+SIDECAR_SUFFIX = ".index.npz"
+SIDECAR_VERSION = 2
+
+
+def sidecar_path(hdf5_path: str) -> str:
+    """Returns the path of the sidecar of an HDF5 file, `<file>.hdf5.index.npz`."""
+    return f"{hdf5_path}{SIDECAR_SUFFIX}"
+
+
+def _signature(hdf5_path: str) -> np.ndarray:
+    stat = os.stat(hdf5_path)
+    return np.array([stat.st_size, stat.st_mtime_ns, SIDECAR_VERSION], dtype=np.int64)
+
+
+def build_signal_index(hdf: h5py.File, signal: str) -> Dict[str, np.ndarray]:
+    """Reads the index and quality tables of a signal and derives the flat arrays of the sidecar.
+
+    Args:
+        hdf (h5py.File): The open HDF5 file.
+        signal (str): Name of the signal dataset in `waves`.
+
+    Returns:
+        Dict[str, np.ndarray]: The raw `index` and `quality` tables, the per-block `start_indices`, `start_times`,
+        `lengths` and `frequencies`, the number of samples `n_samples` and the number of good quality samples
+        `normal_samples` (of the normal quality sections, see TableLookupClass.plan_sections).
+    """
+    waves = hdf["waves"]
+    index_table = waves.get(f"{signal}.index")
+    index_table = np.array(index_table if index_table is not None else waves[signal].attrs["index"])
+    quality_table = waves.get(f"{signal}.quality")
+    if quality_table is None:
+        quality_table = waves[signal].attrs.get("quality")
+    quality_table = np.array(quality_table) if quality_table is not None else np.empty((0, 2))
+
+    arrays = {
+        "index": index_table,
+        "quality": quality_table,
+        "start_indices": get_table_column(index_table, INDEX_TABLE_INDEX).astype(np.int64),
+        "start_times": get_table_column(index_table, INDEX_TABLE_TIME).astype(np.int64),
+        "lengths": get_table_column(index_table, INDEX_TABLE_LENGTH).astype(np.int64),
+        "frequencies": get_table_column(index_table, INDEX_TABLE_FRQ).astype(np.float64),
+        "n_samples": np.array(waves[signal].shape[0], dtype=np.int64),
+    }
+
+    if len(quality_table) and len(index_table):
+        lookup = TableLookupClass(index_table, quality_table)
+        _, normal_lengths, _, _ = lookup.plan_sections(0, lookup.get_last_value_index())
+        arrays["normal_samples"] = np.array(np.sum(normal_lengths), dtype=np.int64)
+    else:
+        arrays["normal_samples"] = np.array(0, dtype=np.int64)
+    return arrays
+
+
+def write_sidecar(hdf5_path: str) -> str:
+    """Builds the index of every signal of the recording and writes it next to the HDF5 file.
+
+    Returns:
+        str: Path of the written sidecar.
+    """
+    signature = _signature(hdf5_path)
+    entries = {"signature": signature}
+    instrumentation.count("sidecar_writes")
+    with h5py.File(hdf5_path, "r") as hdf:
+        instrumentation.count("hdf5_opens")
+        signals = [name for name in hdf["waves"] if "." not in name] if "waves" in hdf else []
+        for signal in signals:
+            for name, array in build_signal_index(hdf, signal).items():
+                entries[f"{signal}.{name}"] = array
+    entries["signals"] = np.array(signals, dtype=str)
+
+    path = sidecar_path(hdf5_path)
+    # written under a temporary name first, so that concurrent readers never see a partial file
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            np.savez(f, **entries)
+        os.replace(tmp_path, path)
+    finally:
+        # left behind only if writing or renaming failed, e.g. on a full disk
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return path
+
+
+def load_sidecar(hdf5_path: str, signals: Optional[Iterable[str]] = None,
+                 names: Optional[Iterable[str]] = None) -> Optional[Dict[str, Dict[str, np.ndarray]]]:
+    """Loads the sidecar of an HDF5 file if it matches the file's current size and modification time.
+
+    Only the requested arrays are read, so loading the few columns of one signal stays cheap.
+
+    Args:
+        hdf5_path (str): Path to the HDF5 file.
+        signals (Optional[Iterable[str]]): Signals to load, the ones missing in the file are skipped. Default is all.
+        names (Optional[Iterable[str]]): Arrays of build_signal_index to load for every signal. Default is all.
+
+    Returns:
+        Optional[Dict[str, Dict[str, np.ndarray]]]: The arrays keyed by signal name,
+        or None if the sidecar is missing, stale or unreadable.
+    """
+    try:
+        with np.load(sidecar_path(hdf5_path)) as sidecar:
+            if not np.array_equal(sidecar["signature"], _signature(hdf5_path)):
+                return None
+            available = sidecar["signals"].tolist()
+            selected = available if signals is None else [signal for signal in signals if signal in available]
+            keys = set(sidecar.files)
+            result: Dict[str, Dict[str, np.ndarray]] = {}
+            for signal in selected:
+                prefix = f"{signal}."
+                signal_names = [key[len(prefix):] for key in sidecar.files if key.startswith(prefix)] if names is None else names
+                result[signal] = {name: sidecar[f"{prefix}{name}"] for name in signal_names if f"{prefix}{name}" in keys}
+            return result
+    except (OSError, KeyError, ValueError, EOFError, zipfile.BadZipFile):
+        # a missing, truncated or otherwise unreadable sidecar is rebuilt
+        return None
+
+
+def get_sidecar(hdf5_path: str, signals: Optional[Iterable[str]] = None, names: Optional[Iterable[str]] = None,
+                write: bool = True) -> Optional[Dict[str, Dict[str, np.ndarray]]]:
+    """Loads the sidecar of an HDF5 file (see load_sidecar), (re)writing it first if it is missing or stale.
+
+    Args:
+        hdf5_path (str): Path to the HDF5 file.
+        signals (Optional[Iterable[str]]): Signals to load. Default is all.
+        names (Optional[Iterable[str]]): Arrays of build_signal_index to load for every signal. Default is all.
+        write (bool): If false, a missing or stale sidecar is not written and None is returned.
+
+    Returns:
+        Optional[Dict[str, Dict[str, np.ndarray]]]: The arrays of build_signal_index keyed by signal name,
+        or None if there is no valid sidecar and it could not be written (e.g. read-only data folder, full disk).
+    """
+    signals = None if signals is None else list(signals)
+    sidecar = load_sidecar(hdf5_path, signals, names)
+    instrumentation.count("sidecar_hits" if sidecar is not None else "sidecar_misses")
+    if sidecar is None and write:
+        try:
+            write_sidecar(hdf5_path)
+        except OSError:
+            return None
+        sidecar = load_sidecar(hdf5_path, signals, names)
+    return sidecar
@@ -0,0 +1,179 @@
+"""
+Opt-in I/O and timing instrumentation.
+
+The readers and extractors of `lib` count the HDF5 files they open, the h5py (or memory map) reads with the samples
+and bytes read, the ARTF parses, the cache hits and misses, and time their phases (ARTF parsing, index loading,
+HDF5 reads, NaN replacement, segment building, stream filling). Nothing is recorded unless a Recorder is active,
+and the hooks then return after testing a module level list, so the instrumentation costs close to nothing when off.
+The recorders may be shared by threads (e.g. a ThreadPoolExecutor over SingleFileExtractor instances), a module level
+lock guards the list of active recorders and their counters.
+
+Example usage:
+>>> with Recorder() as recorder:
+...     SingleFileExtractor(FILE_PATH, "abp").get_anomalies()
+>>> recorder.stats()
+{'counters': {'hdf5_opens': 2, 'h5py_reads': 12, ...}, 'timings': {'artf_parse': 0.02, 'hdf5_read': 0.31, ...}}
+
+>>> recorder = Recorder(callback=send_to_metrics).start()  # callback gets the stats when the recorder stops
+>>> FolderExtractor(FOLDER_PATH, "abp", workers=8).extract_all()  # worker processes report back to the recorder
+>>> recorder.stop()
+
+"""
+
+
+import threading
+import time
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional
+
+
+StatsDict = Dict[str, Dict[str, float]]
+
+# Recorders currently recording, innermost last
+_active: List["Recorder"] = []
+# Guards _active and the counters and timings of the recorders, reentrant as Recorder.merge is called under it
+_lock = threading.RLock()
+
+
+class Recorder:
+    """Collects the counters and phase timings recorded while it is active.
+
+    Recorders can be nested, every active recorder receives all counts.
+    Phases may nest as well (e.g. `hdf5_read` within `index_load`), so the timings do not add up to the wall time.
+
+    Attributes:
+        callback (Optional[Callable[[StatsDict], None]]): Called with the stats when the recorder stops.
+    """
+
+    def __init__(self, callback: Optional[Callable[[StatsDict], None]] = None) -> None:
+        self.callback = callback
+        self._counters: Dict[str, int] = defaultdict(int)
+        self._timings: Dict[str, float] = defaultdict(float)
+
+    def start(self) -> "Recorder":
+        """Starts recording, returns the recorder itself."""
+        with _lock:
+            if self not in _active:
+                _active.append(self)
+        return self
+
+    def stop(self) -> StatsDict:
+        """Stops recording and passes the stats to the callback.
+
+        Returns:
+            StatsDict: The recorded stats, see stats().
+        """
+        with _lock:
+            if self in _active:
+                _active.remove(self)
+        stats = self.stats()
+        if self.callback is not None:
+            self.callback(stats)
+        return stats
+
+    def __enter__(self) -> "Recorder":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    @property
+    def active(self) -> bool:
+        return self in _active
+
+    def stats(self, reset: bool = False) -> StatsDict:
+        """Returns a copy of the recorded counters and timings (in seconds).
+
+        Args:
+            reset (bool): If true, the counters and timings start from zero again, e.g. to ship deltas periodically.
+
+        Returns:
+            StatsDict: {"counters": {name: count}, "timings": {phase: seconds}}.
+        """
+        with _lock:
+            stats = {"counters": dict(self._counters), "timings": dict(self._timings)}
+            if reset:
+                self.reset()
+        return stats
+
+    def reset(self) -> None:
+        with _lock:
+            self._counters.clear()
+            self._timings.clear()
+
+    def merge(self, stats: StatsDict) -> None:
+        """Adds the stats of another recorder, e.g. one of a worker process."""
+        with _lock:
+            for name, value in stats["counters"].items():
+                self._counters[name] += value
+            for name, value in stats["timings"].items():
+                self._timings[name] += value
+
+
+class _Timer:
+    """Adds the time spent in a `with` block to a phase of the active recorders."""
+    __slots__ = ("_name", "_began")
+
+    def __init__(self, name: str) -> None:
+        self._name = name
+
+    def __enter__(self) -> None:
+        self._began = time.perf_counter()
+
+    def __exit__(self, *exc_info) -> None:
+        elapsed = time.perf_counter() - self._began
+        with _lock:
+            for recorder in _active:
+                recorder._timings[self._name] += elapsed
+
+
+class _NullTimer:
+    """Stands in for _Timer when nothing is recorded."""
+    __slots__ = ()
+
+    def __enter__(self) -> None:
+        pass
+
+    def __exit__(self, *exc_info) -> None:
+        pass
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def is_enabled() -> bool:
+    """Tells whether a recorder is active."""
+    return bool(_active)
+
+
+def count(name: str, value: int = 1) -> None:
+    """Adds `value` to the counter `name` of the active recorders."""
+    if _active:
+        with _lock:
+            for recorder in _active:
+                recorder._counters[name] += value
+
+
+def count_read(array, reader: str = "h5py") -> None:
+    """Counts one read of `array` from an HDF5 file: the read call, its samples and bytes.
+
+    Args:
+        array (np.ndarray): The values read.
+        reader (str): "h5py" or "memmap", the counter of the read calls is `<reader>_reads`.
+    """
+    if _active:
+        count(f"{reader}_reads")
+        count("samples_read", array.size)
+        count("bytes_read", array.nbytes)
+
+
+def timed(name: str):
+    """Returns a context manager adding the time spent in it to the phase `name` of the active recorders."""
+    return _Timer(name) if _active else _NULL_TIMER
+
+
+def merge(stats: StatsDict) -> None:
+    """Adds stats recorded elsewhere (e.g. in a worker process) to the active recorders."""
+    with _lock:
+        for recorder in _active:
+            recorder.merge(stats)
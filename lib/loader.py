@@ -8,19 +8,41 @@ More information at odas.ujep.cz
 """
 
 
-import datetime
 import os
 import re
-import xml.etree.ElementTree as ET
-from dataclasses import dataclass, field
+from dataclasses import dataclass, field, fields
 from pathlib import Path
-from typing import Dict, List, Tuple, Set
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, Set, Union
 import json
 import csv
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 
 import h5py
 import numpy as np
 
+from .hdf5_reader_module import (INDEX_TABLE_FRQ, INDEX_TABLE_INDEX, INDEX_TABLE_LENGTH, INDEX_TABLE_TIME,
+                                 TableLookupClass, get_table_column, memmap_dataset)
+from .index_sidecar import get_sidecar
+from . import instrumentation
+from .readers import ARTFReader
+
+
+WINDOW_SIZE_SEC = 10
+# Arrays of the index sidecar a Signal is built from (see index_sidecar.build_signal_index)
+SIGNAL_SIDECAR_ARRAYS = ("start_indices", "start_times", "lengths", "frequencies", "n_samples", "quality", "normal_samples")
+
+# Datasets of the 'hdf5' export format: name, dtype and chunk length
+EXPORT_HDF5_COLUMNS = [
+    ("data", np.float64, 65536),
+    ("offsets", np.int64, 4096),
+    ("lengths", np.int64, 4096),
+    ("start_time", np.int64, 4096),
+    ("end_time", np.int64, 4096),
+    ("label", np.int8, 4096),
+    ("frequency", np.float64, 4096),
+]
+
 
 class EmptySegment(Exception):
     """Custom exception raised when a segment is found to be empty."""
@@ -32,6 +54,14 @@ class FrequencyMismatchError(Exception):
     pass
 
 
+class ExtractionError(Exception):
+    """Custom exception raised when the extraction of a file of a folder fails, naming the file.
+
+    The original exception is chained as `__cause__`.
+    """
+    pass
+
+
 @dataclass
 class Segment:
     """Represents a segment of data with start and end times, and associated data.
@@ -44,6 +74,8 @@ class Segment:
         patient_id (str): The patient ID associated with the segment.
         frequency (float): Frequency information pulled from the index of the HDF5 file. Default is 0.0.
         data (np.ndarray): Data values associated with the segment. Default is an empty array.
+                           Segments extracted in lazy mode hold a read-only view of the loaded data instead,
+                           or concatenate their data slices on first access when they span several blocks.
     """
     start_time: int
     end_time: int
@@ -53,6 +85,227 @@ class Segment:
     frequency: float = field(default=0.0)
     data: np.ndarray = field(default_factory=lambda: np.array([]))
 
+    def set_lazy_data(self, data_slices: List[np.ndarray]) -> None:
+        """Defers concatenating the data slices until `data` is first accessed."""
+        self.__dict__.pop("data", None)
+        self._data_slices = data_slices
+
+    def __getattr__(self, name: str):
+        # Only reached when `data` was deferred by set_lazy_data and has not been accessed yet
+        if name == "data" and "_data_slices" in self.__dict__:
+            self.data = np.concatenate(self.__dict__.pop("_data_slices"))
+            return self.data
+        raise AttributeError(f"'{type(self).__name__}' object has no attribute '{name}'")
+
+
+@dataclass
+class SegmentArray:
+    """Segments stacked into one matrix with parallel per-segment arrays.
+
+    Attributes:
+        data (np.ndarray): Segment values of shape (n_segments, row length). Rows of segments shorter
+                           than the row are padded, see `lengths`.
+        lengths (np.ndarray): Number of values of each segment. The values of segment i are data[i, :lengths[i]]
+                              unless a row length shorter than the segment was requested, which keeps its first values.
+        labels (np.ndarray): 1 for anomalous and 0 for normal segments.
+        start_times (np.ndarray): Start times of the segments as Unix timestamps in microseconds.
+        patient_ids (np.ndarray): Patient IDs of the segments.
+        frequency (float): Sampling frequency of the segments. Default is 0.0.
+    """
+    data: np.ndarray
+    lengths: np.ndarray
+    labels: np.ndarray
+    start_times: np.ndarray
+    patient_ids: np.ndarray
+    frequency: float = field(default=0.0)
+
+    @staticmethod
+    def concatenate(arrays: List["SegmentArray"], pad_value: float = np.nan) -> "SegmentArray":
+        """Stacks the segments of several arrays into one, padding the shorter rows with `pad_value`."""
+        row_length = max((array.data.shape[1] for array in arrays), default=0)
+        return SegmentArray(
+            data=np.concatenate([np.pad(array.data, ((0, 0), (0, row_length - array.data.shape[1])), constant_values=pad_value)
+                                 for array in arrays]),
+            lengths=np.concatenate([array.lengths for array in arrays]),
+            labels=np.concatenate([array.labels for array in arrays]),
+            start_times=np.concatenate([array.start_times for array in arrays]),
+            patient_ids=np.concatenate([array.patient_ids for array in arrays]),
+            frequency=next((array.frequency for array in arrays if array.frequency), 0.0),
+        )
+
+
+@dataclass
+class SegmentTable:
+    """Segments stored column-wise, a compact alternative to a list of Segment objects.
+
+    The values of all segments share one `data` buffer, the values of row i are
+    data[offsets[i]:offsets[i] + lengths[i]]. File paths and patient IDs are stored once,
+    rows refer to them by their position in `files` and `patient_ids`.
+
+    Attributes:
+        start_time (np.ndarray): Start times of the segments as Unix timestamps in microseconds (int64).
+        end_time (np.ndarray): End times of the segments as Unix timestamps in microseconds (int64).
+        empty (np.ndarray): Whether the segments contain data or not (bool).
+        frequency (np.ndarray): Frequencies of the segments (float64).
+        label (np.ndarray): 1 for anomalous and 0 for normal segments (int8).
+        file_code (np.ndarray): Index of the file of each segment in `files` (int32).
+        patient_code (np.ndarray): Index of the patient of each segment in `patient_ids` (int32).
+        offsets (np.ndarray): Start of the values of each segment in `data` (int64).
+        lengths (np.ndarray): Number of values of each segment (int64).
+        data (np.ndarray): Shared buffer with the values of the segments.
+        files (np.ndarray): Full paths of the HDF5 files the segments were extracted from.
+        patient_ids (np.ndarray): Patient IDs of the segments.
+
+    Example usage:
+    >>> table = FolderExtractor(FOLDER_PATH, "abp").get_segment_table()
+    >>> anomalies = table.filter(table.label == 1)
+    >>> per_patient = table.group_by_patient()
+    """
+    start_time: np.ndarray
+    end_time: np.ndarray
+    empty: np.ndarray
+    frequency: np.ndarray
+    label: np.ndarray
+    file_code: np.ndarray
+    patient_code: np.ndarray
+    offsets: np.ndarray
+    lengths: np.ndarray
+    data: np.ndarray
+    files: np.ndarray
+    patient_ids: np.ndarray
+
+    # Per-segment columns, selected together by filter and concatenate
+    ROW_COLUMNS = ("start_time", "end_time", "empty", "frequency", "label", "file_code", "patient_code", "offsets", "lengths")
+
+    def __len__(self) -> int:
+        return self.start_time.shape[0]
+
+    def get_data(self, row: int) -> np.ndarray:
+        """Returns the values of the segment in `row` (a view of the shared buffer)."""
+        return self.data[self.offsets[row]:self.offsets[row] + self.lengths[row]]
+
+    @property
+    def file(self) -> np.ndarray:
+        """Returns the file path of every segment."""
+        return self.files[self.file_code]
+
+    @property
+    def patient_id(self) -> np.ndarray:
+        """Returns the patient ID of every segment."""
+        return self.patient_ids[self.patient_code]
+
+    def filter(self, rows: np.ndarray) -> "SegmentTable":
+        """Selects rows by a boolean mask or an index array. The data buffer is shared, see compact."""
+        return SegmentTable(**{name: getattr(self, name)[rows] for name in self.ROW_COLUMNS},
+                            data=self.data, files=self.files, patient_ids=self.patient_ids)
+
+    def compact(self) -> "SegmentTable":
+        """Copies the values of the selected rows into a new buffer, dropping values no row refers to."""
+        row_offsets = np.cumsum(self.lengths) - self.lengths
+        # position of every kept value in the old buffer
+        positions = np.repeat(self.offsets - row_offsets, self.lengths) + np.arange(int(self.lengths.sum()))
+        table = self.filter(slice(None))
+        table.data, table.offsets = self.data[positions], row_offsets
+        return table
+
+    def group_by_patient(self) -> Dict[str, "SegmentTable"]:
+        """Splits the table by patient ID, keeping the row order within each patient."""
+        return {patient_id: self.filter(self.patient_code == code)
+                for code, patient_id in enumerate(self.patient_ids.tolist())
+                if np.any(self.patient_code == code)}
+
+    def to_segments(self) -> List[Segment]:
+        """Creates Segment objects of the rows, their data are views of the shared buffer."""
+        files, patient_ids = self.files.tolist(), self.patient_ids.tolist()
+        return [Segment(start_time=start_time, end_time=end_time, empty=empty, file=files[file_code],
+                        patient_id=patient_ids[patient_code], frequency=frequency,
+                        data=self.data[offset:offset + length])
+                for start_time, end_time, empty, frequency, file_code, patient_code, offset, length
+                in zip(self.start_time.tolist(), self.end_time.tolist(), self.empty.tolist(), self.frequency.tolist(),
+                       self.file_code.tolist(), self.patient_code.tolist(), self.offsets.tolist(), self.lengths.tolist())]
+
+    @staticmethod
+    def from_segments(segments: List[Segment], label: int = 0) -> "SegmentTable":
+        """Builds a table from Segment objects, all rows get `label`."""
+        files, file_code = np.unique(np.array([segment.file for segment in segments], dtype=str), return_inverse=True)
+        patient_ids, patient_code = np.unique(np.array([segment.patient_id for segment in segments], dtype=str),
+                                              return_inverse=True)
+        values = [np.asarray(segment.data) for segment in segments]
+        lengths = np.array([value.shape[0] for value in values], dtype=np.int64)
+        return SegmentTable(
+            start_time=np.array([segment.start_time for segment in segments], dtype=np.int64),
+            end_time=np.array([segment.end_time for segment in segments], dtype=np.int64),
+            empty=np.array([segment.empty for segment in segments], dtype=bool),
+            frequency=np.array([segment.frequency for segment in segments], dtype=np.float64),
+            label=np.full(len(segments), label, dtype=np.int8),
+            file_code=file_code.astype(np.int32),
+            patient_code=patient_code.astype(np.int32),
+            offsets=np.cumsum(lengths) - lengths,
+            lengths=lengths,
+            data=np.concatenate(values) if values else np.array([]),
+            files=files,
+            patient_ids=patient_ids,
+        )
+
+    @staticmethod
+    def concatenate(tables: List["SegmentTable"]) -> "SegmentTable":
+        """Joins the rows of several tables, merging their file and patient lists."""
+        if not tables:
+            return SegmentTable.from_segments([])
+
+        files, file_codes = np.unique(np.concatenate([table.files for table in tables]), return_inverse=True)
+        patient_ids, patient_codes = np.unique(np.concatenate([table.patient_ids for table in tables]),
+                                               return_inverse=True)
+        columns = {name: np.concatenate([getattr(table, name) for table in tables]) for name in SegmentTable.ROW_COLUMNS}
+
+        # remap the codes of every table and move its offsets behind the buffers before it
+        file_start, patient_start, data_start = 0, 0, 0
+        remapped_files, remapped_patients, offsets = [], [], []
+        for table in tables:
+            remapped_files.append(file_codes[file_start:file_start + len(table.files)][table.file_code])
+            remapped_patients.append(patient_codes[patient_start:patient_start + len(table.patient_ids)][table.patient_code])
+            offsets.append(table.offsets + data_start)
+            file_start += len(table.files)
+            patient_start += len(table.patient_ids)
+            data_start += table.data.shape[0]
+
+        columns["file_code"] = np.concatenate(remapped_files).astype(np.int32)
+        columns["patient_code"] = np.concatenate(remapped_patients).astype(np.int32)
+        columns["offsets"] = np.concatenate(offsets)
+        return SegmentTable(**columns, data=np.concatenate([table.data for table in tables]),
+                            files=files, patient_ids=patient_ids)
+
+
+
+@dataclass
+class RecordingMetadata:
+    """Summary of one signal of a recording, computed from the index and quality tables and the ARTF file only.
+
+    Attributes:
+        file (str): Full path to the HDF5 file.
+        signal (str): Name of the signal dataset ("abp", "art" or "icp").
+        frequency (float): Sampling frequency of the first index block.
+        n_blocks (int): Number of index table blocks (continuous sections).
+        n_samples (int): Number of samples stored in the dataset.
+        start_time (int): Time of the first sample as a Unix timestamp in microseconds.
+        end_time (int): End of the last block as a Unix timestamp in microseconds.
+        duration_sec (float): Duration of the recorded samples in seconds, gaps excluded.
+        good_quality_fraction (float): Fraction of the indexed samples of normal quality, NaN without a quality table.
+        n_anomalies (int): Number of anomalous windows with data.
+        n_normal (int): Number of normal windows with data.
+    """
+    file: str
+    signal: str
+    frequency: float
+    n_blocks: int
+    n_samples: int
+    start_time: int
+    end_time: int
+    duration_sec: float
+    good_quality_fraction: float
+    n_anomalies: int = field(default=0)
+    n_normal: int = field(default=0)
+
 
 class Signal:
     """Handles the loading and processing of signal data from HDF5 files.
@@ -62,79 +315,150 @@ class Signal:
         artf_path (str): Path to the ARTF file. Must end with ".artf".
         mode (str): The mode to use for extracting data from the HDF5 file. Either "abp" or "icp".
         skip_empty (bool): If true, skips empty segments without raising an EmptySegment exception.
+        lazy (bool): If true, segments reference the loaded data blocks instead of holding copies.
+        index_sidecar (bool): If true, the index and quality tables are read from the index sidecar next to the HDF5 file,
+                              which is written first if it is missing or older than the file.
+        memmap (bool): If true, contiguous uncompressed datasets are read through a read-only memory map of the file,
+                       so the loaded blocks are views of the OS page cache. Other datasets are read through h5py.
     """
 
-    def __init__(self, file_path: str, artf_path: str, mode: str, skip_empty: bool = False) -> None:
+    def __init__(self, file_path: str, artf_path: str, mode: str, skip_empty: bool = False, lazy: bool = False, index_sidecar: bool = False, memmap: bool = False) -> None:
         self._file_path = file_path
         self._artf_path = artf_path
         self._mode = mode.lower()
         self._skip_empty = skip_empty
+        self._lazy = lazy
+        self._memmap = memmap
 
         if self._mode not in ["abp", "icp"]:
             raise ValueError("Invalid signal mode. Must be either 'abp' or 'icp'.")
 
-        self._index_data = self._load_index_data()
-        self._start_times = np.array(
-            [item["starttime"] for item in self._index_data], dtype=np.int64)
-        self._frequencies = np.array(
-            [item["frequency"] for item in self._index_data], dtype=np.float64)
-        self._lengths = np.array([item["length"]
-                                  for item in self._index_data], dtype=np.int64)
+        with instrumentation.timed("index_load"):
+            # Index tables of the sidecar next to the HDF5 file, None if the tables are read from the file itself
+            self._sidecar_index: Optional[Dict[str, np.ndarray]] = self._load_sidecar_index() if index_sidecar else None
+            if self._sidecar_index is not None:
+                self._start_times = self._sidecar_index["start_times"]
+                self._frequencies = self._sidecar_index["frequencies"]
+                self._lengths = self._sidecar_index["lengths"]
+                self._start_indices = self._sidecar_index["start_indices"]
+            else:
+                index_data = self._load_index_data()
+                self._start_times = get_table_column(index_data, INDEX_TABLE_TIME).astype(np.int64)
+                self._frequencies = get_table_column(index_data, INDEX_TABLE_FRQ).astype(np.float64)
+                self._lengths = get_table_column(index_data, INDEX_TABLE_LENGTH).astype(np.int64)
+                self._start_indices = get_table_column(index_data, INDEX_TABLE_INDEX).astype(np.int64)
         self._intervals = (1_000_000 / self._frequencies).astype(np.int64)
-        self._data: Dict[Tuple[int, int], np.ndarray] = {}
+        self._end_times = self._start_times + self._lengths * self._intervals
+        # Running maximum of the end times, sorted even if blocks overlap, for binary search of overlaps
+        self._max_end_times = np.maximum.accumulate(self._end_times)
+        # False if a block ends before an earlier one, e.g. a short block within a longer one
+        self._end_times_sorted = bool(np.all(self._end_times[1:] >= self._end_times[:-1]))
+        # Loaded blocks keyed by their position in the (start time sorted) index table
+        self._data: Dict[int, np.ndarray] = {}
 
     def _load_index_data(self) -> np.ndarray:
-        """Loads the index data from the HDF5 file.
+        """Loads the index table from the HDF5 file.
 
         Returns:
-            np.ndarray: The index data loaded from the HDF5 file.
+            np.ndarray: The index table (startidx, starttime, length, frequency) loaded from the HDF5 file.
         """
         try:
             with h5py.File(self._file_path, 'r') as hdf:
+                instrumentation.count("hdf5_opens")
                 if self._mode == "abp" and hdf.get(f"waves/art"):
                     self._mode = "art"
 
                 index_data = hdf.get(f"waves/{self._mode}.index")
                 if index_data is None:
                     index_data = hdf[f"waves/{self._mode}"].attrs["index"]
-                index_data = np.array(
-                    [dict(zip(["startidx", "starttime", "length", "frequency"], item)) for item in index_data]
-                )
+                return np.array(index_data)
+
+        except FileNotFoundError:
+            raise FileNotFoundError("No such file or the file is missing an extension.")
 
-            return index_data
+    def _load_sidecar_index(self) -> Optional[Dict[str, np.ndarray]]:
+        """Loads the index tables of the signal from the index sidecar, (re)writing the sidecar if it is missing or stale.
 
+        Returns:
+            Optional[Dict[str, np.ndarray]]: The arrays of index_sidecar.build_signal_index, or None if there is
+            no usable sidecar or the file has no such signal.
+        """
+        try:
+            signals = get_sidecar(self._file_path, ["art", self._mode] if self._mode == "abp" else [self._mode],
+                                  SIGNAL_SIDECAR_ARRAYS) or {}
         except FileNotFoundError:
             raise FileNotFoundError("No such file or the file is missing an extension.")
 
+        if self._mode == "abp" and "art" in signals:
+            self._mode = "art"
+        return signals.get(self._mode)
+
     def prepare_data_for_segments(self, segments: List[Segment]) -> None:
         """Loads data for the specified segments and assigns frequency to them.
 
         Args:
             segments (List[Segment]): The list of segments to load data for.
         """
-        try:
-            with h5py.File(self._file_path, 'r') as hdf:
-                all_data = hdf[f"waves/{self._mode}"]
-                for segment in segments:
-                    start_idx = np.searchsorted(
-                        self._start_times, segment.start_time, side="right") - 1
-                    end_idx = np.searchsorted(
-                        self._start_times, segment.end_time, side="left")
-
-                    for idx in range(start_idx, end_idx):
-                        data_range_start = self._start_times[idx]
-                        data_range_end = data_range_start + \
-                            self._lengths[idx] * self._intervals[idx]
-
-                        if (data_range_start, data_range_end) not in self._data:
-                            self._data[(data_range_start, data_range_end)] = all_data[
-                                self._index_data[idx]["startidx"]:self._index_data[idx]["startidx"] +
-                                self._lengths[idx]
-                            ]
-
-                    segment.frequency = self._frequencies[idx]
-        except FileNotFoundError:
-            raise FileNotFoundError("No such file or the file is missing an extension.")
+        start_times = np.array([segment.start_time for segment in segments], dtype=np.int64)
+        end_times = np.array([segment.end_time for segment in segments], dtype=np.int64)
+        for segment, frequency in zip(segments, self.prepare_data_for_windows(start_times, end_times)):
+            segment.frequency = frequency
+
+    def prepare_data_for_windows(self, start_times: np.ndarray, end_times: np.ndarray) -> np.ndarray:
+        """Loads the data blocks of the specified windows, in file order.
+
+        Args:
+            start_times (np.ndarray): Start times of the windows (int64 Unix timestamps in microseconds).
+            end_times (np.ndarray): End times of the windows.
+
+        Returns:
+            np.ndarray: The frequency of every window, that of the last block starting before its end.
+        """
+        n_blocks = len(self._start_times)
+        if n_blocks == 0:
+            return np.zeros(len(start_times))
+        first_idx = np.maximum(np.searchsorted(self._start_times, start_times, side="right") - 1, 0)
+        end_idx = np.searchsorted(self._start_times, end_times, side="left")
+
+        # Blocks needed by any window, marked through a difference array
+        coverage = np.zeros(n_blocks + 1, dtype=np.int64)
+        valid = first_idx < end_idx
+        np.add.at(coverage, first_idx[valid], 1)
+        np.add.at(coverage, end_idx[valid], -1)
+        needed = np.flatnonzero(np.cumsum(coverage[:-1]) > 0)
+        needed = [idx for idx in needed.tolist() if idx not in self._data]
+
+        if needed:
+            try:
+                with h5py.File(self._file_path, 'r') as hdf:
+                    instrumentation.count("hdf5_opens")
+                    all_data = hdf[f"waves/{self._mode}"]
+                    mapped_data = memmap_dataset(all_data) if self._memmap else None
+                    for idx in needed:
+                        self._data[idx] = self._load_block(all_data if mapped_data is None else mapped_data, idx)
+            except FileNotFoundError:
+                raise FileNotFoundError("No such file or the file is missing an extension.")
+
+        return self._frequencies[np.maximum(end_idx - 1, 0)]
+
+    def _load_block(self, data: object, idx: int) -> np.ndarray:
+        """Reads an index block from the HDF5 dataset or its memory map, with NaNs replaced by -99999.
+
+        Args:
+            data (object): The h5py dataset or the read-only memory map of it (see memmap_dataset).
+            idx (int): Position of the block in the index table.
+
+        Returns:
+            np.ndarray: The values of the block. A view of the memory map unless it contains NaNs.
+        """
+        with instrumentation.timed("hdf5_read"):
+            block = data[self._start_indices[idx]:self._start_indices[idx] + self._lengths[idx]]
+        instrumentation.count_read(block, "h5py" if isinstance(data, h5py.Dataset) else "memmap")
+        # Replace NaNs once per block so that segments can share the block
+        with instrumentation.timed("nan_replace"):
+            if block.flags.writeable:
+                return np.nan_to_num(block, copy=False, nan=-99999)
+            return np.nan_to_num(block, nan=-99999) if np.isnan(block).any() else block
 
     def get_data_in_range(self, segment: Segment) -> np.ndarray:
         """Retrieves data within the specified time range for a segment.
@@ -145,20 +469,78 @@ class Signal:
         Returns:
             np.ndarray: The concatenated data within the specified time range.
         """
-        start_time = segment.start_time
-        end_time = segment.end_time
-        result_data = [
-            data_slice[max(0, int((start_time - data_start) / self._intervals[0])):min(
-                data_slice.shape[0], int((end_time - data_start) / self._intervals[0]))]
-            for (data_start, data_end), data_slice in self._data.items()
-            if data_start <= end_time and data_end >= start_time
-        ]
+        result_data = self._get_data_slices(segment)
+        return np.concatenate(result_data) if result_data else np.array([])
+
+    def assign_data(self, segment: Segment) -> None:
+        """Assigns the data within the segment's time range to the segment.
+
+        In lazy mode, a segment within one block gets a read-only view of it and a segment spanning
+        several blocks concatenates its slices only when its data is first accessed.
+
+        Args:
+            segment (Segment): The segment whose data needs to be assigned.
+        """
+        if not self._lazy:
+            segment.data = self.get_data_in_range(segment)
+            return
+
+        result_data = self._get_data_slices(segment)
+        if len(result_data) == 1:
+            segment.data = result_data[0]
+            segment.data.flags.writeable = False
+        elif result_data:
+            segment.set_lazy_data(result_data)
+        else:
+            segment.data = np.array([])
 
+    def _get_data_slices(self, segment: Segment) -> List[np.ndarray]:
+        """Returns views of the loaded blocks within the segment's time range and marks empty segments."""
+        try:
+            result_data = self.get_window_slices(segment.start_time, segment.end_time)
+        except EmptySegment:
+            segment.empty = True
+            raise
         segment.empty = not bool(result_data)
-        if segment.empty and not self._skip_empty:
+        return result_data
+
+    def get_window_slices(self, start_time: int, end_time: int) -> List[np.ndarray]:
+        """Returns views of the loaded blocks within a time range, see prepare_data_for_windows.
+
+        Raises:
+            EmptySegment: When no loaded block overlaps the range and `skip_empty` is False.
+        """
+        # Blocks overlapping the segment: the first one ending at or after its start
+        # up to the last one starting at or before its end
+        first_idx = np.searchsorted(self._max_end_times, start_time, side="left")
+        last_idx = np.searchsorted(self._start_times, end_time, side="right")
+
+        result_data = []
+        for idx in range(first_idx, last_idx):
+            data_slice = self._data.get(idx)
+            if data_slice is None or self._end_times[idx] < start_time:
+                continue
+            data_start = self._start_times[idx]
+            result_data.append(data_slice[max(0, int((start_time - data_start) / self._intervals[idx])):min(
+                data_slice.shape[0], int((end_time - data_start) / self._intervals[idx]))])
+
+        if not result_data and not self._skip_empty:
             raise EmptySegment("An empty segment has been detected.")
 
-        return np.nan_to_num(np.concatenate(result_data), nan=-99999) if result_data else np.array([])
+        return result_data
+
+    def release_data(self) -> None:
+        """Drops the loaded data blocks. Segments keep their data, the blocks are reloaded if needed again."""
+        self._data = {}
+
+    def release_data_before(self, start_time: int) -> None:
+        """Drops the loaded data blocks that no window starting at or after `start_time` loads again.
+
+        Assumes the index blocks do not overlap, see prepare_data_for_windows.
+        """
+        first_needed = np.searchsorted(self._start_times, start_time, side="right") - 1
+        for idx in [idx for idx in self._data if idx < first_needed]:
+            del self._data[idx]
 
     @property
     def artf_path(self) -> str:
@@ -175,6 +557,91 @@ class Signal:
         """Returns the mode."""
         return self._mode
 
+    @property
+    def frequency(self) -> float:
+        """Returns the frequency of the first index block."""
+        return self._frequencies[0] if self._frequencies.size else 0.0
+
+    def get_metadata(self) -> RecordingMetadata:
+        """Summarizes the signal from the index and quality tables without reading any sample data.
+
+        Returns:
+            RecordingMetadata: Metadata of the signal, without the window counts.
+        """
+        if self._sidecar_index is not None:
+            return self._get_sidecar_metadata()
+
+        try:
+            with h5py.File(self._file_path, 'r') as hdf:
+                instrumentation.count("hdf5_opens")
+                dataset = hdf[f"waves/{self._mode}"]
+                n_samples = dataset.shape[0]
+                quality_data = hdf.get(f"waves/{self._mode}.quality")
+                if quality_data is None:
+                    quality_data = dataset.attrs.get("quality")
+                quality_data = np.array(quality_data) if quality_data is not None else None
+        except FileNotFoundError:
+            raise FileNotFoundError("No such file or the file is missing an extension.")
+
+        good_quality_fraction = np.nan
+        if quality_data is not None and quality_data.size and self._lengths.sum():
+            index_table = np.column_stack([self._start_indices, self._start_times, self._lengths, self._frequencies])
+            lookup = TableLookupClass(index_table, quality_data)
+            _, section_lengths, _, _ = lookup.plan_sections(0, lookup.get_last_value_index())
+            good_quality_fraction = float(section_lengths.sum() / self._lengths.sum())
+
+        return self._create_metadata(n_samples, good_quality_fraction)
+
+    def _get_sidecar_metadata(self) -> RecordingMetadata:
+        """Same as get_metadata, from the precomputed arrays of the index sidecar without opening the HDF5 file."""
+        good_quality_fraction = np.nan
+        if self._sidecar_index["quality"].size and self._lengths.sum():
+            good_quality_fraction = float(self._sidecar_index["normal_samples"] / self._lengths.sum())
+        return self._create_metadata(self._sidecar_index["n_samples"], good_quality_fraction)
+
+    def _create_metadata(self, n_samples: int, good_quality_fraction: float) -> RecordingMetadata:
+        return RecordingMetadata(
+            file=str(self._file_path),
+            signal=self._mode,
+            frequency=float(self.frequency),
+            n_blocks=len(self._start_times),
+            n_samples=int(n_samples),
+            start_time=int(self._start_times.min()) if self._start_times.size else 0,
+            end_time=int(self._end_times.max()) if self._end_times.size else 0,
+            duration_sec=float((self._lengths / self._frequencies).sum()),
+            good_quality_fraction=good_quality_fraction,
+        )
+
+    def has_data(self, start_times: np.ndarray, end_times: np.ndarray) -> np.ndarray:
+        """Tells which windows would receive data if they were extracted together, using the index table only.
+
+        Mirrors prepare_data_for_segments (blocks loaded by any of the windows) and _get_data_slices
+        (loaded blocks overlapping a window). If the blocks end in order, the blocks in the searched range
+        all end after the window start and counting the loaded ones suffices, otherwise every window
+        checks the end times of its blocks.
+
+        Returns:
+            np.ndarray: True for every window that is not empty.
+        """
+        n_blocks = len(self._start_times)
+        first_loaded = np.maximum(np.searchsorted(self._start_times, start_times, side="right") - 1, 0)
+        last_loaded = np.searchsorted(self._start_times, end_times, side="left")
+        # Blocks loaded by any window, marked through a difference array
+        coverage = np.zeros(n_blocks + 1, dtype=np.int64)
+        valid = first_loaded < last_loaded
+        np.add.at(coverage, first_loaded[valid], 1)
+        np.add.at(coverage, last_loaded[valid], -1)
+        loaded = np.cumsum(coverage[:-1]) > 0
+
+        first_idx = np.searchsorted(self._max_end_times, start_times, side="left")
+        last_idx = np.maximum(np.searchsorted(self._start_times, end_times, side="right"), first_idx)
+        if self._end_times_sorted:
+            loaded_count = np.concatenate(([0], np.cumsum(loaded)))
+            return loaded_count[last_idx] > loaded_count[first_idx]
+        return np.array([(loaded[first:last] & (self._end_times[first:last] >= start_time)).any()
+                         for first, last, start_time in zip(first_idx.tolist(), last_idx.tolist(), start_times.tolist())],
+                        dtype=bool)
+
 
 
 
@@ -190,6 +657,13 @@ class SingleFileExtractor:
         matching_multiplier (int): Multiplier for matching anomalies. For example, a multiplier of 2
                                    produces len(normal_segments) <= len(anomalies) * 2.
         skip_empty (bool): If true, skips an empty segment instead of raising an EmptySegment exception.
+        lazy (bool): If true, segment data are views of the loaded HDF5 blocks (read-only) instead of copies.
+        artf_cache_dir (Optional[str]): Directory caching the parsed ARTF annotations between runs, see ARTFReader.read_arrays.
+                                        Defaults to the ARTF_CACHE_DIR environment variable, no cache if unset.
+        index_sidecar (bool): If true, the index and quality tables are kept in a `.index.npz` sidecar next to the HDF5 file
+                              (see lib.index_sidecar), written on first use and rewritten when the HDF5 file changes.
+        memmap (bool): If true, contiguous uncompressed signal datasets are memory-mapped instead of copied by h5py, so that
+                       processes reading the same files share the OS page cache. Combine with lazy for zero-copy segments.
     
     Example usage:
     >>> extractor = SingleFileExtractor(FILE_PATH, "abp")
@@ -198,53 +672,162 @@ class SingleFileExtractor:
     >>> anomalous_segments = extractor.get_anomalies()
     """
 
-    def __init__(self, file_path: str, mode: str, matching: bool = False, matching_multiplier: int = 1, skip_empty: bool = True) -> None:
-        self._signal = Signal(file_path, self._assign_artf_file_path(file_path), mode, skip_empty)
+    def __init__(self, file_path: str, mode: str, matching: bool = False, matching_multiplier: int = 1, skip_empty: bool = True, lazy: bool = False, artf_cache_dir: Optional[str] = None, index_sidecar: bool = False, memmap: bool = False) -> None:
+        self._mode = mode
+        self._artf_cache_dir = artf_cache_dir
+        self._skip_empty = skip_empty
+        self._lazy = lazy
+        self._index_sidecar = index_sidecar
+        self._memmap = memmap
+        self._signal = Signal(file_path, self._assign_artf_file_path(file_path), mode, skip_empty, lazy, index_sidecar, memmap)
         self._matching = matching
         self._anomalies: List[Segment] = []
         self._normal: List[Segment] = []
         self._matching_multiplier = matching_multiplier
+        self._extracted_signature: Optional[Tuple[int, int, int, int]] = None
 
     def _extract(self):
+        """Extracts the segments once, the result is reused until the HDF5 or ARTF file changes."""
+        signature = self._source_signature()
+        if signature is not None and signature == self._extracted_signature:
+            return
+
+        if self._extracted_signature is not None:
+            # The files changed since the last extraction, reload the index and drop the loaded data
+            self._signal = Signal(self._signal.file_path, self._signal.artf_path, self._mode, self._skip_empty, self._lazy,
+                                  self._index_sidecar, self._memmap)
+            self._extracted_signature = None
+
         if self._matching:
             self._extract_matching()
         else:
             self._extract_all()
 
+        self._extracted_signature = signature
+
+    def _source_signature(self) -> Optional[Tuple[int, int, int, int]]:
+        """Returns the size and modification time of the HDF5 and ARTF files, or None if one of them is missing."""
+        try:
+            hdf5_stat = os.stat(self._signal.file_path)
+            artf_stat = os.stat(self._signal.artf_path)
+        except FileNotFoundError:
+            return None
+        return hdf5_stat.st_size, hdf5_stat.st_mtime_ns, artf_stat.st_size, artf_stat.st_mtime_ns
+
     @staticmethod
     def _assign_artf_file_path(file_path: str) -> Path:
         return Path(file_path).with_suffix(".artf")
 
-    def _get_anomaly_normal_segments(self) -> Tuple[List[Segment], List[Segment]]:
+    def _get_window_arrays(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """Computes the anomalous and normal windows of the recording without creating segments.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]: Start and end times (int64 Unix timestamps in
+            microseconds) of the anomalous windows, then of the normal windows.
+        """
         try:
-            with open(self._signal.artf_path, 'r', encoding='ISO-8859-1') as xml_file:
-                tree = ET.parse(xml_file)
+            with instrumentation.timed("artf_parse"):
+                groups, _ = ARTFReader(self._signal.artf_path, encoding='ISO-8859-1', cache_dir=self._artf_cache_dir).read_arrays()
         except FileNotFoundError:
             raise FileNotFoundError("No such ARTF file found.")
-        
-        root = tree.getroot()
-        modes = [f"SignalGroup[@Name='{self._signal.mode}']", "Global"]
 
-        anomalous_segments, normal_segments = [], []
+        anomaly_starts, anomaly_ends, normal_starts, normal_ends = [], [], [], []
+        for mode in [self._signal.mode, "Global"]:
+            if mode not in groups:
+                continue
+            start_times, end_times = groups[mode]["StartTime"], groups[mode]["EndTime"]
+            anomaly_starts.append(start_times)
+            anomaly_ends.append(end_times)
+
+            starts, ends = self._split_gaps(end_times[:-1], start_times[1:])
+            normal_starts.append(starts)
+            normal_ends.append(ends)
 
-        for mode in modes:
-            normal_start_unix = 0
-            for element in root.findall(f".//{mode}/Artefact"):
-                start_time_unix = self._unix_from_dt(element.get("StartTime"))
-                end_time_unix = self._unix_from_dt(element.get("EndTime"))
-                from_file = self._signal.file_path
-                patient = re.search(r"TBI_(\w+)", from_file).group(1).split('_')[0]
+        empty = [np.empty(0, dtype=np.int64)]
+        return tuple(np.concatenate(arrays or empty) for arrays in (anomaly_starts, anomaly_ends, normal_starts, normal_ends))
+
+    @staticmethod
+    def _split_gaps(gap_starts: np.ndarray, gap_ends: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Splits the gaps between consecutive artefacts into windows of (about) WINDOW_SIZE_SEC.
+
+        A gap of length d is split into int(d / WINDOW_SIZE_SEC) equal windows, the integer equivalent of
+        np.linspace(gap_start, gap_end, n + 1). Gaps starting at 0 are skipped.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: Start and end times of the windows, gap by gap.
+        """
+        lengths = gap_ends - gap_starts
+        counts = np.where(gap_starts != 0, np.maximum(lengths // (WINDOW_SIZE_SEC * 1_000_000), 0), 0)
+
+        gap = np.repeat(np.arange(counts.size), counts)
+        # position of every window within its gap
+        position = np.arange(gap.size) - np.repeat(np.cumsum(counts) - counts, counts)
+        starts = gap_starts[gap] + position * lengths[gap] // counts[gap]
+        ends = gap_starts[gap] + (position + 1) * lengths[gap] // counts[gap]
+        return starts, ends
+
+    def _get_patient_id(self) -> str:
+        """Returns the patient ID from the file name, `TBI_<id>`."""
+        return re.search(r"TBI_(\w+)", self._signal.file_path).group(1).split('_')[0]
+
+    def _create_segments(self, start_times: np.ndarray, end_times: np.ndarray) -> List[Segment]:
+        """Creates (empty) segments of the file for the given windows."""
+        from_file = self._signal.file_path
+        patient = self._get_patient_id()
+        instrumentation.count("segments_built", len(start_times))
+        with instrumentation.timed("segment_build"):
+            return [Segment(start_time=start_time, end_time=end_time, file=from_file, patient_id=patient, empty=True)
+                    for start_time, end_time in zip(start_times.tolist(), end_times.tolist())]
 
-                anomalous_segments.append(Segment(start_time=start_time_unix, end_time=end_time_unix, file=from_file, patient_id=patient, empty=True))
+    def _get_anomaly_normal_segments(self) -> Tuple[List[Segment], List[Segment]]:
+        anomaly_starts, anomaly_ends, normal_starts, normal_ends = self._get_window_arrays()
+        return self._create_segments(anomaly_starts, anomaly_ends), self._create_segments(normal_starts, normal_ends)
 
-                if normal_start_unix:
-                    normal_end_unix = start_time_unix
-                    arr = np.linspace(normal_start_unix, normal_end_unix, int((normal_end_unix - normal_start_unix) / 10_000_000) + 1)
-                    normal_segments.extend(Segment(start_time=arr[i], end_time=arr[i + 1], file=from_file, patient_id=patient, empty=True) for i in range(len(arr) - 1))
-                
-                normal_start_unix = end_time_unix
+    def _get_selected_windows(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """Returns the window arrays (see _get_window_arrays) to extract, taking `matching` into account."""
+        anomaly_starts, anomaly_ends, normal_starts, normal_ends = self._get_window_arrays()
+        if self._matching:
+            normal_count = len(anomaly_starts) * self._matching_multiplier
+            normal_starts, normal_ends = normal_starts[:normal_count], normal_ends[:normal_count]
+        return anomaly_starts, anomaly_ends, normal_starts, normal_ends
+
+    def _get_labelled_windows(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Returns the start times, end times and labels (1 for anomalies, 0 for normal) of the selected windows,
+        anomalies first."""
+        anomaly_starts, anomaly_ends, normal_starts, normal_ends = self._get_selected_windows()
+        labels = (np.arange(len(anomaly_starts) + len(normal_starts)) < len(anomaly_starts)).astype(np.int8)
+        return np.concatenate([anomaly_starts, normal_starts]), np.concatenate([anomaly_ends, normal_ends]), labels
+
+    def _get_window_slices(self, start_times: np.ndarray, end_times: np.ndarray) -> Tuple[List[List[np.ndarray]], np.ndarray, np.ndarray]:
+        """Returns the slices of the loaded blocks of the windows with data, which windows have data
+        (a boolean mask) and the number of values of each of them, see prepare_data_for_windows."""
+        slices = [self._signal.get_window_slices(start_time, end_time)
+                  for start_time, end_time in zip(start_times.tolist(), end_times.tolist())]
+        kept = np.array([bool(window_slices) for window_slices in slices], dtype=bool)
+        slices = [window_slices for window_slices in slices if window_slices]
+        lengths = np.array([sum(data_slice.shape[0] for data_slice in window_slices) for window_slices in slices], dtype=np.int64)
+        return slices, kept, lengths
+
+    def _get_selected_segments(self) -> Tuple[List[Segment], List[Segment]]:
+        """Returns the anomalous and normal segments to extract, taking `matching` into account."""
+        # only the kept normal windows become segments
+        anomaly_starts, anomaly_ends, normal_starts, normal_ends = self._get_selected_windows()
+        return self._create_segments(anomaly_starts, anomaly_ends), self._create_segments(normal_starts, normal_ends)
+
+    def get_metadata(self) -> RecordingMetadata:
+        """Returns the duration, frequency, index blocks, quality coverage and window counts of the file
+        without reading any sample data.
+
+        The window counts equal len(get_anomalies()) and len(get_normal()).
+        """
+        anomaly_starts, anomaly_ends, normal_starts, normal_ends = self._get_selected_windows()
+        has_data = self._signal.has_data(np.concatenate([anomaly_starts, normal_starts]),
+                                         np.concatenate([anomaly_ends, normal_ends]))
 
-        return anomalous_segments, normal_segments
+        metadata = self._signal.get_metadata()
+        metadata.n_anomalies = int(np.count_nonzero(has_data[:len(anomaly_starts)]))
+        metadata.n_normal = int(np.count_nonzero(has_data[len(anomaly_starts):]))
+        return metadata
 
     def _extract_all(self) -> None:
         """Extracts all anomalous and normal segments."""
@@ -255,8 +838,7 @@ class SingleFileExtractor:
 
     def _extract_matching(self) -> None:
         """Extracts anomalies and a matching number of normal segments."""
-        anomalous_segments, normal_segments = self._get_anomaly_normal_segments()
-        normal_segments = normal_segments[:len(anomalous_segments) * self._matching_multiplier]
+        anomalous_segments, normal_segments = self._get_selected_segments()
 
         for i, segments in enumerate([normal_segments, anomalous_segments]):
             self._extract_data_for_segments(segments, anomaly=bool(i))
@@ -265,19 +847,30 @@ class SingleFileExtractor:
         target = self._anomalies if anomaly else self._normal
         target[:] = segments
         self._signal.prepare_data_for_segments(segments)
-        for segment in target:
-            segment.data = self._signal.get_data_in_range(segment)
+        with instrumentation.timed("segment_build"):
+            for segment in target:
+                self._signal.assign_data(segment)
 
     def export_data(self, output_dir: str, export_format: str = "csv") -> None:
-        """Saves anomalous and normal segments as CSV or JSON in the specified output directory."""
+        """Saves anomalous and normal segments as CSV, JSON or HDF5 in the specified output directory.
+
+        The 'hdf5' format writes one columnar file, see _export_hdf5, in batches of segments
+        holding only the data blocks of the current batch.
+        """
+        if export_format.lower() == "hdf5":
+            Path(output_dir).mkdir(parents=True, exist_ok=True)
+            self._export_hdf5(Path(output_dir) / f"{Path(self._signal.file_path).stem}_segments.hdf5")
+            return
+
         self._extract()
         anomaly_path, normal_path = Path(output_dir) / "anomalies", Path(output_dir) / "normal_segments"
         anomaly_path.mkdir(parents=True, exist_ok=True)
         normal_path.mkdir(parents=True, exist_ok=True)
 
         base_filename = Path(self._signal.file_path).stem
-        anomaly_data = [{**segment.__dict__, 'data': segment.data.tolist()} for segment in self._anomalies]
-        normal_data = [{**segment.__dict__, 'data': segment.data.tolist()} for segment in self._normal]
+        fieldnames = [segment_field.name for segment_field in fields(Segment)]
+        anomaly_data = [{**{name: getattr(segment, name) for name in fieldnames}, 'data': segment.data.tolist()} for segment in self._anomalies]
+        normal_data = [{**{name: getattr(segment, name) for name in fieldnames}, 'data': segment.data.tolist()} for segment in self._normal]
 
         if export_format.lower() == "json":
             with open(anomaly_path / f"{base_filename}_anomalies.json", 'w') as f:
@@ -287,30 +880,84 @@ class SingleFileExtractor:
         elif export_format.lower() == "csv":
             if self._anomalies:
                 with open(anomaly_path / f"{base_filename}_anomalies.csv", 'w', newline='') as f:
-                    writer = csv.DictWriter(f, fieldnames=self._anomalies[0].__dict__.keys())
+                    writer = csv.DictWriter(f, fieldnames=fieldnames)
                     writer.writeheader()
                     writer.writerows(anomaly_data)
             if self._normal:
                 with open(normal_path / f"{base_filename}_normal.csv", 'w', newline='') as f:
-                    writer = csv.DictWriter(f, fieldnames=self._normal[0].__dict__.keys())
+                    writer = csv.DictWriter(f, fieldnames=fieldnames)
                     writer.writeheader()
                     writer.writerows(normal_data)
         else:
-            raise ValueError(f"Unsupported format: {export_format}. Please choose 'json' or 'csv'.")
+            raise ValueError(f"Unsupported format: {export_format}. Please choose 'json', 'csv' or 'hdf5'.")
+
+    def _export_hdf5(self, output_path: Path, batch_size: int = 1024) -> None:
+        """Writes the segments to a columnar HDF5 file, appending them in batches as they are extracted.
+
+        The values of all segments are concatenated in the `data` dataset, the values of row i are
+        data[offsets[i]:offsets[i] + lengths[i]]. Anomalies (label 1) and normal segments (label 0) are written
+        in start time order, so that every batch loads only the data blocks around it and the blocks of earlier
+        batches are released. The file path, patient ID and mode are stored once as file attributes.
+        """
+        start_times, end_times, labels = self._get_labelled_windows()
+        order = np.argsort(start_times, kind="stable")
+        start_times, end_times, labels = start_times[order], end_times[order], labels[order]
+
+        with h5py.File(output_path, "w") as hdf:
+            hdf.attrs["file"] = str(self._signal.file_path)
+            hdf.attrs["patient_id"] = self._get_patient_id() if len(start_times) else ""
+            hdf.attrs["mode"] = self._mode
+
+            datasets = {
+                name: hdf.create_dataset(name, shape=(0,), maxshape=(None,), dtype=dtype, chunks=(chunk_size,),
+                                         compression="gzip", shuffle=True)
+                for name, dtype, chunk_size in EXPORT_HDF5_COLUMNS
+            }
+
+            for batch_start in range(0, len(start_times), batch_size):
+                batch = slice(batch_start, batch_start + batch_size)
+                frequencies = self._signal.prepare_data_for_windows(start_times[batch], end_times[batch])
+                values = [np.concatenate(window_slices) if window_slices else None
+                          for window_slices in (self._signal.get_window_slices(start_time, end_time)
+                                                for start_time, end_time in zip(start_times[batch].tolist(),
+                                                                                end_times[batch].tolist()))]
+                if batch_start + batch_size < len(start_times):
+                    self._signal.release_data_before(start_times[batch_start + batch_size])
+
+                kept = np.array([value is not None for value in values], dtype=bool)
+                if not kept.any():
+                    continue
+
+                lengths = np.array([value.shape[0] for value in values if value is not None], dtype=np.int64)
+                columns = {
+                    "data": np.concatenate([value for value in values if value is not None]),
+                    "offsets": datasets["data"].shape[0] + np.cumsum(lengths) - lengths,
+                    "lengths": lengths,
+                    "start_time": start_times[batch][kept],
+                    "end_time": end_times[batch][kept],
+                    "label": labels[batch][kept],
+                    "frequency": frequencies[kept].astype(np.float64),
+                }
+                for name, column in columns.items():
+                    dataset = datasets[name]
+                    dataset.resize((dataset.shape[0] + column.shape[0],))
+                    dataset[-column.shape[0]:] = column
+
+        self._signal.release_data()
+
+    def release_data(self) -> None:
+        """Frees the HDF5 data blocks held by the signal once the segments are extracted."""
+        self._signal.release_data()
 
     def get_frequency(self) -> int:
         """Returns the frequency of the first anomalous or normal segment."""
+        self._extract()
         if self._anomalies:
             return self._anomalies[0].frequency
         if self._normal:
             return self._normal[0].frequency
         return 0
 
-    @staticmethod
-    def _unix_from_dt(dt_string: str) -> int:
-        """Converts a datetime string to a Unix timestamp in microseconds."""
-        return int(datetime.datetime.strptime(dt_string, "%d/%m/%Y %H:%M:%S.%f").replace(tzinfo=datetime.timezone.utc).timestamp() * 1_000_000)
-
     def get_anomalies(self) -> List[Segment]:
         """Returns the extracted anomalies."""
         self._extract()
@@ -321,6 +968,75 @@ class SingleFileExtractor:
         self._extract()
         return [segment for segment in self._normal if not segment.empty]
     
+    def get_segment_table(self) -> SegmentTable:
+        """Returns the anomalous (label 1) and normal (label 0) segments as a SegmentTable, anomalies first.
+
+        Empty segments are left out (or raise EmptySegment if `skip_empty` is False).
+        The columns are built from the window arrays and the values copied once, from the loaded blocks
+        into the shared buffer, without creating Segment objects.
+        """
+        start_times, end_times, labels = self._get_labelled_windows()
+        frequencies = self._signal.prepare_data_for_windows(start_times, end_times)
+
+        with instrumentation.timed("segment_build"):
+            slices, kept, lengths = self._get_window_slices(start_times, end_times)
+            offsets = np.cumsum(lengths) - lengths
+
+            data = np.empty(int(lengths.sum()))
+            for offset, window_slices in zip(offsets.tolist(), slices):
+                for data_slice in window_slices:
+                    data[offset:offset + data_slice.shape[0]] = data_slice
+                    offset += data_slice.shape[0]
+
+            n_rows = int(np.count_nonzero(kept))
+            return SegmentTable(
+                start_time=start_times[kept],
+                end_time=end_times[kept],
+                empty=np.zeros(n_rows, dtype=bool),
+                frequency=frequencies[kept].astype(np.float64),
+                label=labels[kept],
+                file_code=np.zeros(n_rows, dtype=np.int32),
+                patient_code=np.zeros(n_rows, dtype=np.int32),
+                offsets=offsets,
+                lengths=lengths,
+                data=data,
+                files=np.array([self._signal.file_path] if n_rows else [], dtype=str),
+                patient_ids=np.array([self._get_patient_id()] if n_rows else [], dtype=str),
+            )
+
+    def get_segments_array(self, samples_per_window: Optional[int] = None, pad_value: float = np.nan) -> SegmentArray:
+        """Returns the anomalous and normal segments as one matrix, filled straight from the HDF5 blocks.
+
+        Anomalies come first, then normal segments. Empty segments are left out (or raise EmptySegment
+        if `skip_empty` is False). Like get_segment_table, the rows are built from the window arrays
+        without creating Segment objects.
+
+        Args:
+            samples_per_window (Optional[int]): Row length. Default is the length of the longest segment, so that
+                                                no segment is cut. Longer segments keep their first values.
+            pad_value (float): Value filling rows of segments shorter than the row. Default is NaN.
+
+        Returns:
+            SegmentArray: The segment matrix with the lengths, labels, start times and patient IDs of the rows.
+        """
+        start_times, end_times, labels = self._get_labelled_windows()
+        self._signal.prepare_data_for_windows(start_times, end_times)
+
+        with instrumentation.timed("segment_build"):
+            slices, kept, lengths = self._get_window_slices(start_times, end_times)
+            row_length = int(lengths.max(initial=0)) if samples_per_window is None else samples_per_window
+            data = np.full((len(lengths), row_length), pad_value, dtype=np.float64)
+            for row, window_slices in zip(data, slices):
+                position = 0
+                for data_slice in window_slices:
+                    count = min(data_slice.shape[0], row_length - position)
+                    row[position:position + count] = data_slice[:count]
+                    position += count
+
+        n_rows = len(lengths)
+        return SegmentArray(data, lengths, labels[kept], start_times[kept],
+                            np.array([self._get_patient_id()] * n_rows, dtype=str), self._signal.frequency if n_rows else 0.0)
+
     def return_hdf5_as_array(self) -> np.array:
         """Loads and returns the entire dataset from the HDF5 file as a NumPy array.
         
@@ -329,8 +1045,13 @@ class SingleFileExtractor:
         """
         try:
             with h5py.File(self._signal.file_path, 'r') as hdf:
+                instrumentation.count("hdf5_opens")
                 dataset = hdf[f"waves/{self._signal.mode}"]
-                entire_data = np.nan_to_num(np.array(dataset), nan=-99999)
+                with instrumentation.timed("hdf5_read"):
+                    entire_data = np.array(dataset)
+                instrumentation.count_read(entire_data)
+                with instrumentation.timed("nan_replace"):
+                    entire_data = np.nan_to_num(entire_data, copy=False, nan=-99999)
             return entire_data
 
         except FileNotFoundError:
@@ -349,6 +1070,13 @@ class FolderExtractor:
         matching_multiplier (int): Multiplier for matching anomalies. For example, a multiplier of 2
                                    produces len(normal_segments) <= len(anomalies) * 2.
         skip_empty (bool): If true, skips an empty segment instead of raising an EmptySegment exception.
+        lazy (bool): If true, segment data are views of the loaded HDF5 blocks (read-only) instead of copies.
+        artf_cache_dir (Optional[str]): Directory caching the parsed ARTF annotations between runs, see SingleFileExtractor.
+        index_sidecar (bool): If true, the index tables of every file are kept in a sidecar next to it, see SingleFileExtractor.
+        memmap (bool): If true, contiguous uncompressed datasets are memory-mapped, see SingleFileExtractor.
+        workers (int): Number of processes the files are spread across. Default is 1 (no process pool).
+                       The results keep the folder order. With any number of workers, a failing file raises
+                       ExtractionError naming it.
     
     Example usage:
     >>> extractor = FolderExtractor(FOLDER_PATH)
@@ -358,63 +1086,79 @@ class FolderExtractor:
     >>> extractor = FolderExtractor(FOLDER_PATH)
     >>> anomalous_segments_patient_dictionary, normal_segments_patient_dictionary = extractor.extract_merged()
 
+    >>> extractor = FolderExtractor(FOLDER_PATH, "abp", workers=8)
+    >>> anomalous_segments, normal_segments = extractor.extract_all()
+
+    >>> extractor = FolderExtractor(FOLDER_PATH, "abp")
+    >>> anomalies_table, normal_table = extractor.extract_all(as_table=True)
+
+    >>> extractor = FolderExtractor(FOLDER_PATH, "abp")
+    >>> for segment, label in extractor.iter_segments():
+    ...     train_step(segment.data, label)
+
     """
 
-    def __init__(self, folder_path: str, mode: str, matching: bool = False, matching_multiplier: int = 1, skip_empty: bool = True) -> None:
+    def __init__(self, folder_path: str, mode: str, matching: bool = False, matching_multiplier: int = 1, skip_empty: bool = True, lazy: bool = False, workers: int = 1, artf_cache_dir: Optional[str] = None, index_sidecar: bool = False, memmap: bool = False) -> None:
         self._folder_path = folder_path
+        self._artf_cache_dir = artf_cache_dir
+        self._index_sidecar = index_sidecar
+        self._memmap = memmap
         self._mode = mode
         self._matching = matching
         self._matching_multiplier = matching_multiplier
         self._skip_empty = skip_empty
+        self._lazy = lazy
+        self._workers = workers
 
         if not os.path.exists(self._folder_path):
             raise FileNotFoundError("Invalid folder path.")
 
-    def extract_all(self) -> Tuple[List[Segment], List[Segment]]:
+    def extract_all(self, as_table: bool = False) -> Union[Tuple[List[Segment], List[Segment]],
+                                                           Tuple[SegmentTable, SegmentTable]]:
         """Extracts anomalous and normal segments from all files in the folder.
+
+        Args:
+            as_table (bool): If true, returns the segments as two SegmentTables instead of lists.
+
         Returns:
-            Tuple[List[Segment], List[Segment]]: A tuple containing arrays of anomalous and normal segments.
+            Union[Tuple[List[Segment], List[Segment]], Tuple[SegmentTable, SegmentTable]]: A tuple containing
+            arrays of anomalous and normal segments, or two SegmentTables with `as_table`.
         """
+        if as_table:
+            table = self.get_segment_table()
+            return table.filter(table.label == 1), table.filter(table.label == 0)
+
         anomalies, normal, frequencies = [], [], set()
 
-        for root, _, files in os.walk(self._folder_path):
-            hdf5_files = [f for f in files if f.endswith(".hdf5")]
-            artf_files = {f.replace(".artf", ""): f for f in files if f.endswith(".artf")}
-
-            for hdf5_file in hdf5_files:
-                file_name = hdf5_file.replace(".hdf5", "")
-                if file_name in artf_files:
-                    extractor = SingleFileExtractor(
-                        file_path=os.path.join(root, hdf5_file),
-                        mode=self._mode,
-                        matching=self._matching,
-                        matching_multiplier=self._matching_multiplier,
-                        skip_empty=self._skip_empty,
-                    )
-
-                    anomalies.extend(extractor.get_anomalies())
-                    normal.extend(extractor.get_normal())
-
-                    frequency = extractor.get_frequency()
-                    if frequency:
-                        frequencies.add(frequency)
+        for file_anomalies, file_normal, frequency in self._map_files(_extract_file, list(self._iter_hdf5_paths())):
+            anomalies.extend(file_anomalies)
+            normal.extend(file_normal)
+            if frequency:
+                frequencies.add(frequency)
 
         if len(frequencies) > 1:
             raise FrequencyMismatchError(f"More than one frequency found in folder: {frequencies}")
 
         return anomalies, normal
 
-    def extract_merged(self) -> Tuple[Dict[str, List[Segment]], Dict[str, List[Segment]]]:
+    def extract_merged(self, as_table: bool = False) -> Union[Tuple[Dict[str, List[Segment]], Dict[str, List[Segment]]],
+                                                              Tuple[Dict[str, SegmentTable], Dict[str, SegmentTable]]]:
         """Extracts and merges anomalies and normal segments for each patient.
 
+        Args:
+            as_table (bool): If true, the dictionaries hold a SegmentTable per patient instead of lists.
+
         Returns:
-            Tuple[Dict[str, List[Segment]], Dict[str, List[Segment]]]: A tuple containing dictionaries of anomalous and normal segments grouped by patient ID.
+            Union[Tuple[Dict[str, List[Segment]], Dict[str, List[Segment]]], Tuple[Dict[str, SegmentTable], Dict[str, SegmentTable]]]:
+            A tuple containing dictionaries of anomalous and normal segments grouped by patient ID,
+            holding SegmentTables with `as_table`.
         """
         patient_data_artf: Dict[str, List[Segment]] = {}
         patient_data_normal: Dict[str, List[Segment]] = {}
         frequencies: Set[float] = set()
 
         patient_pattern = re.compile(r"TBI_(\w+)")
+        patient_ids, hdf5_paths = [], []
 
         for root, dirs, files in os.walk(self._folder_path):
             hdf5_files = [file for file in files if file.endswith(".hdf5")]
@@ -423,70 +1167,171 @@ class FolderExtractor:
             for hdf5_file in hdf5_files:
                 match = patient_pattern.match(hdf5_file)
                 if match:
-                    patient_id = match.group(1).split('_')[0]
-
                     file_name = hdf5_file.replace(".hdf5", "")
                     if file_name in artf_files:
-                        hdf5_path = os.path.join(root, hdf5_file)
+                        patient_ids.append(match.group(1).split('_')[0])
+                        hdf5_paths.append(os.path.join(root, hdf5_file))
+                    else:
+                        print(f"No ARTF file found for {file_name} in {root}")
 
-                        extractor = SingleFileExtractor(
-                            file_path=hdf5_path,
-                            mode=self._mode,
-                            matching=self._matching,
-                            matching_multiplier=self._matching_multiplier,
-                            skip_empty=self._skip_empty
-                        )
+        if as_table:
+            tables = self._map_files(_extract_file_table, hdf5_paths)
+            self._check_table_frequencies(tables)
 
-                        anomalies: List[Segment] = extractor.get_anomalies()
-                        normals: List[Segment] = extractor.get_normal()
+            patient_tables: Dict[str, List[SegmentTable]] = {}
+            for patient_id, table in zip(patient_ids, tables):
+                patient_tables.setdefault(patient_id, []).append(table)
+            merged = {patient_id: SegmentTable.concatenate(tables) for patient_id, tables in patient_tables.items()}
+            return ({patient_id: table.filter(table.label == 1) for patient_id, table in merged.items()},
+                    {patient_id: table.filter(table.label == 0) for patient_id, table in merged.items()})
 
-                        frequency: float = extractor.get_frequency()
-                        if frequency:
-                            frequencies.add(frequency)
+        for patient_id, (anomalies, normals, frequency) in zip(patient_ids, self._map_files(_extract_file, hdf5_paths)):
+            if frequency:
+                frequencies.add(frequency)
 
-                        if patient_id not in patient_data_artf:
-                            patient_data_artf[patient_id] = []
-                        if patient_id not in patient_data_normal:
-                            patient_data_normal[patient_id] = []
+            patient_data_artf.setdefault(patient_id, []).extend(anomalies)
+            patient_data_normal.setdefault(patient_id, []).extend(normals)
 
-                        patient_data_artf[patient_id].extend(anomalies)
-                        patient_data_normal[patient_id].extend(normals)
+        if len(frequencies) > 1:
+            raise FrequencyMismatchError(f"More than one frequency found in folder: {frequencies}")
 
-                    else:
-                        print(f"No ARTF file found for {file_name} in {root}")
+        return patient_data_artf, patient_data_normal
+
+    def iter_segments(self, per_file: bool = False, release_data: bool = True) -> Iterator:
+        """Yields the segments one file at a time, so that only one file is held in memory.
 
+        Args:
+            per_file (bool): If true, yields a (file_path, anomalies, normal_segments) tuple per file,
+                             otherwise yields (segment, label) pairs where the label is 1 for an anomaly and 0 otherwise.
+            release_data (bool): If true, frees the HDF5 data blocks of each file as soon as its segments are extracted.
+
+        Yields:
+            Tuple[str, List[Segment], List[Segment]] or Tuple[Segment, int]: The segments of the files in folder order.
+
+        Raises:
+            FrequencyMismatchError: When a file has a different frequency than the files before it.
+        """
+        frequencies: Set[float] = set()
+
+        for hdf5_path in self._iter_hdf5_paths():
+            extractor = SingleFileExtractor(hdf5_path, **self._extractor_options())
+            anomalies, normal = extractor.get_anomalies(), extractor.get_normal()
+
+            frequency = extractor.get_frequency()
+            if frequency:
+                frequencies.add(frequency)
+                if len(frequencies) > 1:
+                    raise FrequencyMismatchError(f"More than one frequency found in folder: {frequencies}")
+
+            if release_data:
+                extractor.release_data()
+            del extractor
+
+            if per_file:
+                yield hdf5_path, anomalies, normal
+            else:
+                for segment in anomalies:
+                    yield segment, 1
+                for segment in normal:
+                    yield segment, 0
+
+    def get_segment_table(self) -> SegmentTable:
+        """Returns the segments of all files in the folder as one SegmentTable, see SingleFileExtractor.get_segment_table.
+
+        Returns:
+            SegmentTable: The segments of the files in folder order, anomalies first within each file.
+        """
+        tables = self._map_files(_extract_file_table, list(self._iter_hdf5_paths()))
+        self._check_table_frequencies(tables)
+        return SegmentTable.concatenate(tables)
+
+    @staticmethod
+    def _check_table_frequencies(tables: List[SegmentTable]) -> None:
+        frequencies = {frequency for table in tables for frequency in np.unique(table.frequency).tolist() if frequency}
         if len(frequencies) > 1:
             raise FrequencyMismatchError(f"More than one frequency found in folder: {frequencies}")
 
-        return patient_data_artf, patient_data_normal
+    def get_segments_array(self, samples_per_window: Optional[int] = None, pad_value: float = np.nan) -> SegmentArray:
+        """Returns the segments of all files in the folder as one matrix, see SingleFileExtractor.get_segments_array.
+
+        Args:
+            samples_per_window (Optional[int]): Row length. Default is the length of the longest segment of all files.
+            pad_value (float): Value filling rows of segments shorter than the row. Default is NaN.
+
+        Returns:
+            SegmentArray: The segment matrix with the lengths, labels, start times and patient IDs of the rows.
+        """
+        hdf5_paths = list(self._iter_hdf5_paths())
+        arrays = self._map_files(partial(_extract_file_array, samples_per_window=samples_per_window, pad_value=pad_value), hdf5_paths)
+
+        frequencies = {segments_array.frequency for segments_array in arrays if segments_array.frequency}
+        if len(frequencies) > 1:
+            raise FrequencyMismatchError(f"More than one frequency found in folder: {frequencies}")
+
+        if not arrays:
+            return SegmentArray(np.empty((0, samples_per_window or 0)), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int8),
+                                np.empty(0, dtype=np.int64), np.empty(0, dtype=str))
+        # the rows of files with shorter segments are padded to the longest
+        return SegmentArray.concatenate(arrays, pad_value)
+
+    def _iter_hdf5_paths(self) -> Iterator[str]:
+        """Yields the paths of the HDF5 files in the folder (and subfolders) that have a matching ARTF file."""
+        for root, _, files in os.walk(self._folder_path):
+            hdf5_files = [f for f in files if f.endswith(".hdf5")]
+            artf_files = {f.replace(".artf", ""): f for f in files if f.endswith(".artf")}
+
+            for hdf5_file in hdf5_files:
+                if hdf5_file.replace(".hdf5", "") in artf_files:
+                    yield os.path.join(root, hdf5_file)
+
+    def _extractor_options(self) -> Dict[str, object]:
+        return {
+            "mode": self._mode,
+            "matching": self._matching,
+            "matching_multiplier": self._matching_multiplier,
+            "skip_empty": self._skip_empty,
+            "lazy": self._lazy,
+            "artf_cache_dir": self._artf_cache_dir,
+            "index_sidecar": self._index_sidecar,
+            "memmap": self._memmap,
+        }
+
+    def _map_files(self, function: Callable, hdf5_paths: List[str]) -> List:
+        """Applies `function(hdf5_path, extractor_options)` to every file, in a process pool if `workers` > 1.
+
+        Returns:
+            List: The results in the order of `hdf5_paths`.
+        """
+        options = self._extractor_options()
+        if self._workers <= 1 or len(hdf5_paths) <= 1:
+            return [_run_for_file(function, hdf5_path, options) for hdf5_path in hdf5_paths]
+
+        if instrumentation.is_enabled():
+            # the counts of the worker processes are sent back with the results and added to the active recorders
+            with ProcessPoolExecutor(max_workers=min(self._workers, len(hdf5_paths))) as executor:
+                futures = [executor.submit(_run_recorded, function, hdf5_path, options) for hdf5_path in hdf5_paths]
+                results = []
+                for future in futures:
+                    result, stats = future.result()
+                    instrumentation.merge(stats)
+                    results.append(result)
+                return results
+
+        with ProcessPoolExecutor(max_workers=min(self._workers, len(hdf5_paths))) as executor:
+            futures = [executor.submit(_run_for_file, function, hdf5_path, options) for hdf5_path in hdf5_paths]
+            return [future.result() for future in futures]
 
-    
-    
     def export_data(self, output_dir: str, export_format: str = "csv") -> None:
         """Exports the extracted data for each file.
 
         Args:
             output_dir (str): Path to the output folder where the segments should be saved.
-            format (str): Format in which to save the files, either 'csv' or 'json'. Default is 'csv'.
+            format (str): Format in which to save the files, either 'csv', 'json' or 'hdf5'. Default is 'csv'.
         """
         output_dir_path = Path(fr"{output_dir}/{self._mode}")
         output_dir_path.mkdir(parents=True, exist_ok=True)
 
-        for root, _, files in os.walk(self._folder_path):
-            hdf5_files = [f for f in files if f.endswith(".hdf5")]
-            artf_files = {f.replace(".artf", ""): f for f in files if f.endswith(".artf")}
-
-            for hdf5_file in hdf5_files:
-                file_name = hdf5_file.replace(".hdf5", "")
-                if file_name in artf_files:
-                    extractor = SingleFileExtractor(
-                        file_path=os.path.join(root, hdf5_file),
-                        mode=self._mode,
-                        matching=self._matching,
-                        matching_multiplier=self._matching_multiplier,
-                        skip_empty=self._skip_empty,
-                    )
-                    extractor.export_data(output_dir_path, export_format)
+        self._map_files(partial(_export_file, output_dir=output_dir_path, export_format=export_format), list(self._iter_hdf5_paths()))
 
     def return_hdf5_as_array(self) -> Dict[str, np.array]:
         """Extracts anomalous and normal segments from all files in the folder.
@@ -502,14 +1347,8 @@ class FolderExtractor:
             for hdf5_file in hdf5_files:
                 file_name = hdf5_file.replace(".hdf5", "")
 
-                extractor = SingleFileExtractor(
-                        file_path=os.path.join(root, hdf5_file),
-                        mode=self._mode,
-                        matching=self._matching,
-                        matching_multiplier=self._matching_multiplier,
-                        skip_empty=self._skip_empty,
-                    )
-                
+                extractor = SingleFileExtractor(os.path.join(root, hdf5_file), **self._extractor_options())
+
                 hdf5_array = extractor.return_hdf5_as_array()
 
                 if data_collector.get(file_name) is None:
@@ -518,3 +1357,35 @@ class FolderExtractor:
                     print(f"A file with the same name as {file_name} was already loaded, skipping the file.")
 
         return data_collector
+
+
+def _run_for_file(function: Callable, hdf5_path: str, options: Dict[str, object]):
+    """Runs a per-file task (in a worker process or in the main one), reporting the file it failed on."""
+    try:
+        return function(hdf5_path, options)
+    except Exception as e:
+        raise ExtractionError(f"Extraction of {hdf5_path} failed: {type(e).__name__}: {e}") from e
+
+
+def _run_recorded(function: Callable, hdf5_path: str, options: Dict[str, object]):
+    """Runs a per-file task in a worker process with a Recorder, returns the result and the recorded stats."""
+    with instrumentation.Recorder() as recorder:
+        result = _run_for_file(function, hdf5_path, options)
+    return result, recorder.stats()
+
+
+def _extract_file(hdf5_path: str, options: Dict[str, object]) -> Tuple[List[Segment], List[Segment], float]:
+    extractor = SingleFileExtractor(hdf5_path, **options)
+    return extractor.get_anomalies(), extractor.get_normal(), extractor.get_frequency()
+
+
+def _extract_file_table(hdf5_path: str, options: Dict[str, object]) -> SegmentTable:
+    return SingleFileExtractor(hdf5_path, **options).get_segment_table()
+
+
+def _extract_file_array(hdf5_path: str, options: Dict[str, object], samples_per_window: Optional[int], pad_value: float) -> SegmentArray:
+    return SingleFileExtractor(hdf5_path, **options).get_segments_array(samples_per_window, pad_value)
+
+
+def _export_file(hdf5_path: str, options: Dict[str, object], output_dir: Path, export_format: str) -> None:
+    SingleFileExtractor(hdf5_path, **options).export_data(output_dir, export_format)
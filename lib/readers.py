@@ -1,4 +1,6 @@
+import hashlib
 import os
+import zipfile
 from typing import Union
 import numpy as np
 import datetime
@@ -6,117 +8,275 @@ import h5py
 import re
 import xml.etree.ElementTree as ET
 from .exporters import ARTFMetadata
-from .hdf5_reader_module import SignalClass
+from .hdf5_reader_module import DualSignalClass, get_abp_signal_name
 from .artefact import Artefact
 from .errors import WrongSignalGroupError
+from .helpers import ARTF_DATE_FMT, parse_artf_times, artf_times_to_datetimes
+from . import instrumentation
 
 
 class HDFReader:
 
-    def __init__(self, filename):
+    def __init__(self, filename, index_sidecar=False):
+        """With index_sidecar, the index and quality tables are read from
+        the index sidecar next to the file (see lib.index_sidecar)."""
         if not os.path.exists(filename):
             raise FileNotFoundError(f"File {filename} not found")
         self.filename = filename
+        self.index_sidecar = index_sidecar
 
 
     def read(self):
         """Reads ICP, ABP, Sampling rate, start and end time, ABP dataset name
         from HDF5 file."""
         with h5py.File(self.filename, 'r')  as f:
-            # Read ICP
-            wave_data_icp = SignalClass(f, 'icp')
-
-            start_time = wave_data_icp.get_all_data_start_time()
-            end_time = wave_data_icp.get_all_data_end_time()
-            stream_duration_microsec = end_time - start_time
-            stream = wave_data_icp.get_data_stream(start_time, stream_duration_microsec)
-
-            sr_icp = int(np.ceil(stream.sampling_frq))
-            data = np.array(stream.values)
-            icp_data = data
-
-            # Read ABP
-            if "abp" in f["waves"].keys(): # type: ignore
-                wave_data_abp = SignalClass(f, 'abp')
-                abp_name = "abp"
-            elif "art" in f["waves"].keys(): # type: ignore
-                wave_data_abp = SignalClass(f, 'art')
-                abp_name = "art"
-            else:
+            abp_name = get_abp_signal_name(f)
+            if abp_name is None:
                 return None, None, None, (None, None), None
 
+            # both signals over the ICP time range, read in one pass
+            wave_data = DualSignalClass(f, ('icp', abp_name), self.index_sidecar)
+            wave_data_icp = wave_data.get_signals()[0]
             start_time = wave_data_icp.get_all_data_start_time()
             end_time = wave_data_icp.get_all_data_end_time()
             stream_duration_microsec = end_time - start_time
-            stream = wave_data_abp.get_data_stream(start_time, stream_duration_microsec)
+            data, sampling_frq = wave_data.get_dual_data_stream(start_time, stream_duration_microsec)
 
-            sr_abp = int(np.ceil(stream.sampling_frq))
-            data = np.array(stream.values)
-            abp_data = data
-
-            assert sr_icp == sr_abp
-            sr = sr_icp
+            sr = int(np.ceil(sampling_frq))
+            icp_data, abp_data = data
 
             times = (start_time, end_time)
             return icp_data, abp_data, sr, times, abp_name
 
+    def read_channels(self, out=None):
+        """Reads ICP and ABP (or ART) in one pass over the time range of both.
+        Returns a dict with the (2, n) signals array, the signal names,
+        the sample rate and the start and end time in microseconds."""
+        with h5py.File(self.filename, 'r') as f:
+            wave_data = DualSignalClass(f, index_sidecar=self.index_sidecar)
+            start_time = wave_data.get_all_data_start_time()
+            end_time = wave_data.get_all_data_end_time()
+            data, sampling_frq = wave_data.get_dual_data_stream(start_time, end_time - start_time, out)
+
+            return {
+                "signals": data,
+                "signal_names": wave_data.get_signal_names(),
+                "sample_rate": sampling_frq,
+                "start_time": start_time,
+                "end_time": end_time,
+            }
+
 class ARTFReader:
 
-    DATE_FMT = '%d/%m/%Y %H:%M:%S.%f'
+    DATE_FMT = ARTF_DATE_FMT
+    ABP_NAMES = ("abp", "art")
+    ATTRIBUTES = ("ModifiedBy", "ModifiedDate", "StartTime", "EndTime")
+    # Environment variable with the default cache directory of read_arrays
+    CACHE_DIR_ENV = "ARTF_CACHE_DIR"
+    CACHE_VERSION = 1
+    # ModifiedDate of artefacts without the attribute
+    MISSING_TIME = np.iinfo(np.int64).min
 
-    def __init__(self, filename):
+    def __init__(self, filename, encoding=None, cache_dir=None):
+        """encoding: if set, the file is decoded with it instead of the
+        encoding declared in the XML (e.g. 'ISO-8859-1').
+        cache_dir: directory of the parsed artefact cache, defaults to the
+        ARTF_CACHE_DIR environment variable. No cache is used if neither is set."""
         if not os.path.exists(filename):
             raise FileNotFoundError(f"File {filename} not found")
         self.filename = filename
+        self.encoding = encoding
+        self.cache_dir = cache_dir or os.environ.get(ARTFReader.CACHE_DIR_ENV)
+
+
+    def read_groups(self) -> tuple[dict[str, dict[str, list]], Union[ARTFMetadata, None]]:
+        """Collects the artefact attributes of every group in a single
+        iterparse pass. Groups are keyed by "Global" or the SignalGroup name,
+        each holding a list per attribute in ATTRIBUTES."""
+        groups = {}
+        metadata = None
+        parents = []
+        instrumentation.count("artf_parses")
+
+        source = open(self.filename, 'r', encoding=self.encoding) if self.encoding else self.filename
+        try:
+            for event, element in ET.iterparse(source, events=("start", "end")):
+                if event == "start":
+                    parents.append(element)
+                    continue
+                parents.pop()
+
+                if element.tag == "Artefact" and parents:
+                    parent = parents[-1]
+                    group = "Global" if parent.tag == "Global" else parent.get("Name")
+                    if parent.tag in ("Global", "SignalGroup"):
+                        columns = groups.setdefault(group, {name: [] for name in ARTFReader.ATTRIBUTES})
+                        for name in ARTFReader.ATTRIBUTES:
+                            columns[name].append(element.get(name))
+                elif element.tag in ("Global", "SignalGroup"):
+                    groups.setdefault("Global" if element.tag == "Global" else element.get("Name"),
+                                      {name: [] for name in ARTFReader.ATTRIBUTES})
+                    element.clear()
+                elif element.tag == "Info":
+                    metadata = ARTFMetadata(element.get("HDF5Filename"), element.get("UserID"))
+        finally:
+            if self.encoding:
+                source.close()
+
+        return groups, metadata
+
+    def read_arrays(self) -> tuple[dict[str, dict[str, np.ndarray]], Union[ARTFMetadata, None]]:
+        """Parsed artefacts of every group (keyed like read_groups): StartTime,
+        EndTime and ModifiedDate as int64 Unix microseconds (MISSING_TIME if
+        absent) and ModifiedBy as strings (None if absent).
+        With a cache directory, the arrays are loaded from the cache while the
+        ARTF file keeps its size and modification time."""
+        cache_path = self._cache_path()
+        signature = self._signature()
+        if cache_path:
+            cached = ARTFReader._load_cache(cache_path, signature)
+            if cached is not None:
+                instrumentation.count("artf_cache_hits")
+                return cached
+            instrumentation.count("artf_cache_misses")
 
+        groups, metadata = self.read_groups()
+        arrays = {}
+        for group, columns in groups.items():
+            modified_dates = np.array([d is not None for d in columns["ModifiedDate"]], dtype=bool)
+            modified = np.full(modified_dates.size, ARTFReader.MISSING_TIME, dtype=np.int64)
+            modified[modified_dates] = parse_artf_times([d for d in columns["ModifiedDate"] if d is not None])
+            arrays[group] = {
+                "StartTime": parse_artf_times(columns["StartTime"]),
+                "EndTime": parse_artf_times(columns["EndTime"]),
+                "ModifiedDate": modified,
+                "ModifiedBy": np.array(columns["ModifiedBy"], dtype=object),
+            }
 
-    def read(self, abp_name="abp") -> tuple[list[Artefact],
+        if cache_path:
+            ARTFReader._save_cache(cache_path, signature, arrays, metadata)
+        return arrays, metadata
+
+    def _signature(self):
+        stat = os.stat(self.filename)
+        return np.array([stat.st_size, stat.st_mtime_ns, ARTFReader.CACHE_VERSION], dtype=np.int64)
+
+    def _cache_path(self):
+        if not self.cache_dir:
+            return None
+        # one entry per ARTF file, replaced when the file changes
+        key = hashlib.sha1(os.path.abspath(self.filename).encode()).hexdigest()[:16]
+        return os.path.join(self.cache_dir, f"{os.path.basename(self.filename)}.{key}.npz")
+
+    @staticmethod
+    def _load_cache(cache_path, signature):
+        try:
+            with np.load(cache_path) as cache:
+                if not np.array_equal(cache["signature"], signature):
+                    return None
+                arrays = {}
+                for i, group in enumerate(cache["groups"].tolist()):
+                    modified_by = cache[f"{i}_ModifiedBy"].astype(object)
+                    modified_by[~cache[f"{i}_HasModifiedBy"]] = None
+                    arrays[group] = {name: cache[f"{i}_{name}"] for name in ("StartTime", "EndTime", "ModifiedDate")}
+                    arrays[group]["ModifiedBy"] = modified_by
+                metadata = None
+                if cache["has_metadata"]:
+                    hdf5_filename, user_id = (value if present else None for value, present
+                                              in zip(cache["metadata"].tolist(), cache["metadata_present"]))
+                    metadata = ARTFMetadata(hdf5_filename, user_id)
+                return arrays, metadata
+        except (OSError, KeyError, ValueError, EOFError, zipfile.BadZipFile):
+            # missing, empty or unreadable cache entries are parsed again
+            return None
+
+    @staticmethod
+    def _save_cache(cache_path, signature, arrays, metadata):
+        """Writes the cache entry, returns False if it could not be written."""
+        entries = {"signature": signature, "groups": np.array(list(arrays), dtype=str)}
+        for i, columns in enumerate(arrays.values()):
+            for name in ("StartTime", "EndTime", "ModifiedDate"):
+                entries[f"{i}_{name}"] = columns[name]
+            entries[f"{i}_ModifiedBy"] = np.array([v or "" for v in columns["ModifiedBy"]], dtype=str)
+            entries[f"{i}_HasModifiedBy"] = np.array([v is not None for v in columns["ModifiedBy"]], dtype=bool)
+        metadata_values = (metadata.hdf5_filename, metadata.user_id) if metadata else (None, None)
+        entries["has_metadata"] = np.array(metadata is not None)
+        entries["metadata"] = np.array([v or "" for v in metadata_values], dtype=str)
+        entries["metadata_present"] = np.array([v is not None for v in metadata_values], dtype=bool)
+
+        # written under a temporary name first, so that concurrent readers never see a partial file
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(cache_path) or ".", exist_ok=True)
+            with open(tmp_path, "wb") as f:
+                np.savez(f, **entries)
+            os.replace(tmp_path, cache_path)
+        except OSError:
+            # e.g. a read-only or full cache directory: the parsed artefacts are used uncached
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return False
+        return True
+
+    @staticmethod
+    def detect_abp_name(groups) -> str:
+        """Returns the name of the ABP signal group, "abp" or "art"."""
+        if "abp" not in groups and "art" in groups:
+            return "art"
+        return "abp"
+
+    @staticmethod
+    def check_signal_groups(groups, abp_name):
+        for name in groups:
+            if name not in ("Global", "icp", abp_name):
+                raise WrongSignalGroupError(f"Expected SignalGroups icp and {abp_name} but found {name}")
+
+    def read_times(self, abp_name=None) -> dict[str, tuple[np.ndarray, np.ndarray]]:
+        """Reads artefact start and end times (Unix microseconds, int64) of
+        every group without creating Artefact objects.
+        Returns a dict with the keys "global", "icp" and "abp"."""
+        groups, _ = self.read_arrays()
+        abp_name = abp_name or ARTFReader.detect_abp_name(groups)
+        ARTFReader.check_signal_groups(groups, abp_name)
+
+        times = {}
+        for key, group in (("global", "Global"), ("icp", "icp"), ("abp", abp_name)):
+            columns = groups.get(group, ARTFReader._empty_group())
+            times[key] = (columns["StartTime"], columns["EndTime"])
+        return times
+
+    def read(self, abp_name=None) -> tuple[list[Artefact],
                             list[Artefact],
                             list[Artefact],
                             Union[ARTFMetadata, None]]:
         """Reads artefacts from .ARTF file.
-        Returns Global, ICP and ABP artefacts in order."""
-        tree = ET.parse(self.filename)
-        root = tree.getroot()
+        Returns Global, ICP and ABP artefacts in order.
+        abp_name: name of the ABP signal group, detected ("abp" or "art") if not given."""
+        groups, metadata = self.read_arrays()
+        abp_name = abp_name or ARTFReader.detect_abp_name(groups)
+        ARTFReader.check_signal_groups(groups, abp_name)
 
-        global_artefacts = []
-        icp_artefacts = []
-        abp_artefacts = []
-        metadata = None
-
-        for child in root:
-            if child.tag == "Global":
-                for artefact in child.findall("Artefact"):
-                    global_artefacts.append(Artefact.from_artf_dict({
-                        "ModifiedBy": artefact.get("ModifiedBy"),
-                        "ModifiedDate": artefact.get("ModifiedDate"),
-                        "StartTime": artefact.get("StartTime"),
-                        "EndTime": artefact.get("EndTime")
-                    }, ARTFReader.DATE_FMT))
-
-            if child.tag == "SignalGroup":
-                if child.get("Name") == "icp":
-                    for artefact in child.findall("Artefact"):
-                        icp_artefacts.append(Artefact.from_artf_dict({
-                            "ModifiedBy": artefact.get("ModifiedBy"),
-                            "ModifiedDate": artefact.get("ModifiedDate"),
-                            "StartTime": artefact.get("StartTime"),
-                            "EndTime": artefact.get("EndTime")
-                        }, ARTFReader.DATE_FMT))
-                elif child.get("Name") == abp_name:
-                    for artefact in child.findall("Artefact"):
-                        abp_artefacts.append(Artefact.from_artf_dict({
-                            "ModifiedBy": artefact.get("ModifiedBy"),
-                            "ModifiedDate": artefact.get("ModifiedDate"),
-                            "StartTime": artefact.get("StartTime"),
-                            "EndTime": artefact.get("EndTime")
-                        }, ARTFReader.DATE_FMT))
-                else:
-                    series_name = child.get("Name")
-                    raise WrongSignalGroupError(f"Expected SignalGroups icp and {abp_name} but found {series_name}")
-            if child.tag == "Info":
-                hdf5_filename = child.get("HDF5Filename")
-                user_id = child.get("UserID")
-                metadata = ARTFMetadata(hdf5_filename, user_id)
+        artefacts = []
+        for group in ("Global", "icp", abp_name):
+            columns = groups.get(group, ARTFReader._empty_group())
+            start_times = artf_times_to_datetimes(columns["StartTime"])
+            end_times = artf_times_to_datetimes(columns["EndTime"])
+            # Artefacts without ModifiedDate get the current time, see Artefact
+            has_modified = columns["ModifiedDate"] != ARTFReader.MISSING_TIME
+            parsed = iter(artf_times_to_datetimes(columns["ModifiedDate"][has_modified]))
+            modified_times = [next(parsed) if present else None for present in has_modified]
+            artefacts.append([Artefact(start_time, end_time, modified_time, modified_by)
+                              for start_time, end_time, modified_time, modified_by
+                              in zip(start_times, end_times, modified_times, columns["ModifiedBy"].tolist())])
 
+        global_artefacts, icp_artefacts, abp_artefacts = artefacts
         return global_artefacts, icp_artefacts, abp_artefacts, metadata
+
+    @staticmethod
+    def _empty_group():
+        return {
+            "StartTime": np.empty(0, dtype=np.int64),
+            "EndTime": np.empty(0, dtype=np.int64),
+            "ModifiedDate": np.empty(0, dtype=np.int64),
+            "ModifiedBy": np.empty(0, dtype=object),
+        }
@@ -0,0 +1,78 @@
+import os
+import sys
+
+import h5py
+import numpy as np
+import pytest
+
+# the tests import `lib` and `benchmarks` from the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.synthetic import MICROSEC_IN_SEC, QUALITY_DTYPE, write_artf, write_pair, write_recording  # noqa: E402
+
+
+@pytest.fixture
+def recording(tmp_path):
+    """A 30 min recording with gaps between its index blocks, bad quality spans and artefacts (TBI_001.hdf5/.artf)."""
+    return write_pair(str(tmp_path), "TBI_001", 1800, n_artefacts=40, n_blocks=6, n_bad=4)
+
+
+@pytest.fixture
+def uneven_windows_recording(tmp_path):
+    """The same recording with 7 s artefacts, so that the normal windows between them are 10 to 14 s long."""
+    path = write_pair(str(tmp_path), "TBI_001", 1800, n_artefacts=40, n_blocks=6, n_bad=4)
+    with h5py.File(path, "r") as hdf:
+        index = hdf["waves/icp.index"][:]
+    write_artf(path[:-len(".hdf5")] + ".artf", index, 40, window_s=7)
+    return path
+
+
+@pytest.fixture
+def contiguous_recording(tmp_path):
+    """The same recording with contiguous, uncompressed signal datasets, which can be memory-mapped."""
+    return write_pair(str(tmp_path), "TBI_002", 1800, n_artefacts=40, n_blocks=6, n_bad=4,
+                      compression=None, chunked=False)
+
+
+@pytest.fixture
+def overlapping_recording(tmp_path):
+    """The recording with its second index block moved to the start of the first one and cut to 20 s,
+    so that the blocks overlap and their end times are not sorted."""
+    path = write_pair(str(tmp_path), "TBI_004", 1800, n_artefacts=40, n_blocks=6, n_bad=4)
+    with h5py.File(path, "r+") as hdf:
+        for signal in ("icp", "abp"):
+            index = hdf[f"waves/{signal}.index"][:]
+            index["starttime"][1] = index["starttime"][0]
+            index["length"][1] = 20 * index["frequency"][1]
+            hdf[f"waves/{signal}.index"][...] = index
+    return path
+
+
+@pytest.fixture
+def irregular_recording(tmp_path):
+    """A 1 h recording whose gaps are not a whole number of samples, with quality entries
+    before the data, inside the gaps and on the block boundaries."""
+    path = str(tmp_path / "TBI_003.hdf5")
+    index = write_recording(path, 3600, n_blocks=20, gap_s=3.3, n_bad=8)
+    starts = index["starttime"].astype(np.int64)
+    ends = (starts + index["length"] / index["frequency"] * MICROSEC_IN_SEC).astype(np.int64)
+
+    with h5py.File(path, "r+") as hdf:
+        for signal in ("icp", "abp"):
+            quality = hdf[f"waves/{signal}.quality"][:]
+            times = np.concatenate([quality["time"], [starts[0] - 5 * MICROSEC_IN_SEC],
+                                    (ends[:-1] + starts[1:]) // 2, starts[3::4], ends[5::6]])
+            times = np.unique(times)
+            table = np.empty(len(times), dtype=QUALITY_DTYPE)
+            table["time"] = times
+            # every third section is bad quality
+            table["value"] = np.arange(len(times)) % 3 == 1
+            del hdf[f"waves/{signal}.quality"]
+            hdf.create_dataset(f"waves/{signal}.quality", data=table)
+    return path
+
+
+def touch_later(path):
+    """Moves the modification time of a file forward, so that caches keyed on it become stale."""
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10_000_000_000))
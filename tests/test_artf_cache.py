@@ -0,0 +1,130 @@
+import errno
+import os
+
+import numpy as np
+import pytest
+
+from lib.readers import ARTFReader
+
+from conftest import touch_later
+
+
+@pytest.fixture
+def parses(monkeypatch):
+    """Records the ARTF files parsed rather than loaded from the cache."""
+    parsed = []
+    read_groups = ARTFReader.read_groups
+
+    def counting_read_groups(self, *args, **kwargs):
+        parsed.append(self.filename)
+        return read_groups(self, *args, **kwargs)
+
+    monkeypatch.setattr(ARTFReader, "read_groups", counting_read_groups)
+    return parsed
+
+
+def artf_path(recording):
+    return os.path.splitext(recording)[0] + ".artf"
+
+
+def read_arrays(recording, cache_dir):
+    return ARTFReader(artf_path(recording), cache_dir=str(cache_dir)).read_arrays()
+
+
+def assert_same_arrays(a, b):
+    assert set(a) == set(b)
+    for group in a:
+        for name in ("StartTime", "EndTime", "ModifiedDate"):
+            np.testing.assert_array_equal(a[group][name], b[group][name])
+        assert list(a[group]["ModifiedBy"]) == list(b[group]["ModifiedBy"])
+
+
+def test_cache_hit_matches_parse(recording, tmp_path, parses):
+    parsed, parsed_metadata = read_arrays(recording, tmp_path / "cache")
+    assert len(parses) == 1
+
+    cached, cached_metadata = read_arrays(recording, tmp_path / "cache")
+    assert len(parses) == 1
+    assert_same_arrays(cached, parsed)
+    assert cached_metadata == parsed_metadata
+    assert_same_arrays(cached, ARTFReader(artf_path(recording)).read_arrays()[0])
+
+
+def test_changed_artf_is_parsed_again(recording, tmp_path, parses):
+    read_arrays(recording, tmp_path / "cache")
+    path = artf_path(recording)
+    with open(path) as f:
+        content = f.read()
+    # drop the first artefact of the file
+    first = content.index("<Artefact")
+    with open(path, "w") as f:
+        f.write(content[:first] + content[content.index("/>", first) + 2:])
+    touch_later(path)
+
+    arrays, _ = read_arrays(recording, tmp_path / "cache")
+    assert len(parses) == 2
+    assert_same_arrays(arrays, ARTFReader(path).read_arrays()[0])
+
+
+@pytest.mark.parametrize("content", [b"", b"garbage", None])
+def test_corrupt_cache_is_parsed_again(recording, tmp_path, parses, content):
+    cache_dir = tmp_path / "cache"
+    parsed, _ = read_arrays(recording, cache_dir)
+    (cache_path,) = cache_dir.iterdir()
+    if content is None:
+        # truncated in the middle of the archive
+        content = cache_path.read_bytes()[:cache_path.stat().st_size // 2]
+    cache_path.write_bytes(content)
+
+    arrays, _ = read_arrays(recording, cache_dir)
+    assert len(parses) == 2
+    assert_same_arrays(arrays, parsed)
+    # the cache entry is written again
+    read_arrays(recording, cache_dir)
+    assert len(parses) == 2
+
+
+def assert_parsed_uncached(recording, cache_dir, parses):
+    expected, _ = ARTFReader(artf_path(recording)).read_arrays()
+    for _ in range(2):
+        arrays, _ = read_arrays(recording, cache_dir)
+        assert_same_arrays(arrays, expected)
+    # nothing was cached, so every read parsed the file
+    assert len(parses) == 3
+    assert not os.path.isdir(cache_dir) or not [name for name in os.listdir(cache_dir) if name.endswith(".tmp")]
+
+
+@pytest.mark.parametrize("error", [errno.ENOSPC, errno.EROFS, errno.EACCES])
+def test_unwritable_cache_is_skipped(recording, tmp_path, parses, monkeypatch, error):
+    savez = np.savez
+
+    def failing_savez(*args, **kwargs):
+        savez(*args, **kwargs)
+        raise OSError(error, os.strerror(error))
+
+    monkeypatch.setattr(np, "savez", failing_savez)
+    assert_parsed_uncached(recording, tmp_path / "cache", parses)
+    assert os.listdir(tmp_path / "cache") == []
+
+
+def test_cache_dir_that_cannot_be_created_is_skipped(recording, tmp_path, parses):
+    (tmp_path / "cache").write_text("not a directory")
+    assert_parsed_uncached(recording, tmp_path / "cache", parses)
+
+
+@pytest.mark.skipif(os.name != "posix" or os.geteuid() == 0, reason="needs file permissions that apply to the user")
+def test_read_only_cache_dir_is_skipped(recording, tmp_path, parses):
+    cache_dir = tmp_path / "cache"
+    cache_dir.mkdir()
+    cache_dir.chmod(0o555)
+    try:
+        assert_parsed_uncached(recording, cache_dir, parses)
+        assert os.listdir(cache_dir) == []
+    finally:
+        cache_dir.chmod(0o755)
+
+
+def test_cache_dir_from_environment(recording, tmp_path, monkeypatch):
+    monkeypatch.setenv(ARTFReader.CACHE_DIR_ENV, str(tmp_path / "env_cache"))
+    ARTFReader(artf_path(recording)).read_arrays()
+    assert len(list((tmp_path / "env_cache").iterdir())) == 1
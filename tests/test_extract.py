@@ -0,0 +1,54 @@
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+import extract
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_extract(recording, output_dir, *options):
+    subprocess.run([sys.executable, "extract.py", "-f", recording, "-s", "icp", "-o", str(output_dir), *options],
+                   cwd=REPOSITORY, check=True)
+
+
+def load_text_export(output_dir):
+    """Returns the values of every segment of the txt export by file name (without .txt)."""
+    return {name[:-len(".txt")]: np.atleast_1d(np.loadtxt(output_dir / name)) for name in os.listdir(output_dir)}
+
+
+@pytest.mark.parametrize("matching", [False, True])
+@pytest.mark.parametrize("export_format", ["npy", "npz"])
+def test_binary_export_matches_text_export(uneven_windows_recording, tmp_path, export_format, matching):
+    options = ["-sn"] if matching else []
+    run_extract(uneven_windows_recording, tmp_path / "txt", *options)
+    run_extract(uneven_windows_recording, tmp_path / "binary", "-t", export_format, *options)
+
+    if export_format == "npz":
+        arrays = np.load(tmp_path / "binary" / "TBI_001_icp.npz")
+        data = arrays["data"]
+    else:
+        arrays = np.load(tmp_path / "binary" / "TBI_001_icp_meta.npz")
+        data = np.load(tmp_path / "binary" / "TBI_001_icp.npy", mmap_mode="r")
+
+    # the binary export leaves out the empty segments
+    expected = {name: values for name, values in load_text_export(tmp_path / "txt").items() if values.size}
+    assert sorted(arrays["names"].tolist()) == sorted(expected)
+    assert arrays["labels"].tolist() == [int(name.rsplit("_", 1)[1]) for name in arrays["names"].tolist()]
+    assert arrays["frequency"] == 125
+    assert data.shape[1] == max(values.size for values in expected.values())
+    for row, name, length in zip(data, arrays["names"].tolist(), arrays["lengths"].tolist()):
+        np.testing.assert_array_equal(row[:length], expected[name])
+        assert (row[length:] == -99999).all()
+
+
+def test_matching_rows_are_selected_by_label():
+    # normal segments before, between and after the anomalies
+    labels = np.array([0, 1, 0, 0, 1, 0, 0, 1, 0, 0], dtype=np.int8)
+    rows = extract.select_matching_rows(labels)
+
+    assert rows.tolist() == [0, 1, 2, 3, 4, 7]
+    assert labels[rows].tolist().count(0) == labels[rows].tolist().count(1)
@@ -0,0 +1,378 @@
+import math
+
+import h5py
+import numpy as np
+import pytest
+
+from benchmarks.synthetic import write_recording
+from lib.hdf5_reader_module import (CacheSignalClass, DataStreamClass, DualSignalClass, MyHdF5signalReaderClass,
+                                    ReadAheadPageIterator, SignalClass, memmap_dataset)
+
+MICROSEC_IN_SEC = 1000000
+
+
+class LinearLookup:
+    """The table scans of the original MyHdF5signalReaderClass, the reference for the binary searches."""
+
+    def __init__(self, index_tbl, qual_tbl):
+        self._index_tbl = index_tbl
+        self._qual_tbl = qual_tbl
+
+    def time_to_sample_index(self, time_stamp_microsec):
+        if time_stamp_microsec < self._index_tbl[0][1]:
+            return -1, time_stamp_microsec - self._index_tbl[0][1]
+
+        prev_value_idx = self.get_last_value_index()
+        for i in range(0, len(self._index_tbl)):
+            start_index, start_time_microsec, length, sampling_frq = self._index_tbl[i]
+            end_time_microsec = start_time_microsec + length / sampling_frq * MICROSEC_IN_SEC
+            if time_stamp_microsec < start_time_microsec:
+                prev_value_idx = self._index_tbl[i - 1][0] + self._index_tbl[i - 1][2] - 1
+                break
+            if start_time_microsec <= time_stamp_microsec < end_time_microsec:
+                prev_value_idx = math.floor(start_index + (time_stamp_microsec - start_time_microsec) / MICROSEC_IN_SEC * sampling_frq)
+                break
+        return prev_value_idx, time_stamp_microsec - self.index_to_time(prev_value_idx)
+
+    def get_last_value_index(self):
+        return self._index_tbl[-1][0] + self._index_tbl[-1][2] - 1
+
+    def index_to_time(self, value_index):
+        start_index, start_time_microsec, _, sampling_frq = self._index_tbl[self.get_index_tbl_entry_index(value_index)]
+        return start_time_microsec + (value_index - start_index) / sampling_frq * MICROSEC_IN_SEC
+
+    def is_normal_quality_point(self, value_index):
+        qual_index = self.get_quality_entry_index(value_index)
+        return qual_index >= 0 and self._qual_tbl[qual_index][1] == 0
+
+    def get_quality_entry_index(self, value_index):
+        time_stamp_microsec = self.index_to_time(value_index)
+        if time_stamp_microsec < self._qual_tbl[0][0]:
+            return -1
+        for i in range(1, len(self._qual_tbl)):
+            if self._qual_tbl[i][0] > time_stamp_microsec:
+                return i - 1
+        return len(self._qual_tbl) - 1
+
+    def get_index_tbl_entry_index(self, value_index):
+        for i in range(1, len(self._index_tbl)):
+            if self._index_tbl[i][0] > value_index:
+                return i - 1
+        return len(self._index_tbl) - 1
+
+    def find_cont_section_end_index(self, value_index):
+        entry = self._index_tbl[self.get_index_tbl_entry_index(value_index)]
+        return entry[0] + entry[2] - 1
+
+    def find_end_index_of_current_quality_section(self, value_index):
+        qual_entry_index = self.get_quality_entry_index(value_index)
+        if qual_entry_index == len(self._qual_tbl) - 1:
+            return self.get_last_value_index()
+        sample_index, delta_t = self.time_to_sample_index(self._qual_tbl[qual_entry_index + 1][0])
+        if delta_t == 0:
+            sample_index -= 1
+        return sample_index
+
+    def find_next_normal_quality_section_index(self, value_index):
+        cur_qual_index = self.get_quality_entry_index(value_index)
+        if cur_qual_index == -1 or self._qual_tbl[cur_qual_index][1] == 0:
+            cur_qual_index += 1
+        for i in range(cur_qual_index, len(self._qual_tbl)):
+            if self._qual_tbl[i][1] == 0:
+                normal_quality_start_idx, delta_t = self.time_to_sample_index(self._qual_tbl[i][0])
+                if delta_t > 0:
+                    normal_quality_start_idx += 1
+                return normal_quality_start_idx
+        return self.get_last_value_index() + 1
+
+    def sections(self, first_index, last_index):
+        """Returns the (start index, length) of the good quality sections the original Iterator walked through."""
+        sections = []
+        value_index = first_index
+        while value_index <= last_index:
+            if not self.is_normal_quality_point(value_index):
+                value_index = self.find_next_normal_quality_section_index(value_index)
+            if 0 <= value_index <= last_index and self.is_normal_quality_point(value_index):
+                end_index = min(self.find_cont_section_end_index(value_index),
+                                self.find_end_index_of_current_quality_section(value_index), last_index)
+                sections.append((value_index, end_index - value_index + 1))
+                value_index = end_index + 1
+            else:
+                value_index = self.find_next_normal_quality_section_index(value_index)
+        return sections
+
+
+def open_tables(path, signal="icp"):
+    with h5py.File(path, "r") as hdf:
+        return hdf[f"waves/{signal}.index"][:], hdf[f"waves/{signal}.quality"][:]
+
+
+def boundary_times(index_tbl, qual_tbl, count=300, seed=0):
+    """Time stamps around every block start and end and every quality entry, plus random ones."""
+    starts = index_tbl["starttime"].astype(np.int64)
+    ends = (starts + index_tbl["length"] / index_tbl["frequency"] * MICROSEC_IN_SEC).astype(np.int64)
+    edges = np.concatenate([starts, ends, qual_tbl["time"]])
+    random = np.random.default_rng(seed).integers(starts[0] - 10 * MICROSEC_IN_SEC, ends[-1] + 10 * MICROSEC_IN_SEC, count)
+    return np.unique(np.concatenate([(edges[:, None] + np.array([-8000, -1, 0, 1, 4000])).ravel(), random])).tolist()
+
+
+def boundary_indices(reference, index_tbl, qual_tbl, count=300, seed=0):
+    """Value indices around every block boundary and the first value of every quality section, plus random ones."""
+    last = reference.get_last_value_index()
+    qual_indices = [reference.time_to_sample_index(time)[0] for time in qual_tbl["time"].tolist()]
+    edges = np.concatenate([index_tbl["startidx"], index_tbl["startidx"] + index_tbl["length"] - 1, qual_indices])
+    random = np.random.default_rng(seed).integers(0, last + 1, count)
+    indices = np.concatenate([(edges[:, None] + np.array([-1, 0, 1])).ravel(), random])
+    return np.unique(np.clip(indices, 0, last)).tolist()
+
+
+def window_starts(signal, count=200, seed=0):
+    """Random window starts from before the first to after the last value, plus block and quality boundaries."""
+    lookup = signal._data_reader.get_lookup()
+    start, end = signal.get_all_data_start_time(), signal.get_all_data_end_time()
+    rng = np.random.default_rng(seed)
+    edges = np.concatenate([lookup._block_start_time, lookup._block_end_time, lookup._qual_time]).astype(np.int64)
+    near_edges = (edges[:, None] + np.array([-10_000_000, -1, 0, 1, 5_000_000])[None, :]).ravel()
+    return np.concatenate([rng.integers(int(start - 600e6), int(end + 600e6), count), near_edges]).astype(np.int64)
+
+
+def test_lookup_matches_linear_scans(irregular_recording):
+    index_tbl, qual_tbl = open_tables(irregular_recording)
+    reference = LinearLookup(index_tbl, qual_tbl)
+    with h5py.File(irregular_recording, "r") as hdf:
+        reader = MyHdF5signalReaderClass(hdf)
+        reader.init_wave_data("icp")
+
+        for time in boundary_times(index_tbl, qual_tbl):
+            assert reader.time_to_sample_index(time) == reference.time_to_sample_index(time)
+
+        for value_index in boundary_indices(reference, index_tbl, qual_tbl):
+            for method in ("index_to_time", "get_index_tbl_entry_index", "get_quality_entry_index",
+                           "is_normal_quality_point", "find_cont_section_end_index",
+                           "find_end_index_of_current_quality_section", "find_next_normal_quality_section_index"):
+                assert getattr(reader, method)(value_index) == getattr(reference, method)(value_index), (method, value_index)
+
+
+def test_reader_methods_return_python_numbers(irregular_recording):
+    with h5py.File(irregular_recording, "r") as hdf:
+        reader = MyHdF5signalReaderClass(hdf)
+        reader.init_wave_data("icp")
+        start = reader.get_all_data_start_time()
+        last = reader.get_last_value_index()
+        assert type(last) is int
+
+        # before the data, at the first value, within a block and after the data
+        for time in (start - 1e6, start, start + 123_456, reader.get_all_data_end_time() + 1e6):
+            value_index, delta_t = reader.time_to_sample_index(time)
+            assert (type(value_index), type(delta_t)) == (int, float)
+
+        for value_index in (0, last // 2, last):
+            assert type(reader.index_to_time(value_index)) is float
+            assert type(reader.get_sampling_frq(value_index)) is float
+            assert type(reader.is_normal_quality_point(value_index)) is bool
+            for method in ("get_index_tbl_entry_index", "get_quality_entry_index", "find_cont_section_end_index",
+                           "find_end_index_of_current_quality_section", "find_next_normal_quality_section_index"):
+                assert type(getattr(reader, method)(value_index)) is int, method
+
+
+def test_get_data_stream_writes_into_out(recording):
+    with h5py.File(recording, "r") as hdf:
+        signal = SignalClass(hdf, "icp")
+        start, end = signal.get_all_data_start_time(), signal.get_all_data_end_time()
+        out = np.full(200 * 125, -1.0)
+        # before the data, inside a block, over the gap after the first block and after the data
+        for page_start in (start - 30e6, start + 100e6, start + 280e6, end - 30e6):
+            expected = signal.get_data_stream(page_start, 120e6).values
+            values = signal.get_data_stream(page_start, 120e6, out=out).values
+            assert np.shares_memory(values, out)
+            np.testing.assert_array_equal(values, expected)
+
+        with pytest.raises(ValueError):
+            signal.get_data_stream(start, 120e6, out=np.empty(10))
+
+
+def test_planned_sections_match_the_iterator_walk(irregular_recording):
+    index_tbl, qual_tbl = open_tables(irregular_recording)
+    reference = LinearLookup(index_tbl, qual_tbl)
+    times = boundary_times(index_tbl, qual_tbl, count=100)
+    with h5py.File(irregular_recording, "r") as hdf:
+        reader = MyHdF5signalReaderClass(hdf)
+        reader.init_wave_data("icp")
+        for page_start, page_len in zip(times, np.resize([1e6, 20e6, 300e6], len(times)).tolist()):
+            reader.load_raw_data_set(page_start, page_len)
+            start_indices, lengths, start_times, frequencies = reader.plan_sections()
+            if reader.is_empty():
+                assert len(start_indices) == 0
+                continue
+            expected = reference.sections(reader.get_loaded_data_start_index(), reader.get_loaded_data_end_index())
+            assert list(zip(start_indices.tolist(), lengths.tolist())) == expected
+            assert start_times.tolist() == [reference.index_to_time(start_index) for start_index, _ in expected]
+
+
+def test_cache_signal_matches_signal(recording):
+    with h5py.File(recording, "r") as hdf:
+        signal = SignalClass(hdf, "icp")
+        cache = CacheSignalClass(hdf, "icp", cache_duration_in_hours=0.05, page_duration_sec=60)
+        start = signal.get_all_data_start_time()
+        for offset in list(range(0, 1800, 45)) + list(range(1800, 0, -70)):
+            page_start = start + offset * 1e6
+            np.testing.assert_array_equal(cache.get_data_stream(page_start, 100e6).values,
+                                          signal.get_data_stream(page_start, 100e6).values)
+
+        stats = cache.get_cache_stats()
+        assert stats["hits"] > 0 and stats["misses"] > 0 and stats["evictions"] > 0
+        # 0.05 h of float64 values at 125 Hz, at most three pages (shorter at the end of a block)
+        assert stats["pages"] <= 3 and stats["cached_bytes"] <= 0.05 * 3600 * 125 * 8
+
+
+def test_cache_signal_matches_signal_between_samples_and_after_gaps(irregular_recording):
+    with h5py.File(irregular_recording, "r") as hdf:
+        signal = SignalClass(hdf, "abp")
+        cache = CacheSignalClass(hdf, "abp", cache_duration_in_hours=0.1, page_duration_sec=60)
+        lookup = signal._data_reader.get_lookup()
+        rng = np.random.default_rng(2)
+        # starts between two samples (8 ms apart) and just after the gaps, which are not a whole number of samples long
+        starts = window_starts(signal, count=100)
+        starts = np.concatenate([starts + rng.integers(1, 8000, starts.size), lookup._block_start_time + 1,
+                                 np.ceil(lookup._block_end_time).astype(np.int64) + 1])
+        for start, length in zip(starts.tolist(), rng.choice([0, 1e6, 10e6, 70e6, 200e6], starts.size).tolist()):
+            np.testing.assert_array_equal(cache.get_data_stream(start, length).values,
+                                          signal.get_data_stream(start, length).values)
+
+
+@pytest.mark.parametrize("max_cache_bytes", [2 * 7500 * 8, 1000])
+def test_cache_signal_stays_within_its_budget(recording, max_cache_bytes):
+    with h5py.File(recording, "r") as hdf:
+        signal = SignalClass(hdf, "icp")
+        # 60 s pages of 7500 values, a 20 min request spans about 20 of them
+        cache = CacheSignalClass(hdf, "icp", cache_duration_in_hours=1, page_duration_sec=60, max_cache_bytes=max_cache_bytes)
+        cached_bytes = []
+        read_values = cache._data_reader.read_values
+
+        def recording_read_values(*args):
+            cached_bytes.append(cache.get_cache_stats()["cached_bytes"])
+            return read_values(*args)
+
+        cache._data_reader.read_values = recording_read_values
+        start = signal.get_all_data_start_time()
+        np.testing.assert_array_equal(cache.get_data_stream(start, 1200e6).values,
+                                      signal.get_data_stream(start, 1200e6).values)
+        cached_bytes.append(cache.get_cache_stats()["cached_bytes"])
+
+        assert len(cached_bytes) > 3
+        assert max(cached_bytes) <= max_cache_bytes
+
+
+def test_cache_signal_values_do_not_alias_the_cache(recording):
+    with h5py.File(recording, "r") as hdf:
+        cache = CacheSignalClass(hdf, "icp", cache_duration_in_hours=1)
+        page_start = cache.get_all_data_start_time() + 3e6
+        values = cache.get_data_stream(page_start, 1e6).values
+        expected = values.copy()
+        values[:] = -1
+        np.testing.assert_array_equal(cache.get_data_stream(page_start, 1e6).values, expected)
+
+
+@pytest.mark.parametrize("abp_name", ["abp", "art"])
+def test_dual_signal_matches_separate_reads(tmp_path, abp_name):
+    path = str(tmp_path / "TBI_004.hdf5")
+    write_recording(path, 1800, signals=("icp", abp_name), n_blocks=6, n_bad=4)
+    with h5py.File(path, "r") as hdf:
+        dual = DualSignalClass(hdf)
+        assert dual.get_signal_names() == ("icp", abp_name)
+        signals = SignalClass(hdf, "icp"), SignalClass(hdf, abp_name)
+        start = dual.get_all_data_start_time()
+        for page_start in (start - 30e6, start + 100e6, start + 280e6, dual.get_all_data_end_time() - 30e6):
+            values, frequency = dual.get_dual_data_stream(page_start, 120e6)
+            assert frequency == 125
+            for row, signal in zip(values, signals):
+                expected = signal.get_data_stream(page_start, 120e6).values
+                np.testing.assert_array_equal(row[:len(expected)], expected)
+                assert np.isnan(row[len(expected):]).all()
+
+
+def test_dual_signal_accepts_float_noise_in_frequencies(recording):
+    with h5py.File(recording, "r+") as hdf:
+        index = hdf["waves/abp.index"][:]
+        index["frequency"] = 124.99997
+        hdf["waves/abp.index"][...] = index
+    with h5py.File(recording, "r") as hdf:
+        dual = DualSignalClass(hdf)
+        values, frequency = dual.get_dual_data_stream(dual.get_all_data_start_time(), 10e6)
+        assert values.shape == (2, 1250) and frequency == 125
+
+
+def test_memmap_reads_match_h5py(contiguous_recording, recording):
+    with h5py.File(contiguous_recording, "r") as hdf:
+        assert memmap_dataset(hdf["waves/icp"]) is not None
+        mapped, copied = SignalClass(hdf, "icp", memmap=True), SignalClass(hdf, "icp")
+        start = copied.get_all_data_start_time()
+        for page_start, page_len in ((start - 30e6, 120e6), (start + 280e6, 120e6), (start, 1800e6)):
+            np.testing.assert_array_equal(mapped.get_data_stream(page_start, page_len).values,
+                                          copied.get_data_stream(page_start, page_len).values)
+    with h5py.File(recording, "r") as hdf:
+        # chunked and compressed datasets are read through h5py
+        assert memmap_dataset(hdf["waves/icp"]) is None
+
+
+@pytest.mark.parametrize("memmap", [False, True])
+def test_get_data_streams_matches_get_data_stream(recording, contiguous_recording, memmap):
+    with h5py.File(contiguous_recording if memmap else recording, "r") as hdf:
+        signal = SignalClass(hdf, "icp", memmap=memmap)
+        starts = window_starts(signal)
+        lengths = np.random.default_rng(1).choice([0, 1e6, 10e6, 90e6], starts.size)
+        expected = [signal.get_data_stream(start, length).values for start, length in zip(starts.tolist(), lengths.tolist())]
+
+        for max_read_len in (1000, 16 * 1024 * 1024):
+            streams = signal.get_data_streams(starts, lengths, max_read_len=max_read_len)
+            assert len(streams) == len(expected)
+            for stream, values in zip(streams, expected):
+                np.testing.assert_array_equal(stream, values)
+
+
+def test_get_data_streams_stacks_equal_durations(recording):
+    with h5py.File(recording, "r") as hdf:
+        signal = SignalClass(hdf, "abp")
+        starts = window_starts(signal, count=50)
+        matrix = signal.get_data_streams(starts, 10e6)
+        for row, start in zip(matrix, starts.tolist()):
+            values = signal.get_data_stream(start, 10e6).values
+            np.testing.assert_array_equal(row[:len(values)], values)
+            assert np.isnan(row[len(values):]).all()
+
+
+@pytest.mark.parametrize("depth", [0, 1, 3])
+def test_iter_pages_matches_get_data_stream(recording, depth):
+    with h5py.File(recording, "r") as hdf:
+        signal = SignalClass(hdf, "icp")
+        start, end = signal.get_all_data_start_time(), signal.get_all_data_end_time()
+        expected = [(page_start, signal.get_data_stream(page_start, 120e6).values)
+                    for page_start in np.arange(start, end, 120e6).tolist()]
+        with signal.iter_pages(120e6, depth=depth) as pages:
+            pages = list(pages)
+        assert [page_start for page_start, _ in pages] == [page_start for page_start, _ in expected]
+        for (_, values), (_, expected_values) in zip(pages, expected):
+            np.testing.assert_array_equal(values, expected_values)
+
+
+def test_iter_pages_raises_reader_errors_in_order():
+    class FailingSignal:
+        """Pages of one microsecond from 0 to 10, failing from 5 on."""
+        def get_all_data_start_time(self):
+            return 0
+
+        def get_all_data_end_time(self):
+            return 10
+
+        def get_data_stream(self, page_start_time, page_len_microsec):
+            if page_start_time >= 5:
+                raise KeyError(page_start_time)
+            stream = DataStreamClass()
+            stream.values = np.full(1, page_start_time, dtype=float)
+            return stream
+
+    read = []
+    with pytest.raises(KeyError):
+        for page_start, _ in ReadAheadPageIterator(FailingSignal(), 1, depth=2):
+            read.append(page_start)
+    assert read == [0, 1, 2, 3, 4]
@@ -0,0 +1,48 @@
+import datetime
+
+import numpy as np
+import pytest
+
+from lib.helpers import parse_artf_times
+
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def strptime_microseconds(strtime):
+    """The timestamp strptime reads from an ARTF time, the reference for parse_artf_times."""
+    date, _, fraction = strtime.partition(".")
+    dt = datetime.datetime.strptime(f"{date}.{fraction:0<6}", "%d/%m/%Y %H:%M:%S.%f").replace(tzinfo=datetime.timezone.utc)
+    return (dt - EPOCH) // datetime.timedelta(microseconds=1)
+
+
+def random_artf_times(count, seed=0):
+    rng = np.random.default_rng(seed)
+    times = rng.integers(-50 * 365 * 86400 * 10**6, 150 * 365 * 86400 * 10**6, count)
+    strtimes = []
+    for time, digits in zip(times.tolist(), rng.integers(0, 7, count).tolist()):
+        strtime = (EPOCH + datetime.timedelta(microseconds=time)).strftime("%d/%m/%Y %H:%M:%S.%f")
+        strtimes.append(strtime[:20 + digits] if digits else strtime[:19])
+    return strtimes
+
+
+def test_parse_artf_times_matches_strptime():
+    strtimes = random_artf_times(5000) + [
+        "29/02/2024 23:59:59.999", "28/02/2023 00:00:00", "31/12/1999 23:59:59.9", "01/01/1970 00:00:00.000001",
+        "01/03/2000 12:00:00.5", "31/12/1969 23:59:59.999999",
+        # outside the fixed layout, read by strptime
+        "1/1/2021 00:00:00", "01/01/2021 0:00:00.25",
+    ]
+    assert parse_artf_times(strtimes).tolist() == [strptime_microseconds(strtime) for strtime in strtimes]
+
+
+@pytest.mark.parametrize("strtime", ["29/02/2023 00:00:00.000", "31/04/2021 00:00:00", "01/13/2021 00:00:00",
+                                     "01/01/2021 24:00:00", "01/01/2021 00:60:00", "garbage"])
+def test_parse_artf_times_rejects_what_strptime_rejects(strtime):
+    with pytest.raises(ValueError):
+        strptime_microseconds(strtime)
+    with pytest.raises(ValueError):
+        parse_artf_times(["01/01/2021 00:00:00.000", strtime])
+
+
+def test_parse_artf_times_of_nothing():
+    assert parse_artf_times([]).dtype == np.int64 and parse_artf_times([]).size == 0
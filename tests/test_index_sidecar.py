@@ -0,0 +1,133 @@
+import dataclasses
+import errno
+import os
+
+import h5py
+import numpy as np
+import pytest
+
+from lib import index_sidecar
+from lib.hdf5_reader_module import SignalClass
+from lib.index_sidecar import get_sidecar, load_sidecar, sidecar_path, write_sidecar
+from lib.loader import SingleFileExtractor
+
+from conftest import touch_later
+
+
+@pytest.fixture
+def writes(monkeypatch):
+    """Records the sidecars written by get_sidecar."""
+    written = []
+
+    def counting_write_sidecar(hdf5_path):
+        written.append(hdf5_path)
+        return write_sidecar(hdf5_path)
+
+    monkeypatch.setattr(index_sidecar, "write_sidecar", counting_write_sidecar)
+    return written
+
+
+def test_written_on_first_use_and_reused(recording, writes):
+    first = get_sidecar(recording)
+    second = get_sidecar(recording)
+
+    assert os.path.exists(sidecar_path(recording))
+    assert writes == [recording]
+    assert set(first) == {"icp", "abp"}
+    with h5py.File(recording, "r") as hdf:
+        np.testing.assert_array_equal(first["icp"]["index"], hdf["waves/icp.index"][:])
+        np.testing.assert_array_equal(first["icp"]["quality"], hdf["waves/icp.quality"][:])
+        assert first["icp"]["n_samples"] == hdf["waves/icp"].shape[0]
+    np.testing.assert_array_equal(first["icp"]["start_times"], second["icp"]["start_times"])
+
+
+def test_selective_load(recording):
+    write_sidecar(recording)
+    sidecar = load_sidecar(recording, ["abp", "missing"], ["lengths"])
+    assert list(sidecar) == ["abp"]
+    assert list(sidecar["abp"]) == ["lengths"]
+
+
+def test_stale_sidecar_is_rewritten(recording, writes):
+    write_sidecar(recording)
+    with h5py.File(recording, "r+") as hdf:
+        index = hdf["waves/icp.index"][:]
+        index["starttime"] += 1_000_000
+        hdf["waves/icp.index"][...] = index
+    touch_later(recording)
+
+    assert load_sidecar(recording) is None
+    sidecar = get_sidecar(recording)
+    assert writes == [recording]
+    np.testing.assert_array_equal(sidecar["icp"]["start_times"], index["starttime"])
+
+
+def test_sidecar_of_older_version_is_rewritten(recording, monkeypatch):
+    monkeypatch.setattr(index_sidecar, "SIDECAR_VERSION", index_sidecar.SIDECAR_VERSION - 1)
+    write_sidecar(recording)
+    monkeypatch.undo()
+
+    assert load_sidecar(recording) is None
+    assert get_sidecar(recording) is not None
+
+
+@pytest.mark.parametrize("fraction", [0, 0.1, 0.5, 0.99])
+def test_truncated_sidecar_is_rewritten(recording, fraction):
+    path = write_sidecar(recording)
+    with open(path, "rb") as f:
+        content = f.read()
+    with open(path, "wb") as f:
+        f.write(content[:int(len(content) * fraction)])
+
+    assert load_sidecar(recording) is None
+    assert set(get_sidecar(recording)) == {"icp", "abp"}
+    assert load_sidecar(recording) is not None
+
+
+def test_garbage_sidecar_is_rewritten(recording):
+    with open(sidecar_path(recording), "wb") as f:
+        f.write(b"not a zip file at all")
+
+    assert set(get_sidecar(recording)) == {"icp", "abp"}
+
+
+@pytest.mark.parametrize("error", [errno.ENOSPC, errno.EROFS, errno.EACCES])
+def test_unwritable_sidecar_falls_back_to_the_file(recording, monkeypatch, error):
+    savez = np.savez
+
+    def failing_savez(*args, **kwargs):
+        savez(*args, **kwargs)
+        raise OSError(error, os.strerror(error))
+
+    monkeypatch.setattr(np, "savez", failing_savez)
+    assert get_sidecar(recording) is None
+    assert not os.path.exists(sidecar_path(recording))
+    assert not [name for name in os.listdir(os.path.dirname(recording)) if name.endswith(".tmp")]
+
+    # the extraction reads the tables from the HDF5 file instead
+    metadata = SingleFileExtractor(recording, "icp", index_sidecar=True).get_metadata()
+    assert metadata == SingleFileExtractor(recording, "icp").get_metadata()
+
+
+@pytest.mark.parametrize("mode", ["abp", "icp"])
+def test_extraction_with_sidecar(recording, mode):
+    with_sidecar = SingleFileExtractor(recording, mode, index_sidecar=True)
+    without = SingleFileExtractor(recording, mode)
+
+    assert dataclasses.asdict(with_sidecar.get_metadata()) == dataclasses.asdict(without.get_metadata())
+    pairs = zip(with_sidecar.get_anomalies() + with_sidecar.get_normal(), without.get_anomalies() + without.get_normal())
+    for a, b in pairs:
+        assert (a.start_time, a.end_time, a.frequency) == (b.start_time, b.end_time, b.frequency)
+        np.testing.assert_array_equal(a.data, b.data)
+    assert os.path.exists(sidecar_path(recording))
+
+
+def test_signal_class_with_sidecar(recording, writes):
+    with h5py.File(recording, "r") as hdf:
+        with_sidecar = SignalClass(hdf, "abp", index_sidecar=True)
+        without = SignalClass(hdf, "abp")
+        start = without.get_all_data_start_time()
+        for page_len in (1e6, 600e6, 3600e6):
+            np.testing.assert_array_equal(with_sidecar.get_data_stream(start, page_len).values,
+                                          without.get_data_stream(start, page_len).values)
+    assert writes == [recording]
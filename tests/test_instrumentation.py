@@ -0,0 +1,105 @@
+import os
+import threading
+import time
+from collections import defaultdict
+
+import pytest
+
+from lib import instrumentation
+from lib.instrumentation import Recorder
+from lib.loader import FolderExtractor, SingleFileExtractor
+
+
+def test_nothing_is_recorded_without_a_recorder():
+    instrumentation.count("hdf5_opens")
+    with instrumentation.timed("hdf5_read"):
+        pass
+
+    assert not instrumentation.is_enabled()
+    with Recorder() as recorder:
+        assert instrumentation.is_enabled()
+    assert recorder.stats() == {"counters": {}, "timings": {}}
+
+
+def test_nested_recorders_receive_all_counts():
+    with Recorder() as outer:
+        instrumentation.count("hdf5_opens")
+        with Recorder() as inner:
+            instrumentation.count("hdf5_opens", 2)
+            with instrumentation.timed("hdf5_read"):
+                pass
+        instrumentation.count("hdf5_opens")
+
+    assert outer.stats()["counters"] == {"hdf5_opens": 4}
+    assert inner.stats()["counters"] == {"hdf5_opens": 2}
+    assert outer.stats()["timings"]["hdf5_read"] == inner.stats()["timings"]["hdf5_read"] >= 0
+    assert not outer.active and not inner.active
+
+
+def test_stats_reset_merge_and_callback():
+    received = []
+    recorder = Recorder(callback=received.append).start()
+    instrumentation.count("artf_parses")
+
+    assert recorder.stats(reset=True)["counters"] == {"artf_parses": 1}
+    assert recorder.stats()["counters"] == {}
+
+    instrumentation.merge({"counters": {"artf_parses": 3}, "timings": {"artf_parse": 0.5}})
+    stats = recorder.stop()
+
+    assert received == [stats]
+    assert stats == {"counters": {"artf_parses": 3}, "timings": {"artf_parse": 0.5}}
+
+
+class _SwitchingDict(defaultdict):
+    """Hands the GIL to another thread between reading and writing a value, where unguarded += would lose counts."""
+
+    def __getitem__(self, key):
+        value = super().__getitem__(key)
+        time.sleep(0)
+        return value
+
+
+def test_threads_share_a_recorder():
+    threads, counts = 8, 500
+
+    def count_and_nest():
+        for _ in range(counts):
+            instrumentation.count("h5py_reads")
+            with Recorder():
+                pass
+
+    with Recorder() as recorder:
+        recorder._counters = _SwitchingDict(int)
+        workers = [threading.Thread(target=count_and_nest) for _ in range(threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+    assert recorder.stats()["counters"] == {"h5py_reads": threads * counts}
+    assert not instrumentation.is_enabled()
+
+
+def test_extraction_counts(recording):
+    with Recorder() as recorder:
+        extractor = SingleFileExtractor(recording, "abp")
+        segments = extractor.get_anomalies() + extractor.get_normal()
+    counters = recorder.stats()["counters"]
+
+    assert counters["artf_parses"] == 1
+    assert counters["hdf5_opens"] >= 1
+    assert counters["h5py_reads"] >= 1
+    assert counters["samples_read"] >= sum(segment.data.size for segment in segments)
+    assert counters["bytes_read"] == 8 * counters["samples_read"]
+    assert {"artf_parse", "hdf5_read", "segment_build"} <= set(recorder.stats()["timings"])
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_worker_processes_report_back(recording, workers):
+    with Recorder() as expected:
+        FolderExtractor(os.path.dirname(recording), "abp").extract_all()
+    with Recorder() as recorder:
+        FolderExtractor(os.path.dirname(recording), "abp", workers=workers).extract_all()
+
+    assert recorder.stats()["counters"] == expected.stats()["counters"]
@@ -0,0 +1,253 @@
+import os
+import shutil
+
+import h5py
+import numpy as np
+import pytest
+
+from benchmarks.synthetic import write_pair
+from lib.instrumentation import Recorder
+from lib.loader import ExtractionError, FolderExtractor, FrequencyMismatchError, SingleFileExtractor
+
+
+def segment_rows(segments):
+    return [(segment.file, segment.start_time, segment.end_time, segment.frequency) for segment in segments]
+
+
+def assert_same_segments(actual, expected):
+    assert segment_rows(actual) == segment_rows(expected)
+    for a, b in zip(actual, expected):
+        np.testing.assert_array_equal(a.data, b.data)
+
+
+@pytest.mark.parametrize("mode", ["abp", "icp"])
+@pytest.mark.parametrize("lazy, memmap", [(True, False), (False, True), (True, True)])
+def test_lazy_and_memmap_segments_match_copies(contiguous_recording, mode, lazy, memmap):
+    extractor = SingleFileExtractor(contiguous_recording, mode, lazy=lazy, memmap=memmap)
+    expected = SingleFileExtractor(contiguous_recording, mode)
+
+    assert_same_segments(extractor.get_anomalies(), expected.get_anomalies())
+    assert_same_segments(extractor.get_normal(), expected.get_normal())
+
+
+def test_lazy_segment_views_are_read_only(recording):
+    extractor = SingleFileExtractor(recording, "abp", lazy=True)
+    views = [segment.data for segment in extractor.get_anomalies() + extractor.get_normal() if not segment.data.flags.owndata]
+
+    assert views
+    for data in views:
+        with pytest.raises(ValueError):
+            data[0] = -1
+
+def test_lazy_segments_do_not_change_the_loaded_data(recording):
+    extractor = SingleFileExtractor(recording, "abp", lazy=True)
+    segment = extractor.get_anomalies()[0]
+    expected = segment.data.copy()
+    if not segment.data.flags.writeable:
+        with pytest.raises(ValueError):
+            segment.data[0] = -1
+    else:
+        segment.data[:] = -1
+    np.testing.assert_array_equal(extractor.get_anomalies()[0].data, expected)
+
+
+def test_segments_array_matches_segments(uneven_windows_recording):
+    recording = uneven_windows_recording
+    extractor = SingleFileExtractor(recording, "icp")
+    with Recorder() as recorder:
+        array = extractor.get_segments_array()
+    # filled from the window arrays, without Segment objects
+    assert "segments_built" not in recorder.stats()["counters"]
+    anomalies = extractor.get_anomalies()
+    segments = anomalies + extractor.get_normal()
+    lengths = [len(segment.data) for segment in segments]
+
+    # the rows fit the longest window
+    assert array.data.shape == (len(segments), max(lengths)) and max(lengths) > 1250 and array.frequency == 125
+    assert array.lengths.tolist() == lengths
+    assert array.labels.tolist() == [1] * len(anomalies) + [0] * (len(segments) - len(anomalies))
+    assert array.start_times.tolist() == [segment.start_time for segment in segments]
+    assert array.patient_ids.tolist() == [segment.patient_id for segment in segments]
+    for row, segment in zip(array.data, segments):
+        np.testing.assert_array_equal(row[:len(segment.data)], segment.data)
+        assert np.isnan(row[len(segment.data):]).all()
+
+    folder_array = FolderExtractor(os.path.dirname(recording), "icp").get_segments_array()
+    np.testing.assert_array_equal(folder_array.data, array.data)
+    np.testing.assert_array_equal(folder_array.lengths, array.lengths)
+
+
+def test_segments_array_keeps_the_true_lengths_of_cut_segments(uneven_windows_recording):
+    extractor = SingleFileExtractor(uneven_windows_recording, "icp")
+    array = extractor.get_segments_array(samples_per_window=1250, pad_value=-99999)
+    segments = extractor.get_anomalies() + extractor.get_normal()
+
+    assert array.data.shape == (len(segments), 1250)
+    assert array.lengths.tolist() == [len(segment.data) for segment in segments]
+    for row, segment in zip(array.data, segments):
+        length = min(len(segment.data), 1250)
+        np.testing.assert_array_equal(row[:length], segment.data[:length])
+        assert (row[length:] == -99999).all()
+
+
+def test_folder_segments_array_pads_to_the_longest_segment(uneven_windows_recording):
+    folder = os.path.dirname(uneven_windows_recording)
+    write_pair(folder, "TBI_002", 900, n_artefacts=20, n_blocks=3, seed=1)
+    arrays = [SingleFileExtractor(os.path.join(folder, name), "icp").get_segments_array()
+              for name in ("TBI_001.hdf5", "TBI_002.hdf5")]
+    folder_array = FolderExtractor(folder, "icp").get_segments_array()
+
+    assert folder_array.data.shape[1] == max(array.data.shape[1] for array in arrays)
+    assert len({array.data.shape[1] for array in arrays}) == 2
+    for array in arrays:
+        rows = folder_array.patient_ids == array.patient_ids[0]
+        np.testing.assert_array_equal(folder_array.lengths[rows], array.lengths)
+        np.testing.assert_array_equal(folder_array.data[rows, :array.data.shape[1]], array.data)
+        assert np.isnan(folder_array.data[rows, array.data.shape[1]:]).all()
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_extraction_error_names_the_failing_file(recording, workers):
+    folder = os.path.dirname(recording)
+    with open(os.path.join(folder, "TBI_000.hdf5"), "wb") as file:
+        file.write(b"not an HDF5 file")
+    shutil.copy(recording[:-len(".hdf5")] + ".artf", os.path.join(folder, "TBI_000.artf"))
+
+    with pytest.raises(ExtractionError, match="TBI_000.hdf5") as error:
+        FolderExtractor(folder, "icp", workers=workers).extract_all()
+    assert error.value.__cause__ is not None
+
+
+def test_workers_keep_the_folder_order(recording):
+    folder = os.path.dirname(recording)
+    write_pair(folder, "TBI_002", 900, n_artefacts=20, n_blocks=3, seed=1)
+    serial = FolderExtractor(folder, "abp").extract_all()
+    parallel = FolderExtractor(folder, "abp", workers=2).extract_all()
+
+    for actual, expected in zip(parallel, serial):
+        assert_same_segments(actual, expected)
+
+
+def test_iter_segments_matches_extract_all(recording):
+    folder = os.path.dirname(recording)
+    write_pair(folder, "TBI_002", 900, n_artefacts=20, n_blocks=3, seed=1)
+    extractor = FolderExtractor(folder, "icp")
+    anomalies, normal = extractor.extract_all()
+
+    pairs = list(extractor.iter_segments())
+    assert_same_segments([segment for segment, label in pairs if label == 1], anomalies)
+    assert_same_segments([segment for segment, label in pairs if label == 0], normal)
+
+    per_file = list(extractor.iter_segments(per_file=True))
+    assert sorted(os.path.basename(path) for path, _, _ in per_file) == ["TBI_001.hdf5", "TBI_002.hdf5"]
+    assert_same_segments([segment for _, file_anomalies, _ in per_file for segment in file_anomalies], anomalies)
+    assert_same_segments([segment for _, _, file_normal in per_file for segment in file_normal], normal)
+
+
+def test_iter_segments_rejects_mixed_frequencies(recording):
+    folder = os.path.dirname(recording)
+    write_pair(folder, "TBI_002", 900, n_artefacts=20, frequency=250.0, seed=1)
+
+    with pytest.raises(FrequencyMismatchError):
+        list(FolderExtractor(folder, "icp").iter_segments())
+
+
+@pytest.mark.parametrize("batch_size", [1, 7, 1024])
+def test_hdf5_export_matches_segments(recording, tmp_path, batch_size):
+    extractor = SingleFileExtractor(recording, "icp")
+    output_path = tmp_path / "export.hdf5"
+    with Recorder() as recorder:
+        extractor._export_hdf5(output_path, batch_size=batch_size)
+    # every index block is read once, however the batches split the rows
+    assert recorder.stats()["counters"]["h5py_reads"] == 6
+
+    expected = SingleFileExtractor(recording, "icp")
+    with h5py.File(output_path, "r") as hdf:
+        columns = {name: hdf[name][:] for name in hdf}
+        assert hdf.attrs["file"] == recording
+    assert np.all(np.diff(columns["start_time"]) >= 0)
+    for label, segments in ((1, expected.get_anomalies()), (0, expected.get_normal())):
+        rows = np.flatnonzero(columns["label"] == label)
+        segments = sorted((segment for segment in segments if not segment.empty), key=lambda segment: segment.start_time)
+        rows = rows[np.argsort(columns["start_time"][rows], kind="stable")]
+        assert columns["start_time"][rows].tolist() == [segment.start_time for segment in segments]
+        assert columns["end_time"][rows].tolist() == [segment.end_time for segment in segments]
+        for row, segment in zip(rows, segments):
+            offset, length = columns["offsets"][row], columns["lengths"][row]
+            np.testing.assert_array_equal(columns["data"][offset:offset + length], segment.data)
+
+
+def linspace_windows(gap_starts, gap_ends):
+    """The normal windows of the original extractor, which split every gap with np.linspace."""
+    starts, ends = [], []
+    for gap_start, gap_end in zip(gap_starts, gap_ends):
+        if gap_start:
+            arr = np.linspace(gap_start, gap_end, int((gap_end - gap_start) / 10_000_000) + 1)
+            starts.extend(arr[:-1])
+            ends.extend(arr[1:])
+    return np.array(starts), np.array(ends)
+
+
+def test_split_gaps_matches_linspace():
+    rng = np.random.default_rng(0)
+    lengths = np.concatenate([rng.integers(0, 200_000_000, 1000), rng.integers(0, 20, 1000) * 10_000_000,
+                              [9_999_999, 10_000_000, 10_000_001, 25_000_000]])
+    # the gap before the first artefact starts at 0 and is skipped
+    gap_starts = np.append(1_609_459_200_000_000 + rng.integers(0, 10**12, len(lengths) - 1), 0)
+    gap_ends = gap_starts + lengths
+
+    starts, ends = SingleFileExtractor._split_gaps(gap_starts, gap_ends)
+    expected_starts, expected_ends = linspace_windows(gap_starts.tolist(), gap_ends.tolist())
+    assert starts.dtype == np.int64 and len(starts) == len(expected_starts)
+    assert np.abs(starts - expected_starts).max() <= 1 and np.abs(ends - expected_ends).max() <= 1
+
+
+def test_split_gaps_skips_negative_gaps():
+    starts, ends = SingleFileExtractor._split_gaps(np.array([50_000_000], dtype=np.int64), np.array([10_000_000], dtype=np.int64))
+    assert starts.size == 0 and ends.size == 0
+
+
+def test_segment_table_matches_segments(recording):
+    extractor = SingleFileExtractor(recording, "abp")
+    table = extractor.get_segment_table()
+    segments = extractor.get_anomalies() + extractor.get_normal()
+
+    assert len(table) == len(segments)
+    assert table.label.tolist() == [1] * len(extractor.get_anomalies()) + [0] * len(extractor.get_normal())
+    assert_same_segments(table.to_segments(), segments)
+    assert set(table.file.tolist()) == {recording}
+    assert set(table.patient_id.tolist()) == {segments[0].patient_id}
+
+
+def test_folder_tables_match_segments(recording):
+    folder = os.path.dirname(recording)
+    write_pair(folder, "TBI_002", 900, n_artefacts=20, n_blocks=3, seed=1)
+    extractor = FolderExtractor(folder, "icp")
+    anomalies, normal = extractor.extract_all()
+
+    anomaly_table, normal_table = extractor.extract_all(as_table=True)
+    assert_same_segments(anomaly_table.to_segments(), anomalies)
+    assert_same_segments(normal_table.to_segments(), normal)
+    assert sorted(anomaly_table.group_by_patient()) == ["001", "002"]
+
+
+@pytest.mark.parametrize("mode", ["abp", "icp"])
+@pytest.mark.parametrize("matching", [False, True])
+def test_metadata_counts_match_extraction(recording, mode, matching):
+    metadata = SingleFileExtractor(recording, mode, matching=matching).get_metadata()
+    extractor = SingleFileExtractor(recording, mode, matching=matching)
+
+    assert metadata.n_anomalies == len(extractor.get_anomalies())
+    assert metadata.n_normal == len(extractor.get_normal())
+    assert (metadata.n_blocks, metadata.n_samples, metadata.frequency) == (6, 1800 * 125, 125)
+    assert metadata.duration_sec == 1800
+    assert 0 < metadata.good_quality_fraction < 1
+
+
+@pytest.mark.parametrize("matching", [False, True])
+def test_metadata_counts_match_extraction_of_overlapping_blocks(overlapping_recording, matching):
+    metadata = SingleFileExtractor(overlapping_recording, "icp", matching=matching).get_metadata()
+    extractor = SingleFileExtractor(overlapping_recording, "icp", matching=matching)
+
+    assert metadata.n_anomalies == len(extractor.get_anomalies())
+    assert metadata.n_normal == len(extractor.get_normal())